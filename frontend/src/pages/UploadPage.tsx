@@ -178,6 +178,9 @@ const UploadPage: React.FC = () => {
           body: formData,
         })
 
+        if (response.status === 503) {
+          throw new Error('服务繁忙，请稍后重试')
+        }
         if (!response.ok) {
           throw new Error(`请求失败: ${response.statusText}`)
         }
@@ -190,6 +193,8 @@ const UploadPage: React.FC = () => {
         const decoder = new TextDecoder()
         let buffer = ''
         let htmlContent = ''
+        let previewHtml = '' // 生成过程中逐块到达的 HTML 预览
+        let resultUrl = '' // 服务端保存结果后返回的下载路径
         let chunks = 0
         let eventCount = 0
         let lastProgressUpdate = Date.now()
@@ -227,6 +232,13 @@ const UploadPage: React.FC = () => {
                     mainMessage = 'AI 正在分析文档...'
                     subMessage = '初始化排版引擎'
                     break
+                  case 'queued':
+                    // 服务繁忙时排队等待，显示排队位置和预计等待时间
+                    progress = 5
+                    stage = 'queued'
+                    mainMessage = `排队中，前面还有 ${Math.max((data.position || 1) - 1, 0)} 个任务`
+                    subMessage = data.eta ? `预计等待约 ${Math.ceil(data.eta)} 秒` : '请稍候'
+                    break
                   case 'llm_receiving':
                     // LLM 分析中，根据 chunks 估算进度 10-60%
                     chunks = data.chunks || chunks
@@ -252,6 +264,14 @@ const UploadPage: React.FC = () => {
                     }
                     lastProgressUpdate = Date.now()
                     break
+                  case 'html_delta':
+                    // 已完成的块级元素，逐块拼接为预览
+                    previewHtml += data.html || ''
+                    progress = Math.min(10 + Math.min(chunks, 50), 60)
+                    stage = 'llm_analyzing'
+                    mainMessage = 'AI 正在排版中...'
+                    subMessage = `已生成 ${(data.index ?? 0) + 1} 个段落`
+                    break
                   case 'llm_done':
                     progress = 70
                     stage = 'llm_complete'
@@ -280,6 +300,7 @@ const UploadPage: React.FC = () => {
                 // 保存 HTML 内容
                 if (data.type === 'complete' && data.html) {
                   htmlContent = data.html
+                  resultUrl = data.download_url || ''
                   console.log('[SSE] Complete event with html content')
                 }
 
@@ -295,7 +316,7 @@ const UploadPage: React.FC = () => {
                           subMessage: subMessage,
                           stage: stage,
                           elapsedTime: currentElapsedTime,
-                          htmlContent: htmlContent || pf.htmlContent,
+                          htmlContent: htmlContent || previewHtml || pf.htmlContent,
                         }
                       : pf
                   )
@@ -333,23 +354,32 @@ const UploadPage: React.FC = () => {
           )
         )
 
-        const downloadFormData = new FormData()
-        downloadFormData.append('html', htmlContent)
-        downloadFormData.append('filename', uploadedFile.name.replace(/\.docx?$/i, '_排版后.doc'))
+        const wordFilename = uploadedFile.name.replace(/\.docx?$/i, '_排版后.doc')
+        let downloadUrl: string
 
-        const downloadResponse = await fetch(`${API_BASE_URL}/download/word`, {
-          method: 'POST',
-          body: downloadFormData,
-        })
+        if (resultUrl) {
+          // 结果已保存在服务端，直接使用下载链接，无需再上传 HTML
+          downloadUrl = `${API_BASE_URL}${resultUrl}?filename=${encodeURIComponent(wordFilename)}`
+        } else {
+          const downloadFormData = new FormData()
+          downloadFormData.append('html', htmlContent)
+          downloadFormData.append('filename', wordFilename)
 
-        if (!downloadResponse.ok) {
-          throw new Error('生成 Word 文档失败')
+          const downloadResponse = await fetch(`${API_BASE_URL}/download/word`, {
+            method: 'POST',
+            body: downloadFormData,
+          })
+
+          if (!downloadResponse.ok) {
+            throw new Error('生成 Word 文档失败')
+          }
+
+          const wordBlob = await downloadResponse.blob()
+          downloadUrl = URL.createObjectURL(wordBlob)
         }
 
         // 阶段5: 完成
         const totalElapsedTime = Math.floor((Date.now() - fileStartTime) / 1000)
-        const wordBlob = await downloadResponse.blob()
-        const downloadUrl = URL.createObjectURL(wordBlob)
 
         // 更新为完成
         setProcessingFiles((prev) =>
@@ -711,6 +741,14 @@ const UploadPage: React.FC = () => {
                           </p>
                         )}
                         
+                        {/* Progressive Preview */}
+                        {file.status === 'processing' && file.htmlContent && (
+                          <div
+                            className="mt-2 max-h-48 overflow-y-auto rounded-lg border border-slate-200 dark:border-slate-700 bg-white p-3 text-xs text-slate-800"
+                            dangerouslySetInnerHTML={{ __html: file.htmlContent }}
+                          />
+                        )}
+
                         {/* Elapsed Time & Stage */}
                         {file.status === 'processing' && file.elapsedTime !== undefined && (
                           <div className="flex items-center gap-2 text-xs text-slate-400">
@@ -4,32 +4,52 @@ Modified to use word-to-html-tool workflow: Word -> HTML with inline styles
 """
 import os
 import sys
-import json
+import asyncio
 import logging
-from typing import Optional
+import tempfile
+from typing import AsyncGenerator, BinaryIO, Callable, Dict, List, Optional, Set, Tuple, Union
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from urllib.parse import quote
+
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 
 from pathlib import Path
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from config.settings import get_app_config
+from config.settings import get_app_config, get_batch_config, get_normalize_config, get_upload_config
 from models.schemas import (
     FormatRequest,
     FormatResponse,
     HealthResponse,
 )
+from core.events import Event
 from core.llm_service import get_llm_service
-from core.html_service import HTMLService, prepare_for_word_download
+from core.cache_service import get_result_cache
+from core.result_store import get_result_store
+from core.singleflight import get_single_flight
+from core.metrics import get_metrics
+from core.scheduler import QueueFullError, Ticket, get_job_scheduler
+from core.job_store import DONE, FAILED, FINISHED, PENDING, JobEventWriter, get_job_store
+from core.incremental_service import get_incremental_formatter
+from core.segment_service import get_segmented_formatter
+from core.fast_path import RuleFormatter, get_rule_formatter
+from core.html_service import process_html, prepare_for_word_download
+from core.docx_service import export_docx, export_docx_zip
+from core.worker_pool import get_worker_pool
+from api.middleware import UploadLimitMiddleware
+from utils.text_utils import estimate_tokens, normalize_line, normalize_text
 from utils.file_utils import (
-    decode_file_content,
-    extract_text_from_docx,
-    cleanup_temp_file,
+    blocks_to_text,
+    decode_text,
+    detect_upload_kind,
+    expand_uploads,
+    extract_blocks_from_docx,
 )
 
 # Configure logging for cloud deployment - output to console
@@ -43,6 +63,26 @@ logger = logging.getLogger(__name__)
 # Version info
 __version__ = "2.0.0"
 
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+class TicketStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that frees an unclaimed scheduler ticket however the response ends,
+    including a client that disconnects before the body generator ever starts
+    """
+
+    def __init__(self, content, ticket: Optional[Ticket] = None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.ticket is not None and not self.ticket.claimed:
+                self.ticket.release()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -50,6 +90,7 @@ async def lifespan(app: FastAPI):
     # Startup
     yield
     # No persistent directories needed - we return HTML directly
+    get_worker_pool().shutdown()
 
 
 def create_app(
@@ -69,6 +110,15 @@ def create_app(
         debug=debug
     )
 
+    # Reject oversized uploads before the multipart body is spooled (added first so CORS wraps the 413)
+    upload_limits = {
+        "/format/stream": get_upload_config().max_bytes,
+        "/format/file": get_upload_config().max_bytes,
+        "/jobs": get_upload_config().max_bytes,
+        "/format/batch": get_batch_config().max_bytes,
+    }
+    app.add_middleware(UploadLimitMiddleware, limit_for=upload_limits.get)
+
     # Configure CORS
     app.add_middleware(
         CORSMiddleware,
@@ -78,8 +128,527 @@ def create_app(
         allow_headers=["*"],
     )
 
-    # HTML service instance
-    html_service = HTMLService()
+    # CPU-bound stages (DOCX parsing, decoding, HTML post-processing) run off the event loop
+    worker_pool = get_worker_pool()
+
+    def select_analyzer(text: str, rules: str, incremental: bool = False, hints: Optional[list] = None):
+        """
+        Pick the formatting pipeline: compiled rules without the LLM, incremental,
+        parallel segments for long input, or a single LLM call
+        """
+        rule_formatter = get_rule_formatter()
+        if rule_formatter.can_handle(rules):
+            return rule_formatter.with_hints(hints)
+        if incremental:
+            return get_incremental_formatter()
+        segmented_formatter = get_segmented_formatter()
+        if segmented_formatter.should_segment(text):
+            return segmented_formatter
+        return get_llm_service()
+
+    def client_id(request: Request) -> str:
+        """Fairness key for the scheduler: X-Client-Id header, else the peer address"""
+        client = request.headers.get("x-client-id")
+        if client:
+            return client
+        return request.client.host if request.client else "anonymous"
+
+    def admit(analyzer, text: str, client: str) -> Optional[Ticket]:
+        """
+        Reserve a scheduler place for jobs that call the LLM (the rule fast path does not).
+
+        Raises:
+            QueueFullError: when the waiting queue is full
+        """
+        if isinstance(analyzer, RuleFormatter):
+            return None
+        return get_job_scheduler().submit(client, estimate_tokens(text))
+
+    def busy_error(e: QueueFullError) -> HTTPException:
+        """503 with Retry-After for requests rejected by admission control"""
+        return HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(e.retry_after)))}
+        )
+
+    def store_result(html: str) -> Optional[str]:
+        """Keep a finished document in the result store and return its download URL"""
+        try:
+            return f"/download/{get_result_store().put(html)}"
+        except ValueError as e:
+            logger.warning(f"保存下载结果失败: {e}")
+            return None
+
+    def attachment_headers(filename: str) -> dict:
+        """Content-Disposition for a download, with RFC 5987 encoding for non-ASCII names"""
+        return {"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"}
+
+    async def docx_response(html: str, filename: str) -> FileResponse:
+        """Export HTML to a .docx on the worker pool and send it, removing the file afterwards"""
+        fd, path = tempfile.mkstemp(suffix=".docx")
+        os.close(fd)
+        try:
+            await worker_pool.run("export", export_docx, html, path)
+        except Exception:
+            os.remove(path)
+            raise
+        return FileResponse(
+            path=path,
+            filename=filename,
+            media_type=DOCX_MEDIA_TYPE,
+            background=BackgroundTask(os.remove, path)
+        )
+
+    async def read_upload(file: UploadFile) -> Tuple[str, Optional[list], dict]:
+        """
+        Extract text from an uploaded file, plus the DOCX heading/list hints for Word documents
+        and, for text files, the detected encoding and its confidence.
+        Only the size limit (UploadLimitMiddleware) applies before the body is buffered; the type
+        is checked from the first chunk once Starlette has spooled the part to a temporary file.
+        Word documents are then parsed straight from the spooled upload instead of being read
+        into memory.
+
+        Raises:
+            ValueError: when the file is too large, of an unsupported type, or cannot be read
+        """
+        upload_config = get_upload_config()
+        filename = file.filename or "unknown.txt"
+        if file.size is not None and file.size > upload_config.max_bytes:
+            raise ValueError(f"文件过大（上限 {round(upload_config.max_bytes / (1024 * 1024), 1):g}MB）: {filename}")
+
+        return await extract_text(filename, file.file)
+
+    async def extract_text(filename: str, source: Union[bytes, BinaryIO]) -> Tuple[str, Optional[list], dict]:
+        """read_upload for content already in memory or a seekable file (read only as far as needed)"""
+        sniff_bytes = get_upload_config().sniff_bytes
+        if isinstance(source, bytes):
+            head = source[:sniff_bytes]
+        else:
+            await asyncio.to_thread(source.seek, 0)
+            head = await asyncio.to_thread(source.read, sniff_bytes)
+            await asyncio.to_thread(source.seek, 0)
+            # 文本解码和进程池都需要完整内容；Word文档在线程中直接从文件解析
+            if detect_upload_kind(filename, head) != "docx" or worker_pool.uses_processes:
+                source = await asyncio.to_thread(source.read)
+
+        if detect_upload_kind(filename, head) == "docx":
+            try:
+                hints = await worker_pool.run("extract", extract_blocks_from_docx, source)
+            except ValueError as e:
+                raise ValueError(f"读取Word文档失败: {str(e)}")
+            except Exception as e:
+                raise ValueError(f"读取Word文档时发生错误: {str(e)}")
+            return blocks_to_text(hints), hints, {}
+
+        text, encoding, confidence = await worker_pool.run("decode", decode_text, source)
+        return text, None, {"encoding": encoding, "encoding_confidence": confidence}
+
+    async def normalize_input(text: str, hints: Optional[list] = None) -> Tuple[str, Optional[list], dict]:
+        """
+        Token-saving cleanup between extraction and the pipeline (before the cache key is taken).
+        Returns the normalized text and hints, plus stats with the tokens saved.
+        """
+        config = get_normalize_config()
+        if not config.enabled or not text:
+            return text, hints, {}
+
+        # DOCX正文不含页眉页脚，重复的行都是正文内容，只做无损清理
+        dedupe_min_repeats = 0 if hints is not None else config.dedupe_min_repeats
+        normalized, stats = await worker_pool.run(
+            "normalize", normalize_text, text, dedupe_min_repeats, config.dedupe_min_chars
+        )
+        if hints:
+            # 快速路径按文本匹配提示，保持与正文相同的规范化
+            hints = [dict(hint, text=normalize_line(hint["text"])) for hint in hints]
+        get_metrics().incr("input_tokens_saved", stats["tokens_saved"])
+        return normalized, hints, stats
+
+    async def wait_for_disconnect(request: Request) -> None:
+        """Return once the client has closed the connection"""
+        while True:
+            message = await request.receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    async def until_disconnected(
+        request: Request,
+        events: AsyncGenerator[Event, None]
+    ) -> AsyncGenerator[Event, None]:
+        """
+        Iterate events until the client disconnects, then close the source right away
+        so the cancellation reaches the LLM call instead of waiting for the next send.
+        """
+        disconnected = asyncio.ensure_future(wait_for_disconnect(request))
+        next_event = None
+        try:
+            while True:
+                next_event = asyncio.ensure_future(events.__anext__())
+                await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not next_event.done():
+                    get_metrics().incr("stream_disconnects")
+                    logger.info("客户端已断开连接，取消排版")
+                    return
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    return
+                yield event
+        except asyncio.CancelledError:
+            # 服务器检测到断开时直接取消响应任务
+            get_metrics().incr("stream_disconnects")
+            raise
+        finally:
+            disconnected.cancel()
+            if next_event is not None and not next_event.done():
+                next_event.cancel()
+                await asyncio.wait({next_event})
+            await events.aclose()
+
+    async def run_pipeline(
+        text: str,
+        rules: str,
+        cache_key: str,
+        analyzer,
+        client: str,
+        ticket: Optional[Ticket] = None
+    ) -> AsyncGenerator[Event, None]:
+        """Streaming analysis and post-processing, ending with the final complete event"""
+        html_content = None
+        try:
+            if ticket is None:
+                ticket = admit(analyzer, text, client)
+            if ticket is not None:
+                ticket.claimed = True
+                async for position, eta in ticket.wait():
+                    yield Event("queued", f"排队中，前面还有 {position - 1} 个任务", position=position, eta=eta)
+
+            # LLM analysis; the analyzer's own complete event carries the raw HTML and
+            # is consumed here - only the post-processed document goes on the wire
+            async for event in analyzer.analyze(text, rules):
+                if event.type == "complete":
+                    html_content = event.html
+                    break
+                yield event
+                if event.type == "error":
+                    return
+
+            # Post-processing does not use the provider; let the next job start
+            if ticket is not None:
+                ticket.release()
+
+            if not html_content:
+                yield Event("error", "未能获取LLM生成的HTML内容")
+                return
+
+            # Post-process HTML (word-to-html-tool style)
+            yield Event("parsing", "正在解析排版结果...")
+
+            processed_html, is_valid, errors = await worker_pool.run("html", process_html, html_content)
+            await get_result_cache().aset(cache_key, {"html": processed_html, "valid": is_valid, "errors": errors})
+
+            yield Event(
+                "complete",
+                "生成成功",
+                html=processed_html,
+                valid=is_valid,
+                errors=errors,
+                download_url=store_result(processed_html)
+            )
+
+        except Exception as e:
+            logger.exception("Formatting failed")
+            yield Event("error", str(e))
+        finally:
+            if ticket is not None:
+                ticket.release()
+
+    async def format_with_llm(
+        text: str,
+        rules: str,
+        incremental: bool = False,
+        hints: Optional[list] = None,
+        client: str = "anonymous"
+    ) -> dict:
+        """Run non-streaming LLM formatting and post-processing, served from the result cache when possible"""
+        text, hints, normalization = await normalize_input(text, hints)
+        llm_service = get_llm_service()
+        result_cache = get_result_cache()
+        cache_key = llm_service.cache_key(text, rules, stream=False)
+
+        cached = await result_cache.aget(cache_key)
+        if cached is not None:
+            return {
+                "success": True,
+                "message": "生成成功",
+                "cached": True,
+                "download_url": store_result(cached["html"]),
+                **normalization,
+                **cached
+            }
+
+        async def run() -> dict:
+            analyzer = select_analyzer(text, rules, incremental, hints)
+            ticket = admit(analyzer, text, client)
+            try:
+                if ticket is not None:
+                    await ticket.acquire()
+                result = await analyzer.analyze_async(text, rules)
+            finally:
+                if ticket is not None:
+                    ticket.release()
+            if not result.get("success"):
+                raise ValueError(result.get("error", "LLM调用失败"))
+
+            # Post-process HTML
+            processed_html, is_valid, errors = await worker_pool.run("html", process_html, result["html"])
+            formatted = {"html": processed_html, "valid": is_valid, "errors": errors}
+            await result_cache.aset(cache_key, formatted)
+            # 增量/分段排版的复用统计只随本次响应返回，不写入缓存
+            return {**formatted, **{key: result[key] for key in ("blocks", "reused", "segments") if key in result}}
+
+        # Identical in-flight requests share one generation
+        formatted = await get_single_flight().do(cache_key, run)
+
+        return {
+            "success": True,
+            "message": "生成成功",
+            "cached": False,
+            "download_url": store_result(formatted["html"]),
+            **normalization,
+            **formatted
+        }
+
+    async def admit_waiting(analyzer, text: str, client: str) -> Optional[Ticket]:
+        """admit() for batch documents: wait for room in the queue instead of failing"""
+        while True:
+            try:
+                return admit(analyzer, text, client)
+            except QueueFullError as e:
+                await asyncio.sleep(min(max(e.retry_after, 1.0), 10.0))
+
+    def docx_name(name: str, taken: Set[str]) -> str:
+        """Archive name for a formatted document: same path with a .docx extension, made unique"""
+        stem = name.rsplit('.', 1)[0] if '.' in os.path.basename(name) else name
+        candidate = f"{stem}.docx"
+        counter = 2
+        while candidate in taken:
+            candidate = f"{stem} ({counter}).docx"
+            counter += 1
+        taken.add(candidate)
+        return candidate
+
+    async def run_batch(
+        documents: List[Tuple[str, Callable[[], Union[bytes, BinaryIO]]]],
+        rules: str,
+        incremental: bool,
+        client: str
+    ) -> AsyncGenerator[Event, None]:
+        """
+        Format many documents under one rule set: extract them in parallel, format each distinct
+        text once (concurrently, up to max_concurrency), report per-file progress, and finish
+        with a zip of .docx files.
+        """
+        names = [name for name, _ in documents]
+        yield Event("start", f"开始批量排版，共 {len(documents)} 个文件...", files=names)
+
+        files: List[dict] = [{"index": index, "name": name, "status": "pending"} for index, name in enumerate(names)]
+        # 文档在提取时才加载，同时加载的数量受并发上限约束
+        extract_slots = asyncio.Semaphore(max(1, get_batch_config().max_concurrency))
+
+        async def extract(name: str, load: Callable[[], Union[bytes, BinaryIO]]) -> Tuple[str, Optional[list], dict]:
+            async with extract_slots:
+                return await extract_text(name, await asyncio.to_thread(load))
+
+        extracted = await asyncio.gather(
+            *[extract(name, load) for name, load in documents],
+            return_exceptions=True
+        )
+
+        # Identical content is formatted once; every copy gets the same result
+        groups: Dict[str, List[int]] = {}
+        inputs: Dict[str, Tuple[str, Optional[list]]] = {}
+        for index, result in enumerate(extracted):
+            if isinstance(result, Exception):
+                error = str(result)
+            elif not result[0].strip():
+                error = "文件内容为空"
+            else:
+                text, hints, normalization = await normalize_input(result[0], result[1])
+                files[index].update(result[2], **normalization)
+                cache_key = get_llm_service().cache_key(text, rules, stream=True)
+                groups.setdefault(cache_key, []).append(index)
+                inputs.setdefault(cache_key, (text, hints))
+                continue
+            files[index].update(status="failed", error=error)
+            yield Event("file_error", error, index=index, name=names[index])
+
+        duplicates = sum(len(indexes) - 1 for indexes in groups.values())
+        if groups:
+            yield Event(
+                "batch_plan",
+                f"共 {len(groups)} 个不同文档需要排版，{duplicates} 个重复文件将复用结果",
+                unique=len(groups),
+                duplicates=duplicates
+            )
+
+        updates: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(max(1, get_batch_config().max_concurrency))
+
+        async def format_group(cache_key: str, indexes: List[int]) -> None:
+            text, hints = inputs[cache_key]
+            try:
+                async with semaphore:
+                    cached = await get_result_cache().aget(cache_key)
+                    if cached is not None:
+                        updates.put_nowait((cache_key, dict(cached, cached=True)))
+                        return
+
+                    analyzer = select_analyzer(text, rules, incremental, hints)
+                    ticket = await admit_waiting(analyzer, text, client)
+                    last_stage = None
+                    try:
+                        events = get_single_flight().stream(
+                            cache_key,
+                            lambda: run_pipeline(text, rules, cache_key, analyzer, client, ticket)
+                        )
+                        async for event in events:
+                            if ticket is not None and not ticket.claimed:
+                                ticket.release()
+                            if event.type == "complete":
+                                updates.put_nowait((cache_key, event.data))
+                                return
+                            if event.type == "error":
+                                updates.put_nowait((cache_key, event.message))
+                                return
+                            # 只转发阶段变化（以及排队位置），不转发逐块预览
+                            if event.type != "html_delta" and (event.type != last_stage or event.type == "queued"):
+                                last_stage = event.type
+                                updates.put_nowait((cache_key, Event(
+                                    "file_progress", event.message, indexes=indexes, stage=event.type
+                                )))
+                    finally:
+                        if ticket is not None and not ticket.claimed:
+                            ticket.release()
+                updates.put_nowait((cache_key, "未能获取排版结果"))
+            except Exception as e:
+                logger.exception("Batch document failed")
+                updates.put_nowait((cache_key, str(e)))
+
+        tasks = [asyncio.ensure_future(format_group(key, indexes)) for key, indexes in groups.items()]
+        results: Dict[int, str] = {}
+        try:
+            remaining = len(tasks)
+            while remaining:
+                cache_key, update = await updates.get()
+                if isinstance(update, Event):
+                    yield update
+                    continue
+
+                remaining -= 1
+                for index in groups[cache_key]:
+                    if isinstance(update, str):
+                        files[index].update(status="failed", error=update)
+                        yield Event("file_error", update, index=index, name=names[index])
+                    else:
+                        results[index] = update["html"]
+                        files[index].update(status="done", valid=update.get("valid"))
+                        yield Event(
+                            "file_complete",
+                            f"{names[index]} 排版完成",
+                            index=index,
+                            name=names[index],
+                            valid=update.get("valid"),
+                            errors=update.get("errors"),
+                            cached=bool(update.get("cached"))
+                        )
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        succeeded = len(results)
+        if not succeeded:
+            yield Event("error", "所有文件排版失败", files=files)
+            return
+
+        yield Event("parsing", "正在打包Word文档...")
+        taken: Set[str] = set()
+        entries = [(docx_name(names[index], taken), results[index]) for index in sorted(results)]
+        try:
+            archive = await worker_pool.run("export", export_docx_zip, entries)
+            download_url = f"/download/batch/{get_result_store().put_bytes(archive)}"
+        except Exception as e:
+            logger.exception("Batch export failed")
+            yield Event("error", f"打包失败: {e}", files=files)
+            return
+
+        yield Event(
+            "complete",
+            f"批量排版完成：成功 {succeeded} 个，失败 {len(files) - succeeded} 个",
+            files=files,
+            succeeded=succeeded,
+            failed=len(files) - succeeded,
+            download_url=download_url
+        )
+
+    # Background jobs; references keep the tasks alive until they finish
+    background_jobs: Set[asyncio.Task] = set()
+
+    async def run_job(
+        job_id: str,
+        text: str,
+        rules: str,
+        cache_key: str,
+        cached: Optional[dict],
+        analyzer,
+        client: str,
+        ticket: Optional[Ticket]
+    ) -> None:
+        """
+        Run the formatting pipeline for a background job, persisting its events for replay.
+        Writes happen off the event loop; repeated llm_receiving progress ticks are not stored.
+        """
+        job_store = get_job_store()
+        writer = JobEventWriter(job_store, job_id)
+        heartbeat = asyncio.ensure_future(job_store.heartbeat(job_id))
+        final = None
+        try:
+            writer.add(Event("start", "开始处理..."))
+            if cached is not None:
+                final = Event("complete", "生成成功", cached=True, download_url=store_result(cached["html"]), **cached)
+                writer.add(final)
+            else:
+                # Shares the generation with identical /format/stream requests, but is not
+                # tied to any connection: the job keeps running when clients disconnect
+                events = get_single_flight().stream(
+                    cache_key,
+                    lambda: run_pipeline(text, rules, cache_key, analyzer, client, ticket)
+                )
+                last_type = None
+                async for event in events:
+                    if ticket is not None and not ticket.claimed:
+                        ticket.release()
+                    if event.type in ("complete", "error"):
+                        final = event
+                    elif event.type == "llm_receiving" and last_type == "llm_receiving":
+                        continue
+                    last_type = event.type
+                    writer.add(event)
+        except Exception as e:
+            logger.exception("Job failed")
+            final = Event("error", str(e))
+            writer.add(final)
+        finally:
+            heartbeat.cancel()
+            if ticket is not None and not ticket.claimed:
+                ticket.release()
+
+        await writer.close()
+        if final is not None and final.type == "complete":
+            await asyncio.to_thread(job_store.finish, job_id, DONE, final.data)
+        else:
+            error = final.message if final is not None else "未能获取排版结果"
+            await asyncio.to_thread(job_store.finish, job_id, FAILED, None, error)
 
     # Root endpoint - API info
     @app.get("/")
@@ -91,10 +660,15 @@ def create_app(
             "description": "Convert Word documents to formatted HTML using LLM",
             "endpoints": {
                 "health": "/health",
+                "metrics": "/metrics",
                 "format_stream": "/format/stream",
                 "format_text": "/format/text",
                 "format_file": "/format/file",
-                "download_word": "/download/word"
+                "format_batch": "/format/batch",
+                "jobs": "/jobs",
+                "download_word": "/download/word",
+                "download_docx": "/download/docx",
+                "download_result": "/download/{result_id}"
             }
         }
 
@@ -113,101 +687,92 @@ def create_app(
 
 
 
+    def error_stream(message: str) -> StreamingResponse:
+        """SSE response carrying a single error event"""
+        return StreamingResponse(iter([Event("error", message).to_sse()]), media_type="text/event-stream")
+
+    # In-process counters (cancellations, coalesced requests, disconnects)
+    @app.get("/metrics", tags=["Health"])
+    async def metrics():
+        """Return in-process counters"""
+        return {"counters": get_metrics().snapshot()}
+
     # Main formatting endpoint with streaming - returns HTML
     @app.post("/format/stream", tags=["Formatting"])
     async def format_text_stream(
+        request: Request,
         file: Optional[UploadFile] = File(None),
         text: str = Form(""),
-        rules: str = Form("默认：标题黑体二号居中，正文宋体小四首行缩进")
+        rules: str = Form("默认：标题黑体二号居中，正文宋体小四首行缩进"),
+        incremental: bool = Form(False)
     ):
         """
         Format text with streaming response (SSE).
         Returns processed HTML with inline styles.
         """
+        # Heading/list hints from the DOCX extractor, used by the rule fast path
+        hints = None
+        # Detected encoding of an uploaded text file, reported in the start event
+        decoding = {}
+
         # Handle file upload
         if file and file.filename:
-            content = await file.read()
-            filename = file.filename or "unknown.txt"
-            file_ext = filename.split('.')[-1].lower() if '.' in filename else 'txt'
-
-            if file_ext in ['docx', 'doc']:
-                import tempfile
-                with tempfile.NamedTemporaryFile(suffix=f'.{file_ext}', delete=False) as tmp:
-                    tmp.write(content)
-                    tmp_path = tmp.name
-                try:
-                    extracted_text = extract_text_from_docx(tmp_path)
-                    os.remove(tmp_path)
-                    text = extracted_text
-                except ValueError as e:
-                    os.remove(tmp_path)
-                    return StreamingResponse(
-                        iter([json.dumps({"type": "error", "message": f"读取Word文档失败: {str(e)}"})]),
-                        media_type="text/event-stream"
-                    )
-                except Exception as e:
-                    os.remove(tmp_path)
-                    return StreamingResponse(
-                        iter([json.dumps({"type": "error", "message": f"读取Word文档时发生错误: {str(e)}"})]),
-                        media_type="text/event-stream"
-                    )
-            else:
-                text = decode_file_content(content)
+            try:
+                text, hints, decoding = await read_upload(file)
+            except ValueError as e:
+                return error_stream(str(e))
 
+        text, hints, normalization = await normalize_input(text, hints)
         if not text or not text.strip():
-            return StreamingResponse(
-                iter([json.dumps({"type": "error", "message": "请输入文本或上传文件"})]),
-                media_type="text/event-stream"
-            )
-
-        async def generate_stream():
-            llm_service = get_llm_service()
+            return error_stream("请输入文本或上传文件")
 
-            yield json.dumps({"type": "start", "message": "开始处理..."}) + "\n\n"
+        cache_key = get_llm_service().cache_key(text, rules, stream=True)
+        cached = await get_result_cache().aget(cache_key)
+        analyzer = select_analyzer(text, rules, incremental, hints)
+        client = client_id(request)
 
-            html_content = None
+        # Admission control: reject right away when the queue is full
+        ticket = None
+        if cached is None and not get_single_flight().in_flight(cache_key):
+            try:
+                ticket = admit(analyzer, text, client)
+            except QueueFullError as e:
+                raise busy_error(e)
 
+        async def generate_stream():
             try:
-                # LLM analysis
-                async for event in llm_service.analyze(text, rules, stream=True):
-                    yield event
-                    # Extract HTML from complete event
-                    if '"type": "complete"' in event or '"type": "llm_done"' in event:
-                        try:
-                            event_str = event.strip()
-                            if event_str.startswith("data:"):
-                                event_str = event_str[5:].strip()
-                            data = json.loads(event_str)
-                            html_content = data.get("html") or html_content
-                            if html_content and '"type": "complete"' in event:
-                                break
-                        except (json.JSONDecodeError, IndexError) as e:
-                            logger.warning(f"解析SSE事件失败: {e}, event: {event[:100]}")
-                            continue
-
-                if not html_content:
-                    yield f"data: {json.dumps({'type': 'error', 'message': '未能获取LLM生成的HTML内容'}, ensure_ascii=False)}\n\n"
-                    return
+                yield Event("start", "开始处理...", **decoding, **normalization).to_sse()
 
-                # Post-process HTML (word-to-html-tool style)
-                yield f"data: {json.dumps({'type': 'parsing', 'message': '正在解析排版结果...'}, ensure_ascii=False)}\n\n"
-                
-                processed_html, is_valid, errors = html_service.process_html(html_content)
-                
-                yield f"data: {json.dumps({
-                    'type': 'complete',
-                    'message': '生成成功',
-                    'html': processed_html,
-                    'valid': is_valid,
-                    'errors': errors
-                }, ensure_ascii=False)}\n\n"
+                if cached is not None:
+                    yield Event(
+                        "complete",
+                        "生成成功",
+                        cached=True,
+                        download_url=store_result(cached["html"]),
+                        **cached
+                    ).to_sse()
+                    return
 
+                # Identical in-flight requests share one generation and receive the same events
+                events = get_single_flight().stream(
+                    cache_key,
+                    lambda: run_pipeline(text, rules, cache_key, analyzer, client, ticket)
+                )
+                async for event in until_disconnected(request, events):
+                    if ticket is not None and not ticket.claimed:
+                        # 相同的请求已在进行中，预留的排队位置用不上
+                        ticket.release()
+                    yield event.to_sse()
             except Exception as e:
                 logger.exception("Formatting failed")
-                yield f"data: {json.dumps({'type': 'error', 'message': str(e)}, ensure_ascii=False)}\n\n"
+                yield Event("error", str(e)).to_sse()
+            finally:
+                if ticket is not None and not ticket.claimed:
+                    ticket.release()
 
-        return StreamingResponse(
+        return TicketStreamingResponse(
             generate_stream(),
+            ticket=ticket,
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
@@ -218,32 +783,21 @@ def create_app(
 
     # Non-streaming formatting endpoint - returns HTML
     @app.post("/format/text", tags=["Formatting"])
-    async def format_text(request: FormatRequest):
+    async def format_text(request: FormatRequest, http_request: Request):
         """
         Format text (non-streaming).
         Returns processed HTML with inline styles.
         """
-        llm_service = get_llm_service()
-
         try:
-            # LLM analysis
-            result = llm_service.analyze_sync(request.text, request.rules)
-            if not result.get("success"):
-                raise ValueError(result.get("error", "LLM调用失败"))
-
-            html = result["html"]
-
-            # Post-process HTML
-            processed_html, is_valid, errors = html_service.process_html(html)
-
-            return {
-                "success": True,
-                "message": "生成成功",
-                "html": processed_html,
-                "valid": is_valid,
-                "errors": errors
-            }
+            return await format_with_llm(
+                request.text,
+                request.rules,
+                request.incremental,
+                client=client_id(http_request)
+            )
 
+        except QueueFullError as e:
+            raise busy_error(e)
         except Exception as e:
             logger.exception("Formatting failed")
             return {"success": False, "message": str(e)}
@@ -251,72 +805,253 @@ def create_app(
     # File upload formatting endpoint - returns HTML
     @app.post("/format/file", tags=["Formatting"])
     async def format_file(
+        http_request: Request,
         file: UploadFile = File(...),
-        rules: str = Form("默认：标题黑体二号居中，正文宋体小四首行缩进")
+        rules: str = Form("默认：标题黑体二号居中，正文宋体小四首行缩进"),
+        incremental: bool = Form(False)
     ):
         """
         Format uploaded file.
         Returns processed HTML with inline styles.
         """
-        import tempfile
-
         try:
-            content = await file.read()
-            file_size = len(content)
-
-            if file_size == 0:
-                return {"success": False, "message": f"文件内容为空: {file.filename}"}
-
             filename = file.filename or "unknown.txt"
-            file_ext = filename.split('.')[-1].lower() if '.' in filename else 'txt'
-            text = None
-
-            # Extract text from DOCX
-            if file_ext in ['docx', 'doc']:
-                with tempfile.NamedTemporaryFile(suffix=f'.{file_ext}', delete=False) as tmp:
-                    tmp.write(content)
-                    tmp_path = tmp.name
-                try:
-                    text = extract_text_from_docx(tmp_path)
-                except ValueError as e:
-                    cleanup_temp_file(tmp_path)
-                    return {"success": False, "message": f"读取Word文档失败: {str(e)}"}
-                except Exception as e:
-                    cleanup_temp_file(tmp_path)
-                    return {"success": False, "message": f"读取Word文档时发生错误: {str(e)}"}
-                finally:
-                    cleanup_temp_file(tmp_path)
-
-            # Fallback to text decoding
-            if text is None:
-                text = decode_file_content(content)
+            try:
+                text, hints, decoding = await read_upload(file)
+            except ValueError as e:
+                return {"success": False, "message": str(e)}
 
             if not text or text.strip() == '':
-                return {"success": False, "message": f"文件解码后内容为空: {filename}"}
+                return {"success": False, "message": f"文件解码后内容为空: {filename}", **decoding}
 
             # Process with LLM
-            llm_service = get_llm_service()
-            result = llm_service.analyze_sync(text, rules)
+            result = await format_with_llm(text, rules, incremental, hints, client_id(http_request))
+            return {**result, **decoding}
 
-            if not result.get("success"):
-                raise ValueError(result.get("error", "LLM调用失败"))
+        except QueueFullError as e:
+            raise busy_error(e)
+        except Exception as e:
+            logger.exception("File formatting failed")
+            return {"success": False, "message": str(e)}
 
-            html = result["html"]
+    # Batch formatting: many files (or zip archives) under one rule set
+    @app.post("/format/batch", tags=["Formatting"])
+    async def format_batch(
+        request: Request,
+        files: List[UploadFile] = File(...),
+        rules: str = Form("默认：标题黑体二号居中，正文宋体小四首行缩进"),
+        incremental: bool = Form(False)
+    ):
+        """
+        Format several documents with the same rules (SSE).
+        Streams per-file progress and ends with a complete event whose download_url is a zip of .docx files.
+        """
+        batch_config = get_batch_config()
+        # 直接使用已落盘的上传文件，不把整批内容读入内存
+        uploads = [(file.filename or f"file{index}.txt", file.file) for index, file in enumerate(files)]
+        try:
+            documents = await asyncio.to_thread(
+                expand_uploads, uploads, batch_config.max_files, batch_config.max_bytes
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not documents:
+            raise HTTPException(status_code=400, detail="没有可排版的文件")
 
-            # Post-process HTML
-            processed_html, is_valid, errors = html_service.process_html(html)
+        async def generate_stream():
+            try:
+                events = run_batch(documents, rules, incremental, client_id(request))
+                async for event in until_disconnected(request, events):
+                    yield event.to_sse()
+            except Exception as e:
+                logger.exception("Batch formatting failed")
+                yield Event("error", str(e)).to_sse()
 
-            return {
-                "success": True,
-                "message": "生成成功",
-                "html": processed_html,
-                "valid": is_valid,
-                "errors": errors
+        return StreamingResponse(
+            generate_stream(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no"
+            }
+        )
+
+    # Background formatting job: returns an id right away, survives dropped connections
+    @app.post("/jobs", status_code=202, tags=["Jobs"])
+    async def create_job(
+        request: Request,
+        file: Optional[UploadFile] = File(None),
+        text: str = Form(""),
+        rules: str = Form("默认：标题黑体二号居中，正文宋体小四首行缩进"),
+        incremental: bool = Form(False)
+    ):
+        """
+        Start formatting in the background.
+        Follow progress at events_url (SSE, resumable with Last-Event-ID) or poll status_url.
+        """
+        hints = None
+        decoding = {}
+        if file and file.filename:
+            try:
+                text, hints, decoding = await read_upload(file)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        text, hints, normalization = await normalize_input(text, hints)
+        if not text or not text.strip():
+            raise HTTPException(status_code=400, detail="请输入文本或上传文件")
+
+        cache_key = get_llm_service().cache_key(text, rules, stream=True)
+        cached = await get_result_cache().aget(cache_key)
+        analyzer = select_analyzer(text, rules, incremental, hints)
+        client = client_id(request)
+
+        ticket = None
+        if cached is None and not get_single_flight().in_flight(cache_key):
+            try:
+                ticket = admit(analyzer, text, client)
+            except QueueFullError as e:
+                raise busy_error(e)
+
+        try:
+            job_id = await asyncio.to_thread(get_job_store().create)
+        except BaseException:
+            if ticket is not None:
+                ticket.release()
+            raise
+
+        task = asyncio.create_task(run_job(job_id, text, rules, cache_key, cached, analyzer, client, ticket))
+        background_jobs.add(task)
+        task.add_done_callback(background_jobs.discard)
+        if ticket is not None:
+            # A task cancelled before it first runs (e.g. at shutdown) never reaches run_job's finally
+            task.add_done_callback(lambda _: None if ticket.claimed else ticket.release())
+
+        return {
+            "job_id": job_id,
+            "status": PENDING,
+            "status_url": f"/jobs/{job_id}",
+            "events_url": f"/jobs/{job_id}/events",
+            **decoding,
+            **normalization
+        }
+
+    # Poll a background job
+    @app.get("/jobs/{job_id}", tags=["Jobs"])
+    async def get_job(job_id: str):
+        """Job status; includes the result (html, download_url...) once done, or the error once failed"""
+        job = await asyncio.to_thread(get_job_store().get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="任务不存在或已过期")
+        return job
+
+    # Resumable event stream of a background job
+    @app.get("/jobs/{job_id}/events", tags=["Jobs"])
+    async def job_events(job_id: str, request: Request, last_event_id: int = 0):
+        """
+        Stream a job's events as SSE with ids. Reconnecting clients send Last-Event-ID
+        (or ?last_event_id=) and receive only the events they missed; the stream ends
+        after the job's final event.
+        """
+        job_store = get_job_store()
+        if await asyncio.to_thread(job_store.status, job_id) is None:
+            raise HTTPException(status_code=404, detail="任务不存在或已过期")
+
+        header = request.headers.get("last-event-id", "")
+        after = int(header) if header.isdigit() else last_event_id
+
+        async def replay():
+            seq = after
+            idle = 0
+            while True:
+                # 先读状态再读事件：状态已结束时，读到的事件一定包含最终事件
+                # SQLite 读取放到线程中，大量跟随者轮询时不阻塞事件循环
+                status = await asyncio.to_thread(job_store.status, job_id)
+                rows = await asyncio.to_thread(job_store.events_after, job_id, seq)
+                for seq, data in rows:
+                    yield f"id: {seq}\ndata: {data}\n\n".encode("utf-8")
+                if rows:
+                    idle = 0
+                    continue
+                if status is None or status in FINISHED:
+                    return
+                idle += 1
+                if idle % 15 == 0:
+                    # 保持连接，避免代理在排队期间断开空闲连接
+                    yield b": keep-alive\n\n"
+                await job_store.wait(job_id, timeout=1.0)
+
+        return StreamingResponse(
+            replay(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no"
             }
+        )
+
+    # Export HTML as a native Word document (.docx)
+    @app.post("/download/docx", tags=["Files"])
+    async def download_docx(
+        result_id: str = Form(""),
+        html: str = Form(""),
+        filename: str = Form("document.docx")
+    ):
+        """
+        Download a result as a real OOXML .docx (paragraphs, runs, headings, tables, fonts).
+        Pass the result_id from download_url, or the HTML itself.
+        """
+        if result_id:
+            data = get_result_store().get(result_id)
+            if data is None:
+                raise HTTPException(status_code=404, detail="下载链接不存在或已过期")
+            html = data.decode("utf-8")
+        if not html:
+            raise HTTPException(status_code=400, detail="缺少 result_id 或 html")
 
+        try:
+            return await docx_response(html, filename)
         except Exception as e:
-            logger.exception("File formatting failed")
-            return {"success": False, "message": str(e)}
+            logger.error(f"DOCX export error: {e}")
+            raise HTTPException(status_code=500, detail="导出失败")
+
+    # Download the zip produced by /format/batch
+    @app.get("/download/batch/{batch_id}", tags=["Files"])
+    async def download_batch(batch_id: str, filename: str = "documents.zip"):
+        """Download the .docx archive of a finished batch"""
+        chunks = get_result_store().iter_chunks(batch_id)
+        if chunks is None:
+            raise HTTPException(status_code=404, detail="下载链接不存在或已过期")
+        return StreamingResponse(chunks, media_type="application/zip", headers=attachment_headers(filename))
+
+    # Download a stored result as Word-compatible file (.doc, or .docx with format=docx)
+    @app.get("/download/{result_id}", tags=["Files"])
+    async def download_result(result_id: str, filename: str = "document.doc", format: str = "doc"):
+        """
+        Download a finished result by the download_url returned with it.
+        Streams the Word-prepared document from the server-side result store.
+        """
+        if format == "docx":
+            data = get_result_store().get(result_id)
+            if data is None:
+                raise HTTPException(status_code=404, detail="下载链接不存在或已过期")
+            try:
+                return await docx_response(data.decode("utf-8"), filename)
+            except Exception as e:
+                logger.error(f"DOCX export error: {e}")
+                raise HTTPException(status_code=500, detail="导出失败")
+
+        chunks = get_result_store().iter_chunks(result_id)
+        if chunks is None:
+            raise HTTPException(status_code=404, detail="下载链接不存在或已过期")
+
+        return StreamingResponse(
+            chunks,
+            media_type="application/msword",
+            headers=attachment_headers(filename)
+        )
 
     # Download HTML as Word-compatible file (.doc)
     @app.post("/download/word", tags=["Files"])
@@ -327,21 +1062,16 @@ def create_app(
         """
         Download HTML as Word-compatible file.
         Adds Word META tags and returns as .doc file.
+        Prefer the download_url returned with the result, which avoids re-uploading the HTML.
         """
         try:
             # Add Word-specific META tags
             word_html = prepare_for_word_download(html)
-            
-            # Save to temp file
-            import tempfile
-            temp_path = os.path.join(tempfile.gettempdir(), filename)
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                f.write(word_html)
-            
-            return FileResponse(
-                path=temp_path,
-                filename=filename,
-                media_type="application/msword"
+
+            return Response(
+                content=word_html.encode("utf-8"),
+                media_type="application/msword",
+                headers=attachment_headers(filename)
             )
         except Exception as e:
             logger.error(f"Download error: {e}")
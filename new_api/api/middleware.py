@@ -0,0 +1,87 @@
+"""
+Upload Limit - 在表单解析之前限制请求体大小：Content-Length 超限直接返回413，
+分块上传则边接收边计数，超限立即中止，超大文件不会被完整缓存到内存或临时文件。
+这里只限制大小：文件类型在表单解析（上传内容已落盘）之后才检查。
+"""
+import json
+from typing import Callable, Optional
+
+
+class _BodyTooLarge(Exception):
+    """Raised from receive() once the body exceeds the limit"""
+
+
+class UploadLimitMiddleware:
+    """Pure ASGI middleware enforcing a per-path request body limit with 413 responses"""
+
+    def __init__(self, app, limit_for: Callable[[str], Optional[int]]):
+        """
+        Args:
+            app: The wrapped ASGI application
+            limit_for: Maps a request path to its body limit in bytes, None for no limit
+        """
+        self.app = app
+        self.limit_for = limit_for
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limit_for(scope["path"])
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            # 不读取请求体，直接拒绝
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        exceeded = False
+        responded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal responded
+            if exceeded:
+                # 表单解析错误会被框架转换为400，这里替换为413
+                if message["type"] == "http.response.start" and not responded:
+                    responded = True
+                    await self._reject(send, limit)
+                return
+            responded = responded or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            if not responded:
+                await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send, limit: int) -> None:
+        body = json.dumps(
+            {"detail": f"上传内容过大（上限 {round(limit / (1024 * 1024), 1):g}MB）"}, ensure_ascii=False
+        ).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,78 @@
+"""
+Benchmark: single-pass HTMLStreamProcessor vs. the previous multi-pass post-processor.
+Usage: python benchmarks/bench_html_postprocessor.py [sizes in MB...]
+"""
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.html_service import HTMLService
+
+PARAGRAPH = (
+    '<p style="font-family: 宋体; font-size: 12pt; text-indent: 2em; line-height: 1.5;">'
+    '这是一段正文内容，用于测试后处理性能 &amp; 实体。</p>\n'
+)
+TABLE = (
+    '<table><tr><th style="font-family: 黑体; font-size: 12pt;">表头</th></tr>'
+    '<tr><td style="font-family: 宋体; font-size: 12pt;">内容</td></tr></table>\n'
+)
+
+
+def legacy_process_html(html_content: str):
+    """The multi-pass implementation this engine replaced (ensure/add styles/tables + validate)"""
+    html_content = html_content.replace("```html", "").replace("```", "").strip()
+    if not (html_content.lower().startswith("<!doctype") or html_content.lower().startswith("<html")):
+        html_content = f"<!DOCTYPE html>\n<html>\n<head></head>\n<body>\n{html_content}\n</body>\n</html>"
+    body_match = re.search(r'<body([^>]*)>', html_content, re.IGNORECASE)
+    if body_match and 'style=' not in body_match.group(1):
+        html_content = html_content.replace(
+            body_match.group(0),
+            f'<body{body_match.group(1)} style="font-family: SimSun, serif; font-size: 12pt; line-height: 1.5;">',
+            1
+        )
+    html_content = re.sub(
+        r'<table([^>]*)>', r'<table\1 style="border-collapse: collapse; width: 100%;">',
+        html_content, flags=re.IGNORECASE
+    )
+    errors = []
+    html_lower = html_content.lower()
+    for tag in ("html", "body", "head"):
+        if f"<{tag}>" not in html_lower and f"<{tag} " not in html_lower:
+            errors.append(f"缺少<{tag}>标签")
+    if html_content.count("<table") != html_content.count("</table>"):
+        errors.append("<table>标签未正确闭合")
+    if html_content.count("<tr") != html_content.count("</tr>"):
+        errors.append("<tr>标签未正确闭合")
+    return html_content, not errors, errors
+
+
+def make_document(size_mb: float) -> str:
+    unit = PARAGRAPH * 8 + TABLE
+    count = max(1, int(size_mb * 1024 * 1024 / len(unit.encode('utf-8'))))
+    return "<h1>标题</h1>\n" + unit * count
+
+
+def best_of(func, arg, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(sizes):
+    service = HTMLService()
+    print(f"{'size':>6} {'legacy (s)':>12} {'single-pass (s)':>16}")
+    for size in sizes:
+        document = make_document(size)
+        legacy = best_of(legacy_process_html, document)
+        single = best_of(service.process_html, document)
+        print(f"{size:>5g}M {legacy:>12.3f} {single:>16.3f}")
+
+
+if __name__ == "__main__":
+    main([float(arg) for arg in sys.argv[1:]] or [1, 5, 10])
@@ -4,8 +4,9 @@ Supports YAML config files and environment variables.
 Environment variables take priority over config.yaml.
 """
 import os
+import json
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 import yaml
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
@@ -16,6 +17,32 @@ if env_path.exists():
     load_dotenv(dotenv_path=env_path)
 
 
+class EndpointConfig(BaseModel):
+    """One OpenAI-compatible upstream; empty fields fall back to the top-level LLM settings"""
+    name: str = ""
+    base_url: str = ""
+    api_key: str = ""
+    # This upstream's name for the default models; models picked by model_routes are sent as-is
+    stream_model: str = ""
+    non_stream_model: str = ""
+    # Relative share of primary traffic
+    weight: float = 1.0
+
+
+class ModelRouteConfig(BaseModel):
+    """One row of the model routing table; a request matches when it is within every limit that is set"""
+    name: str = ""
+    # Estimated input tokens of the document
+    max_tokens: Optional[int] = None
+    # Share of non-empty lines that are table rows
+    max_table_density: Optional[float] = None
+    # Number of clauses in the formatting rules
+    max_rule_clauses: Optional[int] = None
+    # Empty models fall back to the top-level stream_model / non_stream_model
+    stream_model: str = ""
+    non_stream_model: str = ""
+
+
 class LLMConfig(BaseModel):
     """LLM service configuration - values loaded from config.yaml or environment variables"""
     api_key: str = ""
@@ -24,7 +51,34 @@ class LLMConfig(BaseModel):
     non_stream_model: str = ""
     temperature: float = 0.3
     max_tokens: Optional[int] = None
+    # Continuation requests allowed when the output hits max_tokens (finish_reason == "length")
+    max_continuations: int = 3
     timeout: int = 120
+    # Upper bound on in-flight upstream requests per worker
+    max_concurrency: int = 8
+    # Documents above this estimated input token count are split and formatted in parallel (0 disables)
+    segment_max_tokens: int = 3000
+    # "html": model writes inline-styled HTML; "structure": model returns DocumentElement JSON rendered server-side
+    output_mode: str = "html"
+    # Skip the LLM when the rules compile to a style table (see core/rule_compiler.py)
+    rule_fast_path: bool = True
+    # Additional upstreams; when empty, base_url/api_key/models above form the only endpoint
+    endpoints: List[EndpointConfig] = Field(default_factory=list)
+    # Send a hedged request to the next endpoint when the first token of a stream is later than the
+    # p95 deadline (non-streaming calls only fail over: their latency is the whole generation)
+    hedge_enabled: bool = True
+    # Hedge deadline (seconds) before enough latency samples exist, and its lower bound afterwards
+    hedge_delay: float = 8.0
+    hedge_min_delay: float = 1.0
+    # Circuit breaker: consecutive failures that open an endpoint, and how long it stays open
+    breaker_failures: int = 3
+    breaker_cooldown: float = 30.0
+    # Explicit prefix-cache hint for providers that need one: "" (rely on automatic prefix caching),
+    # "prompt_cache_key" (OpenAI) or "cache_control" (system message marked ephemeral, e.g. DashScope)
+    prompt_cache_hint: str = ""
+    # Per-request model choice, first matching route wins; no match uses the models above.
+    # Endpoints with their own models configured keep using them.
+    model_routes: List[ModelRouteConfig] = Field(default_factory=list)
 
 
 class AppConfig(BaseModel):
@@ -35,6 +89,89 @@ class AppConfig(BaseModel):
     debug: bool = False
 
 
+class CacheConfig(BaseModel):
+    """Result cache configuration"""
+    enabled: bool = True
+    # In-memory LRU tier budget, measured in bytes of stored HTML
+    max_memory_bytes: int = 64 * 1024 * 1024
+    # Optional SQLite file for the on-disk tier; empty disables it
+    disk_path: str = ""
+    disk_max_entries: int = 10000
+
+
+class WorkerConfig(BaseModel):
+    """Worker pool configuration for CPU-bound stages (DOCX parsing, decoding, HTML post-processing)"""
+    # "thread" or "process"
+    kind: str = "thread"
+    max_workers: int = 4
+    # Per-stage timeouts in seconds
+    timeouts: Dict[str, float] = Field(default_factory=lambda: {
+        "extract": 60.0,
+        "decode": 30.0,
+        "html": 30.0,
+        "normalize": 30.0,
+        "render": 30.0,
+        "export": 60.0,
+    })
+
+
+class DownloadConfig(BaseModel):
+    """Server-side result store for Word downloads"""
+    # Seconds a finished result stays downloadable
+    ttl_seconds: int = 3600
+    # Memory budget, measured in bytes of Word-prepared output
+    max_bytes: int = 128 * 1024 * 1024
+
+
+class SchedulerConfig(BaseModel):
+    """Admission control for LLM formatting jobs"""
+    # Jobs allowed to run against the provider at once
+    max_running: int = 4
+    # Waiting jobs beyond this are rejected with 503
+    max_queue: int = 32
+    # A waiting job's estimated size is halved after this many seconds, so long jobs are not starved
+    aging_seconds: float = 30.0
+
+
+class UploadConfig(BaseModel):
+    """Upload ingestion for /format/stream, /format/file and /jobs"""
+    # Largest accepted request body; bigger uploads get 413 before they are spooled
+    max_bytes: int = 20 * 1024 * 1024
+    # Bytes read from the upload to identify its type
+    sniff_bytes: int = 64 * 1024
+
+
+class NormalizeConfig(BaseModel):
+    """Input normalization before the LLM call (whitespace, invisible characters, repeated boilerplate)"""
+    enabled: bool = True
+    # Plain-text uploads only (DOCX text never contains page headers/footers): a line repeated at
+    # least this many times is boilerplate and only its first copy is kept. 0 disables; off by
+    # default because repeated body lines (signature lines, ballot options) are real content
+    dedupe_min_repeats: int = 0
+    # Shorter lines are never deduplicated, so repeated short headings survive
+    dedupe_min_chars: int = 6
+
+
+class BatchConfig(BaseModel):
+    """Batch formatting (/format/batch)"""
+    # Documents per batch, after expanding zip archives
+    max_files: int = 50
+    # Total uncompressed size of the documents in one batch
+    max_bytes: int = 50 * 1024 * 1024
+    # Documents of one batch formatted at the same time
+    max_concurrency: int = 4
+
+
+class JobsConfig(BaseModel):
+    """Persistent background jobs (/jobs)"""
+    # SQLite file holding job state and events
+    db_path: str = "data/jobs.db"
+    # Finished jobs and their events are kept this long
+    ttl_seconds: int = 24 * 3600
+    # A pending/running job without a new event for this long is reported as interrupted (e.g. after a restart)
+    stale_seconds: int = 600
+
+
 class Settings:
     """Global settings instance"""
     _instance: Optional['Settings'] = None
@@ -82,8 +219,41 @@ class Settings:
             llm_config['non_stream_model'] = os.getenv('LLM_NON_STREAM_MODEL')
         if os.getenv('LLM_TEMPERATURE'):
             llm_config['temperature'] = float(os.getenv('LLM_TEMPERATURE', '0.3'))
+        if os.getenv('LLM_MAX_TOKENS'):
+            llm_config['max_tokens'] = int(os.getenv('LLM_MAX_TOKENS'))
+        if os.getenv('LLM_MAX_CONTINUATIONS'):
+            llm_config['max_continuations'] = int(os.getenv('LLM_MAX_CONTINUATIONS', '3'))
         if os.getenv('LLM_TIMEOUT'):
             llm_config['timeout'] = int(os.getenv('LLM_TIMEOUT', '120'))
+        if os.getenv('LLM_MAX_CONCURRENCY'):
+            llm_config['max_concurrency'] = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+        if os.getenv('LLM_SEGMENT_MAX_TOKENS'):
+            llm_config['segment_max_tokens'] = int(os.getenv('LLM_SEGMENT_MAX_TOKENS', '3000'))
+        if os.getenv('LLM_OUTPUT_MODE'):
+            llm_config['output_mode'] = os.getenv('LLM_OUTPUT_MODE')
+        rule_fast_path = os.getenv('LLM_RULE_FAST_PATH')
+        if rule_fast_path:
+            llm_config['rule_fast_path'] = rule_fast_path.lower() == 'true'
+        if os.getenv('LLM_ENDPOINTS'):
+            # JSON list of {"name", "base_url", "api_key", "stream_model", "non_stream_model", "weight"}
+            llm_config['endpoints'] = json.loads(os.getenv('LLM_ENDPOINTS', '[]'))
+        hedge_enabled = os.getenv('LLM_HEDGE_ENABLED')
+        if hedge_enabled:
+            llm_config['hedge_enabled'] = hedge_enabled.lower() == 'true'
+        if os.getenv('LLM_HEDGE_DELAY'):
+            llm_config['hedge_delay'] = float(os.getenv('LLM_HEDGE_DELAY', '8'))
+        if os.getenv('LLM_HEDGE_MIN_DELAY'):
+            llm_config['hedge_min_delay'] = float(os.getenv('LLM_HEDGE_MIN_DELAY', '1'))
+        if os.getenv('LLM_BREAKER_FAILURES'):
+            llm_config['breaker_failures'] = int(os.getenv('LLM_BREAKER_FAILURES', '3'))
+        if os.getenv('LLM_BREAKER_COOLDOWN'):
+            llm_config['breaker_cooldown'] = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+        if os.getenv('LLM_PROMPT_CACHE_HINT'):
+            llm_config['prompt_cache_hint'] = os.getenv('LLM_PROMPT_CACHE_HINT')
+        if os.getenv('LLM_MODEL_ROUTES'):
+            # JSON list, e.g. [{"name": "small", "max_tokens": 800, "max_table_density": 0.2,
+            #                   "max_rule_clauses": 6, "stream_model": "...", "non_stream_model": "..."}]
+            llm_config['model_routes'] = json.loads(os.getenv('LLM_MODEL_ROUTES', '[]'))
 
         self._config['llm'] = llm_config
 
@@ -102,6 +272,104 @@ class Settings:
 
         self._config['app'] = app_config
 
+        # Cache configuration from environment variables
+        cache_config = self._config.get('cache', {})
+
+        cache_enabled = os.getenv('CACHE_ENABLED')
+        if cache_enabled:
+            cache_config['enabled'] = cache_enabled.lower() == 'true'
+        if os.getenv('CACHE_MAX_MEMORY_BYTES'):
+            cache_config['max_memory_bytes'] = int(os.getenv('CACHE_MAX_MEMORY_BYTES', '0'))
+        if os.getenv('CACHE_DISK_PATH'):
+            cache_config['disk_path'] = os.getenv('CACHE_DISK_PATH')
+        if os.getenv('CACHE_DISK_MAX_ENTRIES'):
+            cache_config['disk_max_entries'] = int(os.getenv('CACHE_DISK_MAX_ENTRIES', '10000'))
+
+        self._config['cache'] = cache_config
+
+        # Worker pool configuration from environment variables
+        worker_config = self._config.get('worker', {})
+
+        if os.getenv('WORKER_POOL_KIND'):
+            worker_config['kind'] = os.getenv('WORKER_POOL_KIND')
+        if os.getenv('WORKER_POOL_MAX_WORKERS'):
+            worker_config['max_workers'] = int(os.getenv('WORKER_POOL_MAX_WORKERS', '4'))
+        for stage in ('extract', 'decode', 'html', 'render', 'export', 'normalize'):
+            timeout = os.getenv(f'WORKER_{stage.upper()}_TIMEOUT')
+            if timeout:
+                worker_config.setdefault('timeouts', WorkerConfig().timeouts)[stage] = float(timeout)
+
+        self._config['worker'] = worker_config
+
+        # Download store configuration from environment variables
+        download_config = self._config.get('download', {})
+
+        if os.getenv('DOWNLOAD_TTL_SECONDS'):
+            download_config['ttl_seconds'] = int(os.getenv('DOWNLOAD_TTL_SECONDS', '3600'))
+        if os.getenv('DOWNLOAD_MAX_BYTES'):
+            download_config['max_bytes'] = int(os.getenv('DOWNLOAD_MAX_BYTES', '0'))
+
+        self._config['download'] = download_config
+
+        # Scheduler configuration from environment variables
+        scheduler_config = self._config.get('scheduler', {})
+
+        if os.getenv('SCHEDULER_MAX_RUNNING'):
+            scheduler_config['max_running'] = int(os.getenv('SCHEDULER_MAX_RUNNING', '4'))
+        if os.getenv('SCHEDULER_MAX_QUEUE'):
+            scheduler_config['max_queue'] = int(os.getenv('SCHEDULER_MAX_QUEUE', '32'))
+        if os.getenv('SCHEDULER_AGING_SECONDS'):
+            scheduler_config['aging_seconds'] = float(os.getenv('SCHEDULER_AGING_SECONDS', '30'))
+
+        self._config['scheduler'] = scheduler_config
+
+        # Upload configuration from environment variables
+        upload_config = self._config.get('upload', {})
+
+        if os.getenv('UPLOAD_MAX_BYTES'):
+            upload_config['max_bytes'] = int(os.getenv('UPLOAD_MAX_BYTES', '0'))
+        if os.getenv('UPLOAD_SNIFF_BYTES'):
+            upload_config['sniff_bytes'] = int(os.getenv('UPLOAD_SNIFF_BYTES', '65536'))
+
+        self._config['upload'] = upload_config
+
+        # Normalization configuration from environment variables
+        normalize_config = self._config.get('normalize', {})
+
+        normalize_enabled = os.getenv('NORMALIZE_ENABLED')
+        if normalize_enabled:
+            normalize_config['enabled'] = normalize_enabled.lower() == 'true'
+        if os.getenv('NORMALIZE_DEDUPE_MIN_REPEATS'):
+            normalize_config['dedupe_min_repeats'] = int(os.getenv('NORMALIZE_DEDUPE_MIN_REPEATS', '0'))
+        if os.getenv('NORMALIZE_DEDUPE_MIN_CHARS'):
+            normalize_config['dedupe_min_chars'] = int(os.getenv('NORMALIZE_DEDUPE_MIN_CHARS', '6'))
+
+        self._config['normalize'] = normalize_config
+
+        # Batch configuration from environment variables
+        batch_config = self._config.get('batch', {})
+
+        if os.getenv('BATCH_MAX_FILES'):
+            batch_config['max_files'] = int(os.getenv('BATCH_MAX_FILES', '50'))
+        if os.getenv('BATCH_MAX_BYTES'):
+            batch_config['max_bytes'] = int(os.getenv('BATCH_MAX_BYTES', '0'))
+        if os.getenv('BATCH_MAX_CONCURRENCY'):
+            batch_config['max_concurrency'] = int(os.getenv('BATCH_MAX_CONCURRENCY', '4'))
+
+        self._config['batch'] = batch_config
+
+        # Jobs configuration from environment variables
+        jobs_config = self._config.get('jobs', {})
+
+        if os.getenv('JOBS_DB_PATH'):
+            jobs_config['db_path'] = os.getenv('JOBS_DB_PATH')
+        if os.getenv('JOBS_TTL_SECONDS'):
+            jobs_config['ttl_seconds'] = int(os.getenv('JOBS_TTL_SECONDS', '86400'))
+        if os.getenv('JOBS_STALE_SECONDS'):
+            jobs_config['stale_seconds'] = int(os.getenv('JOBS_STALE_SECONDS', '600'))
+
+        self._config['jobs'] = jobs_config
+
     def get(self, key: str, default: Any = None) -> Any:
         """Get configuration value by dot notation key"""
         keys = key.split('.')
@@ -127,6 +395,54 @@ class Settings:
         app_data = self._config.get('app', {})
         return AppConfig(**app_data)
 
+    @property
+    def cache(self) -> CacheConfig:
+        """Get result cache configuration"""
+        cache_data = self._config.get('cache', {})
+        return CacheConfig(**cache_data)
+
+    @property
+    def worker(self) -> WorkerConfig:
+        """Get worker pool configuration"""
+        worker_data = self._config.get('worker', {})
+        return WorkerConfig(**worker_data)
+
+    @property
+    def download(self) -> DownloadConfig:
+        """Get download store configuration"""
+        download_data = self._config.get('download', {})
+        return DownloadConfig(**download_data)
+
+    @property
+    def scheduler(self) -> SchedulerConfig:
+        """Get scheduler configuration"""
+        scheduler_data = self._config.get('scheduler', {})
+        return SchedulerConfig(**scheduler_data)
+
+    @property
+    def upload(self) -> UploadConfig:
+        """Get upload configuration"""
+        upload_data = self._config.get('upload', {})
+        return UploadConfig(**upload_data)
+
+    @property
+    def normalize(self) -> NormalizeConfig:
+        """Get normalization configuration"""
+        normalize_data = self._config.get('normalize', {})
+        return NormalizeConfig(**normalize_data)
+
+    @property
+    def batch(self) -> BatchConfig:
+        """Get batch configuration"""
+        batch_data = self._config.get('batch', {})
+        return BatchConfig(**batch_data)
+
+    @property
+    def jobs(self) -> JobsConfig:
+        """Get jobs configuration"""
+        jobs_data = self._config.get('jobs', {})
+        return JobsConfig(**jobs_data)
+
     @classmethod
     def reset(cls):
         """Reset settings instance (useful for testing)"""
@@ -146,3 +462,43 @@ def get_llm_config() -> LLMConfig:
 def get_app_config() -> AppConfig:
     """Get application configuration"""
     return settings.app
+
+
+def get_cache_config() -> CacheConfig:
+    """Get result cache configuration"""
+    return settings.cache
+
+
+def get_worker_config() -> WorkerConfig:
+    """Get worker pool configuration"""
+    return settings.worker
+
+
+def get_download_config() -> DownloadConfig:
+    """Get download store configuration"""
+    return settings.download
+
+
+def get_scheduler_config() -> SchedulerConfig:
+    """Get scheduler configuration"""
+    return settings.scheduler
+
+
+def get_upload_config() -> UploadConfig:
+    """Get upload configuration"""
+    return settings.upload
+
+
+def get_normalize_config() -> NormalizeConfig:
+    """Get normalization configuration"""
+    return settings.normalize
+
+
+def get_batch_config() -> BatchConfig:
+    """Get batch configuration"""
+    return settings.batch
+
+
+def get_jobs_config() -> JobsConfig:
+    """Get jobs configuration"""
+    return settings.jobs
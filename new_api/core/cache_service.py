@@ -0,0 +1,203 @@
+"""
+Result Cache - 缓存后处理完成的HTML结果，避免重复调用LLM。
+内存LRU层按字节数淘汰，可选的SQLite磁盘层在重启后仍然有效。
+异步代码使用 aget/aset，磁盘读写在线程中进行，不阻塞事件循环。
+"""
+import os
+import asyncio
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.settings import get_cache_config
+
+logger = logging.getLogger(__name__)
+
+# 磁盘层每写入这么多条结果才做一次超额淘汰
+EVICT_INTERVAL = 100
+
+
+class ResultCache:
+    """Two-tier cache (memory LRU + optional SQLite) for formatted HTML results"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or get_cache_config().model_dump()
+        self.enabled = bool(self.config.get("enabled", True))
+        self.max_memory_bytes = int(self.config.get("max_memory_bytes", 64 * 1024 * 1024))
+        self.disk_max_entries = int(self.config.get("disk_max_entries", 10000))
+
+        self._lock = threading.Lock()
+        # 磁盘层单独加锁，线程中的SQLite读写不会阻塞事件循环里的内存层访问
+        self._db_lock = threading.Lock()
+        # 磁盘命中的访问时间，随下一次写入一起提交
+        self._touched: Dict[str, float] = {}
+        self._writes = 0
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._memory_bytes = 0
+        self._db: Optional[sqlite3.Connection] = None
+
+        disk_path = self.config.get("disk_path") or ""
+        if self.enabled and disk_path:
+            self._open_disk(disk_path)
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Build a content-addressed key from the request parts (text, rules, model, temperature...)"""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def _open_disk(self, path: str) -> None:
+        """Open (and create if needed) the SQLite disk tier"""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"结果缓存磁盘层不可用: {e}")
+            self._db = None
+
+    @staticmethod
+    def _cacheable(value: Dict[str, Any]) -> bool:
+        """Results that failed HTML validation are not cached, so a malformed generation is retried"""
+        return value.get("valid") is not False
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached result, promoting disk hits into the memory tier (blocking; use aget from async code)"""
+        if not self.enabled:
+            return None
+        value = self._get_memory(key)
+        if value is not None or self._db is None:
+            return value
+        return self._get_disk(key)
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        """get() with the disk tier read in a worker thread"""
+        if not self.enabled:
+            return None
+        value = self._get_memory(key)
+        if value is not None or self._db is None:
+            return value
+        return await asyncio.to_thread(self._get_disk, key)
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a result in both tiers (blocking; use aset from async code)"""
+        encoded = self._set_memory(key, value)
+        if encoded is not None and self._db is not None:
+            self._set_disk(key, encoded)
+
+    async def aset(self, key: str, value: Dict[str, Any]) -> None:
+        """set() with the disk tier written in a worker thread"""
+        encoded = self._set_memory(key, value)
+        if encoded is not None and self._db is not None:
+            await asyncio.to_thread(self._set_disk, key, encoded)
+
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+            return value
+
+    def _get_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._db_lock:
+            try:
+                row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"读取结果缓存失败: {e}")
+                return None
+            if row is None:
+                return None
+            self._touched[key] = time.time()
+
+        value = json.loads(row[0])
+        with self._lock:
+            self._put_memory(key, value, len(row[0]))
+        return value
+
+    def _set_memory(self, key: str, value: Dict[str, Any]) -> Optional[str]:
+        """Store in the memory tier; returns the encoded value for the disk tier, or None when not cached"""
+        if not self.enabled or not self._cacheable(value):
+            return None
+        encoded = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._put_memory(key, value, len(encoded))
+        return encoded
+
+    def _set_disk(self, key: str, encoded: str) -> None:
+        with self._db_lock:
+            try:
+                if self._touched:
+                    self._db.executemany(
+                        "UPDATE results SET accessed_at = ? WHERE key = ?",
+                        [(accessed_at, touched) for touched, accessed_at in self._touched.items()]
+                    )
+                    self._touched.clear()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, accessed_at) VALUES (?, ?, ?)",
+                    (key, encoded, time.time())
+                )
+                self._writes += 1
+                if self._writes % EVICT_INTERVAL == 0:
+                    self._db.execute(
+                        "DELETE FROM results WHERE key IN ("
+                        "SELECT key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                        (self.disk_max_entries,)
+                    )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"写入结果缓存失败: {e}")
+
+    def _put_memory(self, key: str, value: Dict[str, Any], size: int) -> None:
+        """Insert into the LRU tier and evict least recently used entries over budget"""
+        if size > self.max_memory_bytes:
+            return
+
+        if key in self._memory:
+            self._memory_bytes -= self._sizes.pop(key)
+            del self._memory[key]
+
+        self._memory[key] = value
+        self._sizes[key] = size
+        self._memory_bytes += size
+
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            old_key, _ = self._memory.popitem(last=False)
+            self._memory_bytes -= self._sizes.pop(old_key)
+
+    def clear(self) -> None:
+        """Drop all cached results"""
+        with self._lock:
+            self._memory.clear()
+            self._sizes.clear()
+            self._memory_bytes = 0
+        if self._db is not None:
+            with self._db_lock:
+                self._touched.clear()
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+
+# Global cache instance
+result_cache = ResultCache()
+
+
+def get_result_cache() -> ResultCache:
+    """Get the global result cache instance"""
+    return result_cache
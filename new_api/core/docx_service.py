@@ -0,0 +1,519 @@
+"""
+DOCX Service - 将后处理后的内联样式HTML转换为原生 .docx（OOXML）文档。
+单次扫描HTML，边解析边把 document.xml 写入zip条目，内存占用与文档大小无关。
+"""
+import io
+import re
+import html as html_lib
+import zipfile
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+# 词法单元：注释、声明/处理指令、标签（带引号的属性值中允许出现 '>'）
+_TOKEN_RE = re.compile(
+    r'<!--.*?-->'
+    r'|<![^>]*>'
+    r'|<\?[^>]*>'
+    r'|<(/?)([a-zA-Z][\w:-]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>',
+    re.DOTALL
+)
+_STYLE_ATTR_RE = re.compile(r'\bstyle\s*=\s*(["\'])(.*?)\1', re.IGNORECASE | re.DOTALL)
+_COLSPAN_RE = re.compile(r'\bcolspan\s*=\s*["\']?(\d+)', re.IGNORECASE)
+_LENGTH_RE = re.compile(r'(-?\d+(?:\.\d+)?)\s*(pt|px|em|%)?')
+_WHITESPACE_RE = re.compile(r'\s+')
+# XML 1.0 不允许的控制字符
+_INVALID_XML_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_VOID_TAGS = frozenset({
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'source', 'track', 'wbr',
+})
+_SKIPPED_TAGS = frozenset({'head', 'style', 'script', 'title'})
+_BLOCK_TAGS = frozenset({
+    'p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li',
+    'blockquote', 'pre', 'dt', 'dd', 'caption',
+})
+_HEADING_TAGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 4, 'h6': 4}
+_BOLD_TAGS = frozenset({'b', 'strong', 'th'})
+_ITALIC_TAGS = frozenset({'i', 'em'})
+# 向子元素继承的CSS属性
+_INHERITED = frozenset({
+    'font-family', 'font-size', 'font-weight', 'font-style', 'color',
+    'text-align', 'line-height', 'text-indent', 'text-decoration',
+})
+_ALIGNMENTS = {'center': 'center', 'right': 'right', 'justify': 'both', 'left': 'left'}
+_GENERIC_FONTS = frozenset({'serif', 'sans-serif', 'monospace', 'cursive', 'fantasy', 'system-ui'})
+
+# A4，上下 2.54cm、左右 3.17cm 页边距
+PAGE_WIDTH = 11906
+PAGE_HEIGHT = 16838
+TEXT_WIDTH = PAGE_WIDTH - 2 * 1800
+DEFAULT_FONT_SIZE = 12.0
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '</Types>'
+)
+PACKAGE_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+DOCUMENT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+
+def _heading_style(level: int) -> str:
+    return (
+        f'<w:style w:type="paragraph" w:styleId="Heading{level}">'
+        f'<w:name w:val="heading {level}"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/>'
+        f'<w:qFormat/><w:pPr><w:keepNext/><w:outlineLvl w:val="{level - 1}"/></w:pPr>'
+        f'<w:rPr><w:b/></w:rPr></w:style>'
+    )
+
+
+STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    f'<w:styles xmlns:w="{W_NS}">'
+    '<w:docDefaults><w:rPrDefault><w:rPr>'
+    '<w:rFonts w:ascii="Times New Roman" w:hAnsi="Times New Roman" w:eastAsia="宋体" w:cs="Times New Roman"/>'
+    f'<w:sz w:val="{int(DEFAULT_FONT_SIZE * 2)}"/><w:szCs w:val="{int(DEFAULT_FONT_SIZE * 2)}"/>'
+    '<w:lang w:val="en-US" w:eastAsia="zh-CN"/>'
+    '</w:rPr></w:rPrDefault><w:pPrDefault><w:pPr><w:spacing w:after="0" w:line="360" w:lineRule="auto"/>'
+    '</w:pPr></w:pPrDefault></w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    + "".join(_heading_style(level) for level in range(1, 5))
+    + '<w:style w:type="table" w:default="1" w:styleId="TableNormal"><w:name w:val="Normal Table"/>'
+    '<w:tblPr><w:tblCellMar><w:left w:w="108" w:type="dxa"/><w:right w:w="108" w:type="dxa"/>'
+    '</w:tblCellMar></w:tblPr></w:style>'
+    '</w:styles>'
+)
+
+DOCUMENT_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    f'<w:document xmlns:w="{W_NS}"><w:body>'
+)
+DOCUMENT_END = (
+    f'<w:sectPr><w:pgSz w:w="{PAGE_WIDTH}" w:h="{PAGE_HEIGHT}"/>'
+    '<w:pgMar w:top="1440" w:right="1800" w:bottom="1440" w:left="1800" '
+    'w:header="851" w:footer="992" w:gutter="0"/></w:sectPr>'
+    '</w:body></w:document>'
+)
+
+
+def parse_css(attrs: str) -> Dict[str, str]:
+    """Inline style attribute -> {property: value}"""
+    match = _STYLE_ATTR_RE.search(attrs)
+    if match is None:
+        return {}
+    css = {}
+    for declaration in html_lib.unescape(match.group(2)).split(';'):
+        name, sep, value = declaration.partition(':')
+        if sep:
+            css[name.strip().lower()] = value.strip()
+    return css
+
+
+def _length_pt(value: str, font_size: float = DEFAULT_FONT_SIZE) -> Optional[float]:
+    """CSS length -> points (px, pt and em)"""
+    match = _LENGTH_RE.search(value)
+    if match is None:
+        return None
+    number, unit = float(match.group(1)), match.group(2)
+    if unit == 'px':
+        return number * 0.75
+    if unit == 'em':
+        return number * font_size
+    if unit == '%':
+        return None
+    return number
+
+
+def _border_xml(side: str, value: str) -> str:
+    """CSS border shorthand -> one OOXML border element (only 'none' suppresses it)"""
+    if not value or 'none' in value or value.strip() in ('0', '0px'):
+        return ''
+    width = _length_pt(value) or 0.75
+    size = max(2, min(96, int(round(width * 8))))
+    return f'<w:{side} w:val="single" w:sz="{size}" w:space="0" w:color="000000"/>'
+
+
+def _escape(text: str) -> str:
+    return _INVALID_XML_RE.sub('', text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+class DocxStreamWriter:
+    """
+    HTML -> OOXML 转换器。
+
+    按词法单元扫描HTML，段落结束时立即把XML写入 word/document.xml 条目；
+    只有当前段落和当前表格行会暂存在内存中。
+    """
+
+    FLUSH_SIZE = 64 * 1024
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffer: List[str] = []
+        self._buffered = 0
+        # 元素栈：(标签, 继承后的CSS)
+        self._stack: List[tuple] = [("root", {})]
+        self._skip_depth = 0
+        self._paragraph: Optional[Dict[str, Any]] = None
+        self._lists: List[Dict[str, Any]] = []
+        self._tables: List[Dict[str, Any]] = []
+        self._cells: List[Dict[str, Any]] = []
+
+    # ---- output ----
+
+    def _emit(self, xml: str) -> None:
+        """Write XML to the innermost open table cell, or straight to the document stream"""
+        if self._cells:
+            self._cells[-1]["parts"].append(xml)
+            return
+        self._buffer.append(xml)
+        self._buffered += len(xml)
+        if self._buffered >= self.FLUSH_SIZE:
+            self._flush_buffer()
+
+    def _flush_buffer(self) -> None:
+        if self._buffer:
+            self._stream.write(''.join(self._buffer).encode('utf-8'))
+            self._buffer.clear()
+            self._buffered = 0
+
+    # ---- input ----
+
+    def feed(self, html: str) -> None:
+        """Convert a complete HTML document (or body fragment)"""
+        pos = 0
+        for match in _TOKEN_RE.finditer(html):
+            if match.start() > pos:
+                self._text(html[pos:match.start()])
+            pos = match.end()
+            tag = match.group(2)
+            if tag is None:
+                continue
+            if match.group(1):
+                self._end_tag(tag.lower())
+            else:
+                attrs = match.group(3)
+                self._start_tag(tag.lower(), attrs)
+                if attrs.endswith('/') and tag.lower() not in _VOID_TAGS:
+                    self._end_tag(tag.lower())
+        if pos < len(html):
+            self._text(html[pos:])
+
+    def close(self) -> None:
+        """Flush open blocks and finish document.xml"""
+        self._finish_paragraph()
+        while self._tables:
+            self._close_table()
+        self._flush_buffer()
+
+    def _start_tag(self, tag: str, attrs: str) -> None:
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth += 1
+            return
+        if self._skip_depth:
+            return
+
+        if tag == 'br':
+            self._ensure_paragraph()
+            self._paragraph["runs"].append('<w:r><w:br/></w:r>')
+            return
+        if tag in _VOID_TAGS:
+            return
+
+        own = parse_css(attrs)
+        inherited = dict(self._stack[-1][1])
+        inherited.update({k: v for k, v in own.items() if k in _INHERITED})
+        if tag in _BOLD_TAGS:
+            inherited['font-weight'] = 'bold'
+        elif tag in _ITALIC_TAGS:
+            inherited['font-style'] = 'italic'
+        elif tag == 'u':
+            inherited['text-decoration'] = 'underline'
+        self._stack.append((tag, inherited))
+
+        if tag in ('ul', 'ol'):
+            self._lists.append({"ordered": tag == 'ol', "count": 0})
+        elif tag == 'table':
+            self._finish_paragraph()
+            self._tables.append({"css": own, "started": False, "row": None})
+        elif tag == 'tr' and self._tables:
+            self._finish_paragraph()
+            self._tables[-1]["row"] = []
+        elif tag in ('td', 'th') and self._tables and self._tables[-1]["row"] is not None:
+            self._finish_paragraph()
+            span = _COLSPAN_RE.search(attrs)
+            self._cells.append({"css": own, "span": int(span.group(1)) if span else 1, "parts": []})
+        elif tag in _BLOCK_TAGS:
+            # 外层块还没有正文（如 <li><p>、<div><p>）时并入内层块，避免产生空段落
+            carried = []
+            if self._paragraph is not None and self._paragraph["fresh"]:
+                carried = self._paragraph["runs"]
+                self._paragraph = None
+            self._finish_paragraph()
+            self._open_paragraph(tag, own)
+            self._paragraph["runs"].extend(carried)
+            if tag == 'li' and self._lists:
+                current = self._lists[-1]
+                current["count"] += 1
+                marker = f'{current["count"]}. ' if current["ordered"] else '• '
+                self._paragraph["runs"].append(self._run(marker, inherited))
+
+    def _end_tag(self, tag: str) -> None:
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+            return
+        if self._skip_depth or tag in _VOID_TAGS:
+            return
+        if not any(open_tag == tag for open_tag, _ in self._stack[1:]):
+            return
+
+        # 与 HTMLStreamProcessor 一致：弹出到匹配的开始标签为止，隐式关闭未闭合的元素
+        while len(self._stack) > 1:
+            open_tag, _ = self._stack.pop()
+            self._close_element(open_tag)
+            if open_tag == tag:
+                break
+
+    def _close_element(self, tag: str) -> None:
+        if tag in ('ul', 'ol'):
+            if self._lists:
+                self._lists.pop()
+        elif tag in ('td', 'th'):
+            self._close_cell()
+        elif tag == 'tr':
+            self._close_row()
+        elif tag == 'table':
+            self._close_table()
+        elif tag in _BLOCK_TAGS:
+            self._finish_paragraph()
+
+    def _text(self, raw: str) -> None:
+        if self._skip_depth:
+            return
+        text = _WHITESPACE_RE.sub(' ', html_lib.unescape(raw))
+        if self._paragraph is None:
+            text = text.lstrip()
+            # 表格结构之间（不在单元格内）的空白没有意义
+            if not text or (self._tables and not self._cells):
+                return
+            self._ensure_paragraph()
+        elif self._paragraph["fresh"]:
+            text = text.lstrip()
+            if not text:
+                return
+        self._paragraph["fresh"] = False
+        self._paragraph["runs"].append(self._run(text, self._stack[-1][1]))
+
+    # ---- paragraphs and runs ----
+
+    def _ensure_paragraph(self) -> None:
+        if self._paragraph is None:
+            self._open_paragraph(None, {})
+
+    def _open_paragraph(self, tag: Optional[str], own: Dict[str, str]) -> None:
+        css = self._stack[-1][1]
+        font_size = _length_pt(css.get('font-size', ''), DEFAULT_FONT_SIZE) or DEFAULT_FONT_SIZE
+        props = []
+        level = _HEADING_TAGS.get(tag or '')
+        if level:
+            props.append(f'<w:pStyle w:val="Heading{level}"/>')
+        if 'border-bottom' in own or 'border-top' in own:
+            borders = _border_xml('top', own.get('border-top', '')) + _border_xml('bottom', own.get('border-bottom', ''))
+            if borders:
+                props.append(f'<w:pBdr>{borders}</w:pBdr>')
+
+        line_height = css.get('line-height', '')
+        if line_height:
+            match = _LENGTH_RE.search(line_height)
+            if match and match.group(2) in ('pt', 'px'):
+                props.append(f'<w:spacing w:line="{int(_length_pt(line_height) * 20)}" w:lineRule="exact"/>')
+            elif match and match.group(2) == '%':
+                props.append(f'<w:spacing w:line="{int(float(match.group(1)) * 2.4)}" w:lineRule="auto"/>')
+            elif match:
+                props.append(f'<w:spacing w:line="{int(float(match.group(1)) * 240)}" w:lineRule="auto"/>')
+
+        indent = []
+        left = own.get('padding-left') or own.get('margin-left')
+        if left:
+            left_pt = _length_pt(left, font_size)
+            if left_pt:
+                indent.append(f'w:left="{int(left_pt * 20)}"')
+        text_indent = css.get('text-indent', '')
+        if text_indent:
+            indent_pt = _length_pt(text_indent, font_size)
+            if indent_pt and indent_pt > 0:
+                indent.append(f'w:firstLine="{int(indent_pt * 20)}"')
+            elif indent_pt and indent_pt < 0:
+                indent.append(f'w:hanging="{int(-indent_pt * 20)}"')
+        if indent:
+            props.append(f'<w:ind {" ".join(indent)}/>')
+
+        alignment = _ALIGNMENTS.get(css.get('text-align', '').lower())
+        if alignment:
+            props.append(f'<w:jc w:val="{alignment}"/>')
+
+        # fresh: 还没有正文文本，开头的空白需要去掉
+        self._paragraph = {"props": ''.join(props), "runs": [], "fresh": True}
+
+    def _finish_paragraph(self) -> None:
+        paragraph, self._paragraph = self._paragraph, None
+        if paragraph is None:
+            return
+        props = f'<w:pPr>{paragraph["props"]}</w:pPr>' if paragraph["props"] else ''
+        self._emit(f'<w:p>{props}{"".join(paragraph["runs"])}</w:p>')
+
+    @staticmethod
+    def _run(text: str, css: Dict[str, str]) -> str:
+        props = []
+        family = css.get('font-family', '')
+        if family:
+            fonts = [f.strip().strip('"\'') for f in family.split(',')]
+            fonts = [f for f in fonts if f and f.lower() not in _GENERIC_FONTS]
+            if fonts:
+                name = _escape(fonts[0]).replace('"', '&quot;')
+                props.append(f'<w:rFonts w:ascii="{name}" w:hAnsi="{name}" w:eastAsia="{name}" w:cs="{name}"/>')
+        weight = css.get('font-weight', '').lower()
+        if weight in ('bold', 'bolder') or (weight.isdigit() and int(weight) >= 600):
+            props.append('<w:b/>')
+        if css.get('font-style', '').lower() == 'italic':
+            props.append('<w:i/>')
+        color = css.get('color', '')
+        if color.startswith('#') and len(color) == 7:
+            props.append(f'<w:color w:val="{color[1:].upper()}"/>')
+        size = _length_pt(css.get('font-size', ''))
+        if size:
+            half_points = int(round(size * 2))
+            props.append(f'<w:sz w:val="{half_points}"/><w:szCs w:val="{half_points}"/>')
+        if 'underline' in css.get('text-decoration', ''):
+            props.append('<w:u w:val="single"/>')
+        run_props = f'<w:rPr>{"".join(props)}</w:rPr>' if props else ''
+        return f'<w:r>{run_props}<w:t xml:space="preserve">{_escape(text)}</w:t></w:r>'
+
+    # ---- tables ----
+
+    def _close_cell(self) -> None:
+        if not self._cells:
+            return
+        self._finish_paragraph()
+        cell = self._cells.pop()
+        parts = cell["parts"]
+        # 单元格必须以段落结尾
+        if not parts or parts[-1].endswith('</w:tbl>'):
+            parts.append('<w:p/>')
+        css = cell["css"]
+        borders = ''
+        if css.get('border'):
+            borders = ''.join(_border_xml(side, css['border']) for side in ('top', 'left', 'bottom', 'right'))
+        borders += _border_xml('top', css.get('border-top', '')) + _border_xml('bottom', css.get('border-bottom', ''))
+        props = '<w:tcW w:w="0" w:type="auto"/>'
+        if cell["span"] > 1:
+            props += f'<w:gridSpan w:val="{cell["span"]}"/>'
+        if borders:
+            props += f'<w:tcBorders>{borders}</w:tcBorders>'
+        row = self._tables[-1]["row"] if self._tables else None
+        if row is not None:
+            row.append((cell["span"], f'<w:tc><w:tcPr>{props}</w:tcPr>{"".join(parts)}</w:tc>'))
+
+    def _close_row(self) -> None:
+        if not self._tables:
+            return
+        table = self._tables[-1]
+        row, table["row"] = table["row"], None
+        if not row:
+            return
+        if not table["started"]:
+            self._start_table(table, sum(span for span, _ in row))
+        self._emit(f'<w:tr>{"".join(cell for _, cell in row)}</w:tr>')
+
+    def _start_table(self, table: Dict[str, Any], columns: int) -> None:
+        """表格在第一行结束时才开始输出，此时已知列数"""
+        css = table["css"]
+        borders = ''
+        if css.get('border'):
+            borders = ''.join(
+                _border_xml(side, css['border'])
+                for side in ('top', 'left', 'bottom', 'right', 'insideH', 'insideV')
+            )
+        borders += _border_xml('top', css.get('border-top', '')) + _border_xml('bottom', css.get('border-bottom', ''))
+        props = '<w:tblW w:w="5000" w:type="pct"/>'
+        if borders:
+            props += f'<w:tblBorders>{borders}</w:tblBorders>'
+        if css.get('margin', '').endswith('auto') or css.get('text-align') == 'center':
+            props += '<w:jc w:val="center"/>'
+        width = TEXT_WIDTH // max(columns, 1)
+        grid = ''.join(f'<w:gridCol w:w="{width}"/>' for _ in range(columns))
+        self._emit(f'<w:tbl><w:tblPr>{props}</w:tblPr><w:tblGrid>{grid}</w:tblGrid>')
+        table["started"] = True
+
+    def _close_table(self) -> None:
+        if not self._tables:
+            return
+        if self._tables[-1]["row"] is not None:
+            self._close_row()
+        table = self._tables.pop()
+        if table["started"]:
+            self._emit('</w:tbl>')
+
+
+def export_docx(html_content: str, output_path: Union[str, BinaryIO]) -> Union[str, BinaryIO]:
+    """
+    Convert processed HTML into a .docx package at output_path (a path or a writable binary file)
+    (module-level so it can run in a worker process).
+
+    Returns:
+        The output path
+    """
+    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml', CONTENT_TYPES_XML)
+        package.writestr('_rels/.rels', PACKAGE_RELS_XML)
+        package.writestr('word/_rels/document.xml.rels', DOCUMENT_RELS_XML)
+        package.writestr('word/styles.xml', STYLES_XML)
+        with package.open('word/document.xml', 'w', force_zip64=True) as stream:
+            stream.write(DOCUMENT_START.encode('utf-8'))
+            writer = DocxStreamWriter(stream)
+            writer.feed(html_content)
+            writer.close()
+            stream.write(DOCUMENT_END.encode('utf-8'))
+    return output_path
+
+
+def export_docx_zip(documents: List[Tuple[str, str]]) -> bytes:
+    """
+    Package several processed HTML documents as .docx files in one zip archive.
+
+    Args:
+        documents: (file name inside the archive, processed HTML) pairs
+
+    Returns:
+        The zip archive bytes
+    """
+    archive_buffer = io.BytesIO()
+    # .docx 本身已压缩，外层只做存储
+    with zipfile.ZipFile(archive_buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for name, html_content in documents:
+            document = io.BytesIO()
+            export_docx(html_content, document)
+            archive.writestr(name, document.getvalue())
+    return archive_buffer.getvalue()
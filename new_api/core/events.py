@@ -0,0 +1,46 @@
+"""
+Stream Events - 流水线内部传递的类型化事件，只在HTTP边界序列化一次为SSE。
+"""
+import json
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_json(data: Any) -> bytes:
+    """Encode to UTF-8 JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class Event:
+    """A typed pipeline event (start, llm_receiving, html_delta, llm_done, complete, error...)"""
+
+    __slots__ = ("type", "message", "data", "_sse")
+
+    def __init__(self, type: str, message: str = "", **data: Any):
+        self.type = type
+        self.message = message
+        self.data: Dict[str, Any] = data
+        self._sse: Optional[bytes] = None
+
+    @property
+    def html(self) -> Optional[str]:
+        """HTML payload carried by complete / html_delta events"""
+        return self.data.get("html")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, "message": self.message, **self.data}
+
+    def to_sse(self) -> bytes:
+        """Serialize as one SSE data frame (memoized, so events shared between subscribers encode once)"""
+        if self._sse is None:
+            self._sse = b"data: " + encode_json(self.to_dict()) + b"\n\n"
+        return self._sse
+
+    def __repr__(self) -> str:
+        return f"Event(type={self.type!r}, message={self.message!r}, keys={list(self.data)})"
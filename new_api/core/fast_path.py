@@ -0,0 +1,184 @@
+"""
+Fast Path - 规则可编译时不调用LLM，直接由启发式结构识别 + 规则样式表生成HTML。
+"""
+import re
+import time
+import logging
+from typing import AsyncGenerator, Any, Dict, List, Optional
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.events import Event
+from core.llm_service import LLMService, get_llm_service
+from core.rule_compiler import compile_rules
+from core.structure_renderer import StructureRenderer
+from core.worker_pool import get_worker_pool
+from models.schemas import HTMLParseResult
+from utils.text_utils import TABLE_CELL_SEPARATOR, looks_like_heading, split_text_blocks
+
+logger = logging.getLogger(__name__)
+
+# 标题编号 -> 标题级别
+_HEADING_LEVELS = [
+    (re.compile(r'^第[一二三四五六七八九十百零\d]+[章部篇]'), 1),
+    (re.compile(r'^第[一二三四五六七八九十百零\d]+节'), 2),
+    (re.compile(r'^[一二三四五六七八九十]+、'), 2),
+    (re.compile(r'^（[一二三四五六七八九十]+）'), 3),
+    (re.compile(r'^\d+\.\d+\.\d+'), 4),
+    (re.compile(r'^\d+\.\d+'), 3),
+]
+_LIST_ITEM_RE = re.compile(r'^\s*([•·●▪\-–*]|\(?\d+[)）]|[①-⑳])\s*')
+
+
+def _heading_level(block: str, index: int) -> Optional[int]:
+    """Heading level for a block, or None when it reads as body text"""
+    line = block.strip()
+    for pattern, level in _HEADING_LEVELS:
+        if pattern.match(line) and looks_like_heading(line):
+            return level
+    # 无编号的短行只在文档开头视为标题
+    if index == 0 and looks_like_heading(line):
+        return 1
+    return None
+
+
+def classify_blocks(text: str, hints: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Heuristically classify extracted text into DocumentElement dicts
+    (headings, paragraphs, lists and tables).
+
+    Args:
+        text: Extracted text, one block per line
+        hints: Optional blocks from extract_blocks_from_docx; their Word heading
+            levels and list numbering take precedence over the text heuristics
+    """
+    elements: List[Dict[str, Any]] = []
+    list_items: List[str] = []
+    hint_by_text = {
+        hint["text"].strip(): hint for hint in hints or []
+        if hint.get("heading_level") or hint.get("list")
+    }
+
+    def flush_list():
+        if list_items:
+            elements.append({"type": "list", "items": list(list_items)})
+            list_items.clear()
+
+    for index, block in enumerate(split_text_blocks(text)):
+        if TABLE_CELL_SEPARATOR in block:
+            flush_list()
+            rows = [[cell.strip() for cell in row.split(TABLE_CELL_SEPARATOR)] for row in block.split('\n')]
+            elements.append({"type": "table", "headers": rows[0], "rows": rows[1:]})
+            continue
+
+        hint = hint_by_text.get(block.strip(), {})
+        if hint.get("list") and not hint.get("heading_level"):
+            list_items.append(block.strip())
+            continue
+        if _LIST_ITEM_RE.match(block):
+            list_items.append(_LIST_ITEM_RE.sub('', block, count=1))
+            continue
+        flush_list()
+
+        level = min(hint["heading_level"], 4) if hint.get("heading_level") else _heading_level(block, index)
+        if level is not None:
+            elements.append({"type": "heading", "level": level, "text": block.strip()})
+        else:
+            elements.append({"type": "paragraph", "text": block.strip()})
+
+    flush_list()
+    return elements
+
+
+def format_with_rules(
+    text: str,
+    rules: str,
+    hints: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """
+    Format text from compiled rules and heuristic structure (module-level so it can run in a worker process).
+
+    Returns:
+        Dict with the rendered html and the element count
+    """
+    styles = compile_rules(rules)
+    if styles is None:
+        raise ValueError("排版规则无法编译")
+    elements = classify_blocks(text, hints)
+    html = StructureRenderer.render(HTMLParseResult(elements=elements, styles=styles))
+    return {"html": html, "elements": len(elements)}
+
+
+class RuleFormatter:
+    """Formats documents without the LLM when the rules compile to a style table"""
+
+    def __init__(
+        self,
+        llm_service: Optional[LLMService] = None,
+        hints: Optional[List[Dict[str, Any]]] = None
+    ):
+        self.llm = llm_service or get_llm_service()
+        self.hints = hints
+
+    def with_hints(self, hints: Optional[List[Dict[str, Any]]]) -> "RuleFormatter":
+        """Per-request formatter that uses DOCX heading/list hints when classifying"""
+        if not hints:
+            return self
+        return RuleFormatter(self.llm, hints)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.llm.config.get("rule_fast_path", True))
+
+    def can_handle(self, rules: str) -> bool:
+        """Whether the rules are fully understood by the rule compiler"""
+        return self.enabled and compile_rules(rules) is not None
+
+    async def format(self, text: str, rules: str) -> Dict[str, Any]:
+        """Render text on the worker pool (see format_with_rules)"""
+        return await get_worker_pool().run("render", format_with_rules, text, rules, self.hints)
+
+    async def analyze(self, text: str, rules: str) -> AsyncGenerator[Event, None]:
+        """
+        Fast-path counterpart of LLMService.analyze.
+
+        Yields:
+            Typed progress events, ending with a complete event carrying the rendered HTML
+        """
+        start_time = time.time()
+        yield self.llm._create_event("start", message="规则已识别，直接排版...", fast_path=True)
+
+        try:
+            result = await self.format(text, rules)
+        except Exception as e:
+            logger.exception("Rule-based formatting failed")
+            yield self.llm._create_event("error", message=str(e))
+            return
+
+        elapsed = round(time.time() - start_time, 3)
+        yield self.llm._create_event(
+            "complete",
+            message="分析完成",
+            html=result["html"],
+            fast_path=True,
+            elapsed=elapsed
+        )
+
+    async def analyze_async(self, text: str, rules: str) -> Dict[str, Any]:
+        """Fast-path counterpart of LLMService.analyze_async"""
+        try:
+            return {"success": True, "fast_path": True, **(await self.format(text, rules))}
+        except Exception as e:
+            logger.exception("Rule-based formatting failed")
+            return {"success": False, "error": str(e)}
+
+
+# Global formatter instance
+rule_formatter = RuleFormatter()
+
+
+def get_rule_formatter() -> RuleFormatter:
+    """Get the global rule formatter instance"""
+    return rule_formatter
@@ -2,23 +2,38 @@
 HTML Service - 处理LLM生成的HTML，提供后处理和Word兼容支持。
 替代原来的 word_service.py
 """
+import io
 import os
 import re
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 
+_BODY_OPEN_RE = re.compile(r'<body[^>]*>', re.IGNORECASE)
+_BODY_CLOSE_RE = re.compile(r'</body\s*>', re.IGNORECASE)
+_TAG_RE = re.compile(r'<(/?)([a-zA-Z][\w:-]*)[^>]*?(/?)>')
+_VOID_TAGS = frozenset({
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'source', 'track', 'wbr',
+})
+_FENCE_RE = re.compile(r'```(?:html)?')
+_STYLE_ATTR_RE = re.compile(r'\bstyle\s*=\s*(["\'])(.*?)\1', re.IGNORECASE | re.DOTALL)
+# 单次扫描的词法单元：注释、声明/处理指令和需要跟踪的标签。
+# 结束标签可省略的常见元素（p/td/th/li...）与空元素既不需要改写也不参与闭合检查，
+# 直接在正则层面跳过，避免逐个进入Python处理。
+_SKIPPED_TAGS = r'(?:p|td|th|li|dt|dd|br|hr|img|meta|col|wbr)'
+_TOKEN_RE = re.compile(
+    r'<!--.*?-->'
+    r'|<![^>]*>'
+    r'|<\?[^>]*>'
+    rf'|<(/?)(?!{_SKIPPED_TAGS}[\s/>])([a-zA-Z][\w:-]*)([^>]*)>',
+    re.DOTALL | re.IGNORECASE
+)
+# 结束标签可省略的元素，不参与闭合检查（<tr> 另行计数检查）
+_OPTIONAL_END_TAGS = frozenset({
+    'html', 'head', 'body', 'tr', 'thead', 'tbody', 'tfoot',
+    'colgroup', 'option', 'optgroup',
+})
 
-class HTMLPostProcessor:
-    """HTML后处理器 - 来自 word-to-html-tool"""
-    
-    @staticmethod
-    def ensure_complete_html(html_content: str) -> str:
-        """确保HTML文档结构完整"""
-        html_content = html_content.replace("```html", "").replace("```", "").strip()
-        
-        if html_content.lower().startswith("<!doctype") or html_content.lower().startswith("<html"):
-            return html_content
-        
-        return f"""<!DOCTYPE html>
+DOCUMENT_PREFIX = """<!DOCTYPE html>
 <html lang="zh-CN">
 <head>
     <meta charset="UTF-8">
@@ -26,64 +41,293 @@ class HTMLPostProcessor:
     <title>转换后的文档</title>
 </head>
 <body>
-{html_content}
+"""
+DOCUMENT_SUFFIX = """
 </body>
 </html>"""
-    
-    @staticmethod
-    def add_default_styles(html_content: str) -> str:
-        """添加默认样式以确保Word兼容性"""
-        if '<body' not in html_content:
-            return html_content
-        
-        body_match = re.search(r'<body([^>]*)>', html_content, re.IGNORECASE)
-        if body_match:
-            existing_attrs = body_match.group(1)
-            if 'style=' not in existing_attrs:
-                html_content = html_content.replace(
-                    body_match.group(0),
-                    f'<body{existing_attrs} style="font-family: SimSun, serif; font-size: 12pt; line-height: 1.5;">',
-                    1
-                )
-        
-        return html_content
-    
-    @staticmethod
-    def process_tables(html_content: str) -> str:
-        """处理表格样式以确保Word兼容性(三线表)"""
-        pattern = r'<table([^>]*)>'
-        replacement = r'<table\1 style="border-collapse: collapse; width: 100%;">'
-        return re.sub(pattern, replacement, html_content, flags=re.IGNORECASE)
-    
+BODY_STYLE = "font-family: SimSun, serif; font-size: 12pt; line-height: 1.5;"
+TABLE_STYLE = "border-collapse: collapse; width: 100%;"
+
+
+class HTMLStreamProcessor:
+    """
+    单次扫描的HTML后处理引擎。
+
+    可以分段 feed() 输入；在一次词法扫描内注入<body>默认样式和表格样式、
+    检查标签闭合，并把结果写入同一个输出缓冲区。
+    """
+
+    def __init__(self, rewrite: bool = True):
+        self.rewrite = rewrite
+        self._out = io.StringIO()
+        self._pending = ""
+        self._stack: List[str] = []
+        self._seen = set()
+        self._starts = {"table": 0, "tr": 0}
+        self._ends = {"table": 0, "tr": 0}
+        self._unclosed: List[str] = []
+
+    def feed(self, chunk: str) -> None:
+        """处理一段输入；末尾不完整的标签留到下一次"""
+        data = self._pending + chunk if self._pending else chunk
+        handle_tag = self._handle_tag
+        rewrite = self.rewrite
+        write = self._out.write
+        # 只有被改写的标签才单独写出，其余内容按原样整段复制
+        copied = 0
+        end = 0
+        for match in _TOKEN_RE.finditer(data):
+            end = match.end()
+            tag = match.group(2)
+            if tag is None:
+                continue
+            token = match.group(0)
+            new_token = handle_tag(match.group(1), tag.lower(), match.group(3), token)
+            if rewrite and new_token is not token:
+                write(data[copied:match.start()])
+                write(new_token)
+                copied = end
+
+        # 末尾未闭合的 '<' 可能是被截断的标签
+        incomplete = data.rfind('<', end)
+        if incomplete == -1 or data.find('>', incomplete) != -1:
+            incomplete = len(data)
+        if rewrite:
+            write(data[copied:incomplete])
+        self._pending = data[incomplete:]
+
+    def _handle_tag(self, is_close: str, tag: str, attrs: str, token: str) -> str:
+        if is_close:
+            if tag in self._ends:
+                self._ends[tag] += 1
+            if tag in self._stack:
+                while self._stack:
+                    open_tag = self._stack.pop()
+                    if open_tag == tag:
+                        break
+                    if open_tag not in _OPTIONAL_END_TAGS:
+                        self._unclosed.append(open_tag)
+            return token
+
+        self_closing = attrs.endswith('/')
+        if tag in ('html', 'head', 'body'):
+            self._seen.add(tag)
+        if tag in self._starts:
+            self._starts[tag] += 1
+            if self_closing:
+                self._ends[tag] += 1
+        if tag not in _VOID_TAGS and not self_closing:
+            self._stack.append(tag)
+
+        if self.rewrite and tag == 'body':
+            return self._with_style(token, attrs, BODY_STYLE, None)
+        if self.rewrite and tag == 'table':
+            return self._with_style(token, attrs, TABLE_STYLE, 'border-collapse')
+        return token
+
     @staticmethod
-    def validate(html_content: str) -> Tuple[bool, list]:
-        """简单验证HTML完整性"""
+    def _with_style(token: str, attrs: str, style: str, required: Optional[str]) -> str:
+        """没有style属性时添加；已有style但缺少 required 属性时把默认样式补在前面"""
+        match = _STYLE_ATTR_RE.search(attrs)
+        if match is None:
+            end = -2 if token.endswith('/>') else -1
+            return f'{token[:end].rstrip()} style="{style}"{token[end:]}'
+        if required is None or required in match.group(2).lower():
+            return token
+        quote, value = match.group(1), match.group(2)
+        new_attrs = f'{attrs[:match.start()]}style={quote}{style} {value}{quote}{attrs[match.end():]}'
+        return token.replace(attrs, new_attrs, 1)
+
+    def close(self) -> Tuple[str, bool, list]:
+        """
+        结束输入
+
+        Returns:
+            tuple: (处理后的HTML, 是否有效, 错误列表)
+        """
+        if self._pending:
+            if self.rewrite:
+                self._out.write(self._pending)
+            self._pending = ""
+
         errors = []
-        html_lower = html_content.lower()
-        
-        if "<html>" not in html_lower and "<html " not in html_lower:
+        if 'html' not in self._seen:
             errors.append("缺少<html>标签")
-        
-        if "<body>" not in html_lower and "<body " not in html_lower:
+        if 'body' not in self._seen:
             errors.append("缺少<body>标签")
-        
-        if "<head>" not in html_lower and "<head " not in html_lower:
+        if 'head' not in self._seen:
             errors.append("缺少<head>标签")
-        
-        if html_content.count("<table") != html_content.count("</table>"):
-            errors.append("<table>标签未正确闭合")
-        
-        if html_content.count("<tr") != html_content.count("</tr>"):
-            errors.append("<tr>标签未正确闭合")
-        
-        return len(errors) == 0, errors
-    
+        for tag in ("table", "tr"):
+            if self._starts[tag] != self._ends[tag]:
+                errors.append(f"<{tag}>标签未正确闭合")
+        unclosed = self._unclosed + [t for t in self._stack if t not in _OPTIONAL_END_TAGS]
+        for tag in dict.fromkeys(unclosed):
+            if tag not in ("table", "tr"):
+                errors.append(f"<{tag}>标签未正确闭合")
+
+        return self._out.getvalue(), len(errors) == 0, errors
+
+    @classmethod
+    def run(cls, html_content: str) -> Tuple[str, bool, list]:
+        """补全文档结构并完成单次扫描后处理"""
+        processor = cls()
+        content = _FENCE_RE.sub('', html_content).strip()
+        head = content[:16].lower()
+        if head.startswith("<!doctype") or head.startswith("<html"):
+            processor.feed(content)
+        else:
+            processor.feed(DOCUMENT_PREFIX)
+            processor.feed(content)
+            processor.feed(DOCUMENT_SUFFIX)
+        return processor.close()
+
+
+class HTMLBlockSplitter:
+    """
+    增量切分流式HTML：从LLM的增量输出中识别已经完整的顶层块级元素
+    （</p>、</h1>…</h6>、</table> 等），跳过文档外壳、<head> 和 <think> 内容。
+    """
+
+    # 这些元素的内容不属于正文，整体跳过
+    SKIP_CONTENT_TAGS = frozenset({'head', 'think', 'style', 'script', 'title'})
+    # 文档外壳标签本身不构成块
+    SHELL_TAGS = frozenset({'html', 'body'})
+
+    def __init__(self):
+        self._buffer = ""
+        self._scan = 0
+        self._depth = 0
+        self._block_start = 0
+        self._skip_tag: Optional[str] = None
+        # 已丢弃的缓冲区长度，用于换算绝对偏移
+        self._offset = 0
+        # 输入中最后一个完整顶层块的结束偏移（0 表示还没有完整的块）
+        self.complete_end = 0
+
+    def feed(self, delta: str) -> List[str]:
+        """加入一段增量输出，返回其中新完成的顶层块"""
+        self._buffer += delta
+        blocks: List[str] = []
+        buffer = self._buffer
+
+        for match in _TAG_RE.finditer(buffer, self._scan):
+            self._scan = match.end()
+            is_close, tag, self_closing = match.group(1), match.group(2).lower(), match.group(3)
+
+            if self._skip_tag is not None:
+                if is_close and tag == self._skip_tag:
+                    self._skip_tag = None
+                continue
+            if self._depth == 0:
+                if tag in self.SHELL_TAGS:
+                    continue
+                if not is_close and tag in self.SKIP_CONTENT_TAGS:
+                    self._skip_tag = tag
+                    continue
+                if is_close:
+                    continue
+                if tag in _VOID_TAGS or self_closing:
+                    if tag in ('hr', 'img'):
+                        blocks.append(match.group(0))
+                        self.complete_end = self._offset + match.end()
+                    continue
+                self._block_start = match.start()
+                self._depth = 1
+                continue
+
+            if tag in _VOID_TAGS or self_closing:
+                continue
+            if is_close:
+                self._depth -= 1
+                if self._depth == 0:
+                    blocks.append(buffer[self._block_start:match.end()])
+                    self.complete_end = self._offset + match.end()
+            else:
+                self._depth += 1
+
+        # 已输出的部分不再需要保留
+        if self._depth == 0 and self._skip_tag is None:
+            self._buffer = buffer[self._scan:]
+            self._offset += self._scan
+            self._scan = 0
+
+        return blocks
+
+
+class HTMLPostProcessor:
+    """HTML后处理器 - 来自 word-to-html-tool"""
+
+    @staticmethod
+    def ensure_complete_html(html_content: str) -> str:
+        """确保HTML文档结构完整"""
+        html_content = _FENCE_RE.sub('', html_content).strip()
+
+        head = html_content[:16].lower()
+        if head.startswith("<!doctype") or head.startswith("<html"):
+            return html_content
+
+        return f"{DOCUMENT_PREFIX}{html_content}{DOCUMENT_SUFFIX}"
+
+    @staticmethod
+    def process_block(block_html: str) -> str:
+        """单独后处理一个块级片段（注入表格样式），不补全文档结构"""
+        processor = HTMLStreamProcessor()
+        processor.feed(block_html)
+        html, _, _ = processor.close()
+        return html
+
+    @staticmethod
+    def validate(html_content: str) -> Tuple[bool, list]:
+        """验证HTML完整性（<html>/<head>/<body> 是否存在、标签是否正确闭合）"""
+        processor = HTMLStreamProcessor(rewrite=False)
+        processor.feed(html_content)
+        _, is_valid, errors = processor.close()
+        return is_valid, errors
+
+    @staticmethod
+    def extract_body(html_content: str) -> str:
+        """提取<body>内部内容，没有<body>时返回原内容"""
+        open_match = _BODY_OPEN_RE.search(html_content)
+        if not open_match:
+            return html_content.strip()
+        close_match = _BODY_CLOSE_RE.search(html_content, open_match.end())
+        end = close_match.start() if close_match else len(html_content)
+        return html_content[open_match.end():end].strip()
+
+    @staticmethod
+    def split_blocks(body_html: str) -> List[str]:
+        """将body内容切分为顶层块级元素列表（<p>、<h1>、<table>等）"""
+        blocks = []
+        depth = 0
+        start = 0
+        for match in _TAG_RE.finditer(body_html):
+            is_close, tag, self_closing = match.group(1), match.group(2).lower(), match.group(3)
+            if depth == 0 and not is_close:
+                text = body_html[start:match.start()].strip()
+                if text:
+                    blocks.append(text)
+                start = match.start()
+            if tag in _VOID_TAGS or self_closing:
+                if depth == 0:
+                    blocks.append(body_html[start:match.end()].strip())
+                    start = match.end()
+                continue
+            if is_close:
+                depth = max(depth - 1, 0)
+                if depth == 0:
+                    blocks.append(body_html[start:match.end()].strip())
+                    start = match.end()
+            else:
+                depth += 1
+        tail = body_html[start:].strip()
+        if tail:
+            blocks.append(tail)
+        return blocks
+
     @classmethod
     def process(cls, html_content: str) -> str:
-        """完整的后处理流程"""
-        html = cls.ensure_complete_html(html_content)
-        html = cls.add_default_styles(html)
-        html = cls.process_tables(html)
+        """完整的后处理流程（补全结构、注入body与表格样式）"""
+        html, _, _ = HTMLStreamProcessor.run(html_content)
         return html
     
     @staticmethod
@@ -115,9 +359,7 @@ class HTMLService:
         Returns:
             tuple: (处理后的HTML, 是否有效, 错误列表)
         """
-        processed = self.processor.process(html_content)
-        is_valid, errors = self.processor.validate(processed)
-        return processed, is_valid, errors
+        return HTMLStreamProcessor.run(html_content)
     
     def prepare_for_word_download(self, html_content: str) -> str:
         """
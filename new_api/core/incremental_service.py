@@ -0,0 +1,167 @@
+"""
+Incremental Formatting - 段落级增量排版。
+将文本切分为段落块，按 (段落, 规则, 模型, 温度) 哈希缓存每块的HTML片段，
+只把未见过的段落发送给LLM，最后按原顺序拼接。
+"""
+import time
+import asyncio
+import logging
+from typing import AsyncGenerator, Any, Dict, List, Optional
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.events import Event
+from core.llm_service import LLMService, get_llm_service
+from core.cache_service import ResultCache, get_result_cache
+from core.html_service import HTMLPostProcessor
+from utils.text_utils import split_text_blocks
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalFormatter:
+    """Formats only the blocks that have not been formatted before under the same rules"""
+
+    def __init__(
+        self,
+        llm_service: Optional[LLMService] = None,
+        cache: Optional[ResultCache] = None
+    ):
+        self.llm = llm_service or get_llm_service()
+        self.cache = cache or get_result_cache()
+
+    def _block_key(self, block: str, rules: str, model: str) -> str:
+        """Fragment cache key for one block under the given rules and model"""
+        return ResultCache.make_key(
+            "fragment",
+            block,
+            rules,
+            model,
+            self.llm.config.get("temperature", 0.3),
+            self.llm.config.get("output_mode", "html")
+        )
+
+    async def _format_run(self, blocks: List[str], keys: List[str], rules: str, model: str) -> str:
+        """
+        Format a contiguous run of uncached blocks and cache one fragment per block. When the
+        output does not map one-to-one onto the input, the blocks are retried one by one so
+        later edits inside the run can still reuse the unchanged paragraphs.
+        """
+        html = await self.llm.format_fragment('\n'.join(blocks), rules, model)
+        body = HTMLPostProcessor.extract_body(html)
+
+        if len(blocks) == 1:
+            await self.cache.aset(keys[0], {"html": body})
+            return body
+
+        parts = HTMLPostProcessor.split_blocks(body)
+        if len(parts) != len(blocks):
+            logger.info(f"增量排版片段块数不一致: 输入 {len(blocks)}, 输出 {len(parts)}，改为逐段排版")
+            parts = await asyncio.gather(*[
+                self._format_run([block], [key], rules, model) for block, key in zip(blocks, keys)
+            ])
+            return '\n'.join(parts)
+
+        for key, part in zip(keys, parts):
+            await self.cache.aset(key, {"html": part})
+        return body
+
+    async def format(self, text: str, rules: str) -> Dict[str, Any]:
+        """
+        Format text incrementally.
+
+        Returns:
+            Dict with stitched body html, total block count and reused block count
+        """
+        blocks = split_text_blocks(text)
+        # 按整篇文档选择模型，各段落与片段使用同一模型
+        model = self.llm._select_model(False, text, rules)
+        keys = [self._block_key(block, rules, model) for block in blocks]
+        fragments: List[Optional[str]] = []
+        for key in keys:
+            cached = await self.cache.aget(key)
+            fragments.append(cached["html"] if cached is not None else None)
+
+        # 收集连续的未缓存段落
+        runs: List[List[int]] = []
+        for index, fragment in enumerate(fragments):
+            if fragment is not None:
+                continue
+            if runs and runs[-1][-1] == index - 1:
+                runs[-1].append(index)
+            else:
+                runs.append([index])
+
+        results = await asyncio.gather(*[
+            self._format_run([blocks[i] for i in run], [keys[i] for i in run], rules, model)
+            for run in runs
+        ])
+
+        # 按原顺序拼接：每个连续片段的结果放在该片段首段的位置
+        pieces: List[str] = []
+        run_starts = {run[0]: html for run, html in zip(runs, results)}
+        for index, fragment in enumerate(fragments):
+            if fragment is not None:
+                pieces.append(fragment)
+            elif index in run_starts:
+                pieces.append(run_starts[index])
+
+        reused = sum(1 for fragment in fragments if fragment is not None)
+        return {
+            "html": '\n'.join(pieces),
+            "blocks": len(blocks),
+            "reused": reused,
+        }
+
+    async def analyze(self, text: str, rules: str) -> AsyncGenerator[Event, None]:
+        """
+        Incremental counterpart of LLMService.analyze.
+
+        Yields:
+            Typed progress events, ending with a complete event carrying the stitched HTML
+        """
+        start_time = time.time()
+        model, route = self.llm.choose_model(text, rules, stream=False)
+        yield self.llm._create_event("start", message="开始增量排版...", model=model, route=route)
+
+        try:
+            result = await self.format(text, rules)
+        except Exception as e:
+            logger.exception("Incremental formatting failed")
+            yield self.llm._create_event("error", message=str(e))
+            return
+
+        elapsed = round(time.time() - start_time, 2)
+        yield self.llm._create_event(
+            "llm_done",
+            message=f"LLM分析完成，复用 {result['reused']}/{result['blocks']} 个段落",
+            elapsed=elapsed
+        )
+        yield self.llm._create_event(
+            "complete",
+            message="分析完成",
+            html=result["html"],
+            blocks=result["blocks"],
+            reused=result["reused"],
+            elapsed=elapsed
+        )
+
+    async def analyze_async(self, text: str, rules: str) -> Dict[str, Any]:
+        """Incremental counterpart of LLMService.analyze_async"""
+        try:
+            result = await self.format(text, rules)
+            return {"success": True, **result}
+        except Exception as e:
+            logger.exception("Incremental formatting failed")
+            return {"success": False, "error": str(e)}
+
+
+# Global formatter instance
+incremental_formatter = IncrementalFormatter()
+
+
+def get_incremental_formatter() -> IncrementalFormatter:
+    """Get the global incremental formatter instance"""
+    return incremental_formatter
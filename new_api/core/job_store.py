@@ -0,0 +1,281 @@
+"""
+Job Store - 后台排版任务的持久化：任务状态和事件保存在本地SQLite中，
+客户端断线重连后可按事件序号（Last-Event-ID）补发错过的事件，或轮询最终结果。
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.settings import get_jobs_config
+from core.events import Event, encode_json
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = frozenset({DONE, FAILED})
+
+
+class JobStore:
+    """SQLite-backed job state and event log, with in-process wakeups for live followers"""
+
+    INTERRUPTED = "任务已中断，请重新提交"
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or get_jobs_config().model_dump()
+        self.db_path = self.config.get("db_path") or "data/jobs.db"
+        self.ttl_seconds = int(self.config.get("ttl_seconds", 24 * 3600))
+        self.stale_seconds = int(self.config.get("stale_seconds", 600))
+
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        # 等待者及其所属事件循环：写入可能在工作线程中完成，唤醒需切回事件循环
+        self._waiters: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = {}
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        """Lazily opened connection (the file is created on first use, not on import)"""
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            # WAL: 轮询读取不阻塞事件写入；NORMAL 避免每个事件都 fsync
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at REAL NOT NULL, "
+                "updated_at REAL NOT NULL, result TEXT, error TEXT)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                "job_id TEXT NOT NULL, seq INTEGER NOT NULL, data TEXT NOT NULL, "
+                "PRIMARY KEY (job_id, seq))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs (updated_at)")
+            db.commit()
+            self._db = db
+        return self._db
+
+    def create(self) -> str:
+        """Register a new pending job and return its id (expired jobs are purged on the way)"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            self.db.execute(
+                "INSERT INTO jobs (id, status, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (job_id, PENDING, now, now)
+            )
+            self.db.commit()
+        return job_id
+
+    def _purge(self, now: float) -> None:
+        expired = now - self.ttl_seconds
+        self.db.execute(
+            "DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs WHERE updated_at < ?)", (expired,)
+        )
+        self.db.execute("DELETE FROM jobs WHERE updated_at < ?", (expired,))
+
+    def _check_stale(self, job_id: str, status: str, updated_at: float) -> str:
+        """Fail a pending/running job that has gone quiet for stale_seconds, returning the effective status"""
+        if status not in FINISHED and time.time() - updated_at > self.stale_seconds:
+            # 进程重启或崩溃后，未完成的任务不会再有进展
+            self.finish(job_id, FAILED, error=self.INTERRUPTED)
+            return FAILED
+        return status
+
+    def status(self, job_id: str) -> Optional[str]:
+        """Current status of a job, or None when it does not exist (or has expired)"""
+        with self._lock:
+            row = self.db.execute("SELECT status, updated_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return self._check_stale(job_id, *row)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job state as a dict (status, timestamps, last event id, result or error), or None"""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT status, created_at, updated_at, result, error, "
+                "(SELECT COALESCE(MAX(seq), 0) FROM job_events WHERE job_id = jobs.id) "
+                "FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        status, created_at, updated_at, result, error, last_event_id = row
+        checked = self._check_stale(job_id, status, updated_at)
+        if checked != status:
+            status, error = checked, self.INTERRUPTED
+
+        job = {
+            "job_id": job_id,
+            "status": status,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "last_event_id": last_event_id,
+        }
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error is not None:
+            job["error"] = error
+        return job
+
+    def append(self, job_id: str, event: Event) -> int:
+        """Persist an event and wake followers; returns its sequence number (the SSE id)"""
+        return self.append_many(job_id, [event])
+
+    def append_many(self, job_id: str, events: List[Event]) -> int:
+        """
+        Persist events in one transaction and wake followers; returns the last sequence number.
+        Safe to call from a worker thread.
+        """
+        now = time.time()
+        with self._lock:
+            seq = self.db.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM job_events WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            rows = []
+            for event in events:
+                seq += 1
+                rows.append((job_id, seq, encode_json(event.to_dict()).decode("utf-8")))
+            self.db.executemany("INSERT INTO job_events (job_id, seq, data) VALUES (?, ?, ?)", rows)
+            self.db.execute(
+                "UPDATE jobs SET status = CASE WHEN status = ? THEN ? ELSE status END, updated_at = ? WHERE id = ?",
+                (PENDING, RUNNING, now, job_id)
+            )
+            self.db.commit()
+        self._notify(job_id)
+        return seq
+
+    def events_after(self, job_id: str, seq: int) -> List[Tuple[int, str]]:
+        """Stored events with a sequence number above seq, as (seq, JSON) pairs"""
+        with self._lock:
+            return self.db.execute(
+                "SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, seq)
+            ).fetchall()
+
+    def finish(
+        self,
+        job_id: str,
+        status: str,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None
+    ) -> None:
+        """
+        Record the final state of a job. A job that already finished keeps its state, so a job
+        marked interrupted by the stale check is not reported as done later on.
+        """
+        with self._lock:
+            self.db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? "
+                "WHERE id = ? AND status NOT IN (?, ?)",
+                (
+                    status,
+                    encode_json(result).decode("utf-8") if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                    DONE,
+                    FAILED
+                )
+            )
+            self.db.commit()
+        self._notify(job_id)
+
+    def touch(self, job_id: str) -> None:
+        """Mark an unfinished job as still alive, so the stale check leaves it alone"""
+        with self._lock:
+            self.db.execute(
+                "UPDATE jobs SET updated_at = ? WHERE id = ? AND status NOT IN (?, ?)",
+                (time.time(), job_id, DONE, FAILED)
+            )
+            self.db.commit()
+
+    async def heartbeat(self, job_id: str) -> None:
+        """
+        Touch a job at a third of stale_seconds until cancelled; run it alongside the job's task,
+        which may sit in the scheduler queue or generate for a long time without storing events
+        """
+        interval = max(1.0, self.stale_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.touch, job_id)
+            except Exception:
+                logger.exception(f"更新任务心跳失败: {job_id}")
+
+    def _notify(self, job_id: str) -> None:
+        waiter = self._waiters.pop(job_id, None)
+        if waiter is not None:
+            loop, event = waiter
+            loop.call_soon_threadsafe(event.set)
+
+    async def wait(self, job_id: str, timeout: float) -> None:
+        """
+        Wait for the next event or state change of a job in this process. The timeout
+        bounds the delay for jobs running in another worker process, which cannot wake us.
+        """
+        waiter = self._waiters.get(job_id)
+        if waiter is None:
+            waiter = self._waiters[job_id] = (asyncio.get_running_loop(), asyncio.Event())
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class JobEventWriter:
+    """
+    Persists one job's events off the event loop. Events added while a write is in progress
+    are written together in the next transaction, so live followers see them without delay
+    and a fast event stream does not turn into one commit per event.
+    """
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+        self._pending: List[Event] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, event: Event) -> None:
+        """Queue an event for writing (returns immediately)"""
+        self._pending.append(event)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush())
+
+    async def _flush(self) -> None:
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self.store.append_many, self.job_id, batch)
+            except Exception:
+                logger.exception(f"保存任务事件失败: {self.job_id}")
+
+    async def close(self) -> None:
+        """Wait until every queued event is written"""
+        while self._task is not None and not self._task.done():
+            await self._task
+
+
+# Global job store instance
+job_store = JobStore()
+
+
+def get_job_store() -> JobStore:
+    """Get the global job store instance"""
+    return job_store
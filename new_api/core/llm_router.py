@@ -0,0 +1,274 @@
+"""
+LLM Router - 在多个 OpenAI 兼容端点之间路由请求。
+按权重选择主端点；流式请求的首个token超过按p95估算的截止时间时向下一个端点发出对冲请求，
+先返回者胜出、另一个被取消；失败时自动切换端点，连续失败的端点由熔断器暂时摘除。
+非流式请求的耗时是整个生成过程，对冲会使token开销翻倍，因此只做失败切换。
+"""
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Any, AsyncContextManager, Awaitable, Callable, Deque, Dict, List, Optional
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# 计算p95所需的最少样本数
+MIN_SAMPLES = 20
+
+
+def _is_client_error(error: BaseException) -> bool:
+    """4xx other than 429: the request itself is bad, another endpoint will not help"""
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status != 429
+
+
+class Endpoint:
+    """One upstream: its client, models, latency samples and circuit breaker state"""
+
+    def __init__(
+        self,
+        name: str,
+        client_factory: Callable[[], Any],
+        stream_model: str = "",
+        non_stream_model: str = "",
+        weight: float = 1.0
+    ):
+        self.name = name
+        self._client_factory = client_factory
+        self.stream_model = stream_model
+        self.non_stream_model = non_stream_model
+        self.weight = max(weight, 0.0)
+        # 流式请求记录首个token延迟，非流式记录完整响应延迟
+        self.latencies: Dict[str, Deque[float]] = {"stream": deque(maxlen=200), "complete": deque(maxlen=200)}
+        self.failures = 0
+        self.open_until = 0.0
+
+    @property
+    def client(self):
+        return self._client_factory()
+
+    def model(self, stream: bool, default: str) -> str:
+        """This endpoint's name for the default model, or the default itself when none is configured"""
+        return (self.stream_model if stream else self.non_stream_model) or default
+
+    @property
+    def available(self) -> bool:
+        """False while the circuit breaker is open"""
+        return time.monotonic() >= self.open_until
+
+    def p95(self, kind: str) -> Optional[float]:
+        samples = self.latencies[kind]
+        if len(samples) < MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def record_success(self, kind: str, latency: float) -> None:
+        self.latencies[kind].append(latency)
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self, threshold: int, cooldown: float) -> None:
+        self.failures += 1
+        if self.failures >= threshold:
+            # 半开状态下再次失败会重新熔断
+            if self.available:
+                get_metrics().incr("llm_breaker_open")
+                logger.warning(f"LLM端点 {self.name} 连续失败 {self.failures} 次，熔断 {cooldown:g}s")
+            self.open_until = time.monotonic() + cooldown
+
+
+class RoutedStream:
+    """A winning streaming response: the chunks read while racing, then the rest of the stream"""
+
+    def __init__(self, endpoint: Endpoint, model: str, response: Any, iterator: Any, buffered: List[Any]):
+        self.endpoint = endpoint
+        self.model = model
+        self._response = response
+        self._iterator = iterator
+        self._buffered = buffered
+
+    async def __aiter__(self):
+        for chunk in self._buffered:
+            yield chunk
+        self._buffered = []
+        async for chunk in self._iterator:
+            yield chunk
+
+    async def close(self) -> None:
+        await self._response.close()
+
+
+class LLMRouter:
+    """Weighted routing, hedged requests, failover and circuit breaking across endpoints"""
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        config: Optional[Dict[str, Any]] = None,
+        hedge_slot: Optional[Callable[[], AsyncContextManager]] = None
+    ):
+        """
+        Args:
+            endpoints: Upstreams to route across
+            config: LLM configuration (hedge_* and breaker_* keys)
+            hedge_slot: Context manager factory for the extra upstream slot a hedged attempt
+                holds while racing (the caller already holds one for the primary)
+        """
+        if not endpoints:
+            raise ValueError("至少需要一个LLM端点")
+        self.endpoints = endpoints
+        self.config = config or {}
+        self.hedge_slot = hedge_slot
+        self.hedge_enabled = bool(self.config.get("hedge_enabled", True))
+        self.hedge_delay = float(self.config.get("hedge_delay", 8.0))
+        self.hedge_min_delay = float(self.config.get("hedge_min_delay", 1.0))
+        self.breaker_failures = max(1, int(self.config.get("breaker_failures", 3)))
+        self.breaker_cooldown = float(self.config.get("breaker_cooldown", 30.0))
+
+    def ranked(self) -> List[Endpoint]:
+        """
+        Endpoints in try order: a weighted-random primary, then the rest by recent latency.
+        Endpoints with an open breaker are skipped unless all of them are open.
+        """
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.available]
+        if not candidates:
+            # 全部熔断时按最早恢复的顺序尝试，而不是直接失败
+            return sorted(self.endpoints, key=lambda endpoint: endpoint.open_until)
+
+        weights = [endpoint.weight for endpoint in candidates]
+        if sum(weights) > 0:
+            primary = random.choices(candidates, weights=weights)[0]
+        else:
+            primary = candidates[0]
+        rest = [endpoint for endpoint in candidates if endpoint is not primary]
+        rest.sort(key=lambda endpoint: endpoint.p95("stream") or float("inf"))
+        return [primary] + rest
+
+    def model_for(self, endpoint: Endpoint, stream: bool, model: str) -> str:
+        """
+        The model sent to an endpoint. A model picked by the routing table is sent as-is;
+        only the top-level default is replaced by the endpoint's own model name.
+        """
+        default = self.config.get("stream_model" if stream else "non_stream_model") or ""
+        if model and model != default:
+            return model
+        return endpoint.model(stream, model)
+
+    def deadline(self, endpoint: Endpoint, kind: str) -> float:
+        """Seconds to wait on an endpoint before hedging"""
+        p95 = endpoint.p95(kind)
+        if p95 is None:
+            return self.hedge_delay
+        return max(self.hedge_min_delay, p95)
+
+    async def _timed(self, endpoint: Endpoint, kind: str, attempt: Callable[[Endpoint], Awaitable[Any]]) -> Any:
+        start = time.monotonic()
+        result = await attempt(endpoint)
+        endpoint.record_success(kind, time.monotonic() - start)
+        return result
+
+    async def _hedged(self, endpoint: Endpoint, kind: str, attempt: Callable[[Endpoint], Awaitable[Any]]) -> Any:
+        """A hedged attempt counts against the upstream concurrency limit while it races"""
+        if self.hedge_slot is None:
+            return await self._timed(endpoint, kind, attempt)
+        async with self.hedge_slot():
+            return await self._timed(endpoint, kind, attempt)
+
+    async def _race(self, kind: str, attempt: Callable[[Endpoint], Awaitable[Any]], hedge: bool = True) -> Any:
+        """
+        Run attempt on the primary endpoint; hedge to the next one after the deadline (when
+        hedge is set) and fail over on errors. The first successful attempt wins and the others
+        are cancelled.
+        """
+        candidates = self.ranked()
+        primary = candidates[0]
+        pending: Dict[asyncio.Task, Endpoint] = {}
+        last_error: Optional[BaseException] = None
+
+        def launch(hedged: bool = False) -> None:
+            endpoint = candidates.pop(0)
+            run = self._hedged if hedged else self._timed
+            pending[asyncio.ensure_future(run(endpoint, kind, attempt))] = endpoint
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if hedge and self.hedge_enabled and candidates and len(pending) == 1:
+                    timeout = self.deadline(next(iter(pending.values())), kind)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    get_metrics().incr("llm_hedged")
+                    logger.info(f"LLM端点 {next(iter(pending.values())).name} 超过 {timeout:.1f}s 未响应，发出对冲请求")
+                    launch(hedged=True)
+                    continue
+
+                for task in done:
+                    endpoint = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if endpoint is not primary:
+                            get_metrics().incr("llm_secondary_won")
+                        return task.result()
+                    if _is_client_error(error):
+                        raise error
+                    last_error = error
+                    endpoint.record_failure(self.breaker_failures, self.breaker_cooldown)
+                    logger.warning(f"LLM端点 {endpoint.name} 调用失败: {error}")
+
+                if not pending and candidates:
+                    get_metrics().incr("llm_failover")
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+            # 同时完成但未被采用的流式响应也要关闭
+            for task in pending:
+                if not task.cancelled() and task.exception() is None and hasattr(task.result(), "close"):
+                    await task.result().close()
+
+        raise last_error
+
+    async def open_stream(self, model: str, **kwargs) -> RoutedStream:
+        """Start a streaming completion; the race is decided by the first content token"""
+
+        async def attempt(endpoint: Endpoint) -> RoutedStream:
+            endpoint_model = self.model_for(endpoint, True, model)
+            response = await endpoint.client.chat.completions.create(
+                model=endpoint_model, stream=True, **kwargs
+            )
+            iterator = response.__aiter__()
+            buffered = []
+            try:
+                async for chunk in iterator:
+                    buffered.append(chunk)
+                    if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                        break
+            except BaseException:
+                # 输掉对冲或出错时关闭到上游的连接
+                await response.close()
+                raise
+            return RoutedStream(endpoint, endpoint_model, response, iterator, buffered)
+
+        return await self._race("stream", attempt)
+
+    async def complete(self, model: str, **kwargs) -> Any:
+        """Run a non-streaming completion with failover (no hedging: latency is the whole generation)"""
+
+        async def attempt(endpoint: Endpoint) -> Any:
+            return await endpoint.client.chat.completions.create(
+                model=self.model_for(endpoint, False, model), **kwargs
+            )
+
+        return await self._race("complete", attempt, hedge=False)
@@ -4,9 +4,12 @@ LLM Service - Call LLM APIs to generate styled HTML from text.
 import os
 import re
 import time
-import json
+import asyncio
+import hashlib
 import logging
-from typing import AsyncGenerator, Dict, Any, Optional
+from functools import lru_cache
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Dict, Any, Optional, Tuple
 from pathlib import Path
 
 try:
@@ -19,10 +22,37 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from config.settings import get_llm_config
+from core.cache_service import ResultCache
+from core.structure_renderer import render_structure
+from core.html_service import HTMLBlockSplitter, HTMLPostProcessor
+from core.events import Event
+from core.metrics import get_metrics
+from core.llm_router import Endpoint, LLMRouter
+from utils.text_utils import estimate_tokens, rule_clauses, table_density
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=256)
+def _user_prompt_head(rules: str, instruction: str) -> str:
+    """User message up to the document text, compiled once per rules string"""
+    return f"## 用户排版规则\n{rules}\n\n{instruction}\n\n"
+
+
+@lru_cache(maxsize=4)
+def _prefix_id(system_prompt: str) -> str:
+    """Stable id of the static prompt prefix, sent as prompt_cache_key"""
+    return "wta-" + hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+# 续写输出开头可能重复的代码块标记、思考内容和文档外壳
+_CONTINUATION_PREFIX_RE = re.compile(
+    r'^\s*(?:```[a-z]*\s*\n)?(?:<think>.*?</think>\s*)?(?:<!DOCTYPE[^>]*>\s*)?(?:<html[^>]*>\s*)?'
+    r'(?:<head>.*?</head>\s*)?(?:<body[^>]*>\s*)?',
+    re.DOTALL | re.IGNORECASE
+)
+
+
 class LLMService:
     """Service for calling LLM APIs"""
 
@@ -80,19 +110,43 @@ class LLMService:
 ```
 
 ## 用户排版规则
-{rules}
+用户消息开头的「用户排版规则」优先于上面的样式示例。
 
 ## 输出要求
 1. 返回完整的HTML文档（包含 <!DOCTYPE html>、<html>、<head>、<body>）
 2. 所有样式使用内联 style 属性
 3. 保持文档原始结构和语义
 4. 不要包含 markdown 代码块标记
+"""
+
+    # Structure-only system prompt: the model returns DocumentElement JSON, styles are rendered server-side
+    STRUCTURE_SYSTEM_PROMPT = """
+你是一个专业的文档排版助手。请识别文档结构，并根据排版规则给出样式表。只输出一个JSON对象，不要输出HTML。
+
+## JSON格式
+{"styles": {"h1": {"font": "黑体", "size": 22, "bold": true, "alignment": "center"},
+  "paragraph": {"font": "宋体", "size": 12, "indent": true, "line_height": 1.5}},
+ "elements": [{"type": "heading", "level": 1, "text": "标题内容"},
+  {"type": "paragraph", "text": "段落内容"},
+  {"type": "table", "headers": ["表头"], "rows": [["内容"]]},
+  {"type": "list", "items": ["条目"]}]}
+
+## 说明
+- styles 的键：h1、h2、h3、h4、paragraph、list、table_header、table_cell、authors
+- 样式字段：font（字体）、size（磅值，四号=14, 小四=12, 五号=10.5）、bold、alignment（left/center/right/justify）、indent（首行缩进）、line_height（行距倍数）
+- element.type 取值：heading（level 1-4）、paragraph、list、ordered_list、table、keywords、authors
+- 只有与样式表不同的元素才单独写 font/size/bold/alignment/indent 字段
+- 严禁重写、改写、扩写原文内容，严禁改变段落顺序，text 必须与原文一致
+- 样式表按用户消息开头的「用户排版规则」确定
 """
 
     def __init__(self, config: Optional[Dict[str, Any]] = None):
         """Initialize LLM service with configuration"""
         self.config = config or get_llm_config().model_dump()
         self._client = None
+        self._async_client = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._router: Optional[LLMRouter] = None
         # 日志目录，仅用于本地开发调试，部署环境使用控制台输出
         self._log_dir = os.getenv("LOG_DIR", "logs")
 
@@ -106,14 +160,240 @@ class LLMService:
             )
         return self._client
 
+    @property
+    def async_client(self):
+        """Lazy initialization of the shared AsyncOpenAI client (one connection pool per service)"""
+        if self._async_client is None and openai is not None:
+            self._async_client = openai.AsyncOpenAI(
+                api_key=self.config.get("api_key", ""),
+                base_url=self.config.get("base_url", ""),
+                timeout=self.config.get("timeout", 120)
+            )
+        return self._async_client
+
+    def _endpoint_client_factory(self, endpoint_config: Dict[str, Any]):
+        """Lazily created AsyncOpenAI client for an extra endpoint (settings fall back to the top level)"""
+        clients = []
+
+        def factory():
+            if not clients and openai is not None:
+                clients.append(openai.AsyncOpenAI(
+                    api_key=endpoint_config.get("api_key") or self.config.get("api_key", ""),
+                    base_url=endpoint_config.get("base_url") or self.config.get("base_url", ""),
+                    timeout=self.config.get("timeout", 120)
+                ))
+            return clients[0] if clients else None
+
+        return factory
+
+    @property
+    def router(self) -> LLMRouter:
+        """Routes calls across the configured endpoints (a single default endpoint when none are listed)"""
+        if self._router is None:
+            endpoint_configs = self.config.get("endpoints") or []
+            if endpoint_configs:
+                endpoints = [
+                    Endpoint(
+                        name=cfg.get("name") or cfg.get("base_url") or f"endpoint-{index}",
+                        client_factory=self._endpoint_client_factory(cfg),
+                        stream_model=cfg.get("stream_model", ""),
+                        non_stream_model=cfg.get("non_stream_model", ""),
+                        weight=float(cfg.get("weight", 1.0))
+                    )
+                    for index, cfg in enumerate(endpoint_configs)
+                ]
+            else:
+                endpoints = [Endpoint(name="default", client_factory=lambda: self.async_client)]
+            self._router = LLMRouter(endpoints, self.config, hedge_slot=self._hedge_slot)
+        return self._router
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Limits concurrent upstream requests (max_concurrency)"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, int(self.config.get("max_concurrency", 8))))
+        return self._semaphore
+
+    @asynccontextmanager
+    async def _hedge_slot(self):
+        """Extra upstream slot held by a hedged attempt while it races the primary"""
+        async with self.semaphore:
+            yield
+
+    @asynccontextmanager
+    async def _upstream_slot(self):
+        """Hold one of the limited upstream request slots for the duration of a call"""
+        async with self.semaphore:
+            try:
+                yield
+            except (asyncio.CancelledError, GeneratorExit):
+                # 客户端已断开：上游请求随之中止，释放并发槽位
+                get_metrics().incr("llm_cancelled")
+                logger.info("LLM调用已取消")
+                raise
+
+    @property
+    def structure_mode(self) -> bool:
+        """Whether the model returns DocumentElement JSON instead of HTML"""
+        return self.config.get("output_mode", "html") == "structure"
+
     @property
     def system_prompt(self) -> str:
-        """Get the system prompt template"""
-        return self.DEFAULT_SYSTEM_PROMPT
+        """
+        The system prompt. It contains no per-request content, so every request starts with the
+        same bytes and providers can reuse the cached prefix; rules and text go in the user message.
+        """
+        return self.STRUCTURE_SYSTEM_PROMPT if self.structure_mode else self.DEFAULT_SYSTEM_PROMPT
+
+    @property
+    def prompt_cache_hint(self) -> str:
+        """Explicit prefix-cache hint sent upstream: empty, prompt_cache_key or cache_control"""
+        return self.config.get("prompt_cache_hint") or ""
+
+    def _system_message(self) -> Dict[str, Any]:
+        """System message, marked as a cache breakpoint for providers that need one"""
+        if self.prompt_cache_hint == "cache_control":
+            return {"role": "system", "content": [
+                {"type": "text", "text": self.system_prompt, "cache_control": {"type": "ephemeral"}}
+            ]}
+        return {"role": "system", "content": self.system_prompt}
+
+    # User instruction for partial documents: one block-level element per input block, no document shell
+    FRAGMENT_INSTRUCTION = (
+        "以下是文档的一个片段。请只输出与每个段落（表格整体视为一个段落）一一对应的HTML块级元素，"
+        "不要输出 <!DOCTYPE>、<html>、<head>、<body> 标签："
+    )
+
+    # Structure-mode counterpart: still JSON only, one element per input block (rendered to HTML blocks server-side)
+    STRUCTURE_FRAGMENT_INSTRUCTION = (
+        "以下是文档的一个片段。请仍只输出一个JSON对象，elements 与每个段落（表格整体视为一个段落）一一对应，"
+        "不要输出HTML："
+    )
+
+    def _build_messages(self, text: str, rules: str, fragment: bool = False) -> list:
+        """Build chat messages for a formatting request: static system prompt, then rules, then text"""
+        if fragment:
+            instruction = self.STRUCTURE_FRAGMENT_INSTRUCTION if self.structure_mode else self.FRAGMENT_INSTRUCTION
+        else:
+            instruction = "请对以下文本进行排版："
+        return [
+            self._system_message(),
+            {"role": "user", "content": _user_prompt_head(rules, instruction) + text}
+        ]
+
+    # Follow-up instruction after an output truncated by max_tokens
+    CONTINUE_INSTRUCTION = (
+        "上面的输出因长度限制被截断。请紧接着上文最后一个完整的块级元素继续输出剩余内容，"
+        "不要重复已输出的内容，不要重新输出 <!DOCTYPE>、<html>、<head>、<body> 标签，不要添加任何说明。"
+    )
+    STRUCTURE_CONTINUE_INSTRUCTION = "上面的JSON因长度限制被截断。请从中断处紧接着继续输出剩余部分，不要重复已输出的内容。"
+
+    def _generation_params(self, temperature: float) -> Dict[str, Any]:
+        """Sampling parameters shared by every call (max_tokens only when configured)"""
+        params: Dict[str, Any] = {"temperature": temperature}
+        if self.config.get("max_tokens"):
+            params["max_tokens"] = self.config["max_tokens"]
+        if self.prompt_cache_hint == "prompt_cache_key":
+            # extra_body 兼容不认识该参数的旧版 openai SDK
+            params["extra_body"] = {"prompt_cache_key": _prefix_id(self.system_prompt)}
+        return params
+
+    @staticmethod
+    def _record_usage(usage: Any) -> None:
+        """Count prompt tokens and the share served from the provider's prefix cache"""
+        if usage is None:
+            return
+        get_metrics().incr("llm_prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+        # DeepSeek 使用 prompt_cache_hit_tokens 字段
+        cached = cached or getattr(usage, "prompt_cache_hit_tokens", None) or 0
+        get_metrics().incr("llm_cached_prompt_tokens", cached)
+
+    def _continuation_messages(self, messages: list, content: str) -> list:
+        """Original messages plus the output so far and an instruction to carry on after it"""
+        instruction = self.STRUCTURE_CONTINUE_INSTRUCTION if self.structure_mode else self.CONTINUE_INSTRUCTION
+        return messages + [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": instruction}
+        ]
+
+    def _trim_to_block(self, content: str, text: str) -> Tuple[str, bool]:
+        """
+        Drop the trailing partial block of truncated HTML so the continuation resumes on a
+        block boundary. When this pass completed no top-level block (one oversized table) the
+        text is kept as is and the model resumes mid-element. JSON output is never trimmed.
 
-    def _get_system_content(self, rules: str) -> str:
-        """Generate system prompt with user rules"""
-        return self.system_prompt.format(rules=rules)
+        Args:
+            content: Output stitched so far
+            text: Truncated output of the latest pass
+
+        Returns:
+            (part of text to keep, whether it ends on a block boundary)
+        """
+        if self.structure_mode:
+            return text, False
+        splitter = HTMLBlockSplitter()
+        splitter.feed(content + text)
+        if splitter.complete_end <= len(content):
+            return text, False
+        return text[:splitter.complete_end - len(content)], True
+
+    def _strip_continuation(self, content: str, text: str, at_boundary: bool) -> str:
+        """Remove a repeated document shell, and a repeated last block, from the start of a continuation"""
+        if self.structure_mode:
+            return text
+        prefix = _CONTINUATION_PREFIX_RE.match(text)
+        if prefix.group(0).strip():
+            text = text[prefix.end():]
+        if at_boundary:
+            blocks = HTMLBlockSplitter().feed(text)
+            if blocks and content.rstrip().endswith(blocks[0]):
+                text = text[text.find(blocks[0]) + len(blocks[0]):]
+        return text
+
+    def _route(self, text: str, rules: str) -> Optional[Dict[str, Any]]:
+        """First model route whose limits the request is within, or None for the default models"""
+        routes = self.config.get("model_routes") or []
+        if not routes:
+            return None
+
+        features = (
+            ("max_tokens", estimate_tokens(text)),
+            ("max_table_density", table_density(text)),
+            ("max_rule_clauses", rule_clauses(rules)),
+        )
+        for route in routes:
+            if all(route.get(limit) is None or value <= route[limit] for limit, value in features):
+                return route
+        return None
+
+    def choose_model(self, text: str, rules: str, stream: bool) -> Tuple[str, str]:
+        """
+        Pick the model for a request from the routing table.
+
+        Returns:
+            (model, route name), the route name being "default" when no route matched
+        """
+        default = self.config.get("stream_model") if stream else self.config.get("non_stream_model")
+        route = self._route(text, rules)
+        if route is None:
+            return default, "default"
+        model = route.get("stream_model" if stream else "non_stream_model") or default
+        return model, route.get("name") or "route"
+
+    def _select_model(self, stream: bool, text: Optional[str] = None, rules: str = "") -> str:
+        """Pick the model for a streaming or non-streaming call, routed by the document when text is given"""
+        if text is None:
+            return self.config.get("stream_model") if stream else self.config.get("non_stream_model")
+        return self.choose_model(text, rules, stream)[0]
+
+    def cache_key(self, text: str, rules: str, stream: bool = True) -> str:
+        """Content-addressed result cache key for (text, rules, model, temperature)"""
+        return ResultCache.make_key(
+            text, rules, self._select_model(stream, text, rules), self.config.get("temperature", 0.3),
+            self.config.get("output_mode", "html")
+        )
 
     def _clean_html_response(self, content: str) -> str:
         """Clean LLM response by removing markdown code block markers and think tags"""
@@ -141,6 +421,13 @@ class LLMService:
 
         return cleaned.strip()
 
+    def _finalize_response(self, content: str) -> str:
+        """Clean the raw model output and, in structure mode, render it to inline-styled HTML"""
+        cleaned = self._clean_html_response(content)
+        if self.structure_mode:
+            return render_structure(cleaned)
+        return cleaned
+
     def _save_response(self, text: str, html: str) -> str:
         """Save LLM response to log file (local only) or return placeholder for cloud deployment"""
         # 在云部署环境下，LOG_DIR 可能为空或设为 /tmp
@@ -165,7 +452,7 @@ class LLMService:
         text: str,
         rules: str,
         stream: bool = True
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[Event, None]:
         """
         Analyze text with LLM and generate styled HTML.
 
@@ -175,24 +462,19 @@ class LLMService:
             stream: Whether to use streaming response
 
         Yields:
-            SSE formatted progress events
+            Typed progress events (serialized to SSE by the API layer)
         """
         if openai is None:
             yield self._create_event("error", message="OpenAI client not available")
             return
 
         start_time = time.time()
-        yield self._create_event("start", message="开始调用LLM分析...")
+        model, route = self.choose_model(text, rules, stream)
+        yield self._create_event("start", message="开始调用LLM分析...", model=model, route=route)
 
         try:
-            system_content = self._get_system_content(rules)
-            model = self.config.get("stream_model") if stream else self.config.get("non_stream_model")
             temperature = self.config.get("temperature", 0.3)
-
-            messages = [
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": f"请对以下文本进行排版：\n\n{text}"}
-            ]
+            messages = self._build_messages(text, rules)
 
             if stream:
                 async for event in self._stream_analysis(messages, model, temperature, start_time):
@@ -211,54 +493,114 @@ class LLMService:
         model: str,
         temperature: float,
         start_time: float
-    ) -> AsyncGenerator[str, None]:
-        """Handle streaming LLM response"""
-        content_chunks = []
+    ) -> AsyncGenerator[Event, None]:
+        """
+        Handle streaming LLM response. When the output stops at max_tokens, continuation
+        requests resume after the last complete block and are stitched onto the output.
+        """
+        content = ""
         chunk_count = 0
-
-        response = self.client.chat.completions.create(
-            model=model,
-            temperature=temperature,
-            messages=messages,
-            stream=True
-        )
+        # 结构化输出是JSON，无法逐块预览
+        splitter = None if self.structure_mode else HTMLBlockSplitter()
+        block_count = 0
+        last_block = ""
+        max_continuations = max(0, int(self.config.get("max_continuations", 3)))
+        params = self._generation_params(temperature)
+        call_messages = messages
+        at_boundary = False
+
+        async with self._upstream_slot():
+            for continuation in range(max_continuations + 1):
+                response = await self.router.open_stream(model, messages=call_messages, **params)
+                pass_chunks = []
+                finish_reason = None
+                # 续写从块边界开始时，模型可能先重复上一个块
+                skip_block = last_block if continuation and at_boundary else None
+
+                try:
+                    elapsed = time.time() - start_time
+                    yield self._create_event(
+                        "llm_receiving",
+                        message="LLM分析中..." if not continuation else "输出达到长度上限，继续生成...",
+                        chunks=chunk_count,
+                        elapsed=round(elapsed, 2),
+                        continuation=continuation
+                    )
+
+                    async for chunk in response:
+                        # 部分服务在最后一个chunk中返回用量
+                        self._record_usage(getattr(chunk, "usage", None))
+                        # 安全检查：确保 choices 不为空且有 content
+                        if not chunk.choices:
+                            continue
+                        choice = chunk.choices[0]
+                        if not choice:
+                            continue
+                        if getattr(choice, "finish_reason", None):
+                            finish_reason = choice.finish_reason
+                        if not choice.delta or choice.delta.content is None:
+                            continue
+
+                        pass_chunks.append(choice.delta.content)
+                        chunk_count += 1
+
+                        if splitter is not None:
+                            for block in splitter.feed(choice.delta.content):
+                                if skip_block is not None:
+                                    duplicate, skip_block = block == skip_block, None
+                                    if duplicate:
+                                        continue
+                                last_block = block
+                                yield self._create_event(
+                                    "html_delta",
+                                    html=HTMLPostProcessor.process_block(block),
+                                    index=block_count
+                                )
+                                block_count += 1
+
+                        if chunk_count % 5 == 0:
+                            elapsed = time.time() - start_time
+                            yield self._create_event(
+                                "llm_receiving",
+                                message="LLM分析中...",
+                                chunks=chunk_count,
+                                elapsed=round(elapsed, 2)
+                            )
+                finally:
+                    # 关闭到上游的HTTP流；取消时立即停止生成
+                    await response.close()
+
+                text = ''.join(pass_chunks)
+                if continuation:
+                    text = self._strip_continuation(content, text, at_boundary)
+                if finish_reason != "length" or not text.strip():
+                    content += text
+                    break
+                if continuation == max_continuations:
+                    logger.warning(f"LLM输出在 {max_continuations} 次续写后仍被截断")
+                    content += text
+                    break
+
+                kept, at_boundary = self._trim_to_block(content, text)
+                if at_boundary and splitter is not None:
+                    # 丢弃被截断的半个块，续写从块边界重新切分
+                    splitter = HTMLBlockSplitter()
+                content += kept
+                call_messages = self._continuation_messages(messages, content)
+                get_metrics().incr("llm_continuations")
+                logger.info(f"LLM输出达到长度上限，发起第 {continuation + 1} 次续写")
+
+        content = self._finalize_response(content)
 
         elapsed = time.time() - start_time
         yield self._create_event(
-            "llm_receiving",
-            message="LLM分析中...",
-            chunks=chunk_count,
-            elapsed=round(elapsed, 2)
+            "llm_done",
+            message="LLM分析完成",
+            elapsed=round(elapsed, 2),
+            provider=response.endpoint.name,
+            model=response.model
         )
 
-        for chunk in response:
-            # 安全检查：确保 choices 不为空且有 content
-            if not chunk.choices:
-                continue
-            choice = chunk.choices[0]
-            if not choice or not choice.delta:
-                continue
-            if choice.delta.content is None:
-                continue
-
-            content_chunks.append(choice.delta.content)
-            chunk_count += 1
-
-            if chunk_count % 5 == 0:
-                elapsed = time.time() - start_time
-                yield self._create_event(
-                    "llm_receiving",
-                    message="LLM分析中...",
-                    chunks=chunk_count,
-                    elapsed=round(elapsed, 2)
-                )
-
-        content = ''.join(content_chunks)
-        content = self._clean_html_response(content)
-
-        elapsed = time.time() - start_time
-        yield self._create_event("llm_done", message="LLM分析完成", elapsed=round(elapsed, 2))
-
         log_file = self._save_response(messages[1]["content"], content)
 
         yield self._create_event(
@@ -274,19 +616,9 @@ class LLMService:
         model: str,
         temperature: float,
         start_time: float
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[Event, None]:
         """Handle non-streaming LLM response"""
-        response = self.client.chat.completions.create(
-            model=model,
-            temperature=temperature,
-            messages=messages,
-        )
-
-        content = response.choices[0].message.content
-        if content is None:
-            raise ValueError("LLM返回内容为空")
-
-        content = self._clean_html_response(content)
+        content = await self._complete(messages, model, temperature)
         log_file = self._save_response(messages[1]["content"], content)
 
         elapsed = time.time() - start_time
@@ -303,10 +635,93 @@ class LLMService:
         event_type: str,
         message: str = "",
         **kwargs
-    ) -> str:
-        """Create SSE event data"""
-        data = {"type": event_type, "message": message, **kwargs}
-        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    ) -> Event:
+        """Create a typed pipeline event"""
+        return Event(event_type, message, **kwargs)
+
+    async def _complete(self, messages: list, model: str, temperature: float) -> str:
+        """Run a non-streaming completion on the async client, continuing truncated output, and return cleaned HTML"""
+        content = ""
+        max_continuations = max(0, int(self.config.get("max_continuations", 3)))
+        params = self._generation_params(temperature)
+        call_messages = messages
+        at_boundary = False
+
+        async with self._upstream_slot():
+            for continuation in range(max_continuations + 1):
+                response = await self.router.complete(model, messages=call_messages, **params)
+                self._record_usage(getattr(response, "usage", None))
+
+                choice = response.choices[0]
+                text = choice.message.content
+                if text is None:
+                    if not continuation:
+                        raise ValueError("LLM返回内容为空")
+                    break
+                if continuation:
+                    text = self._strip_continuation(content, text, at_boundary)
+                if getattr(choice, "finish_reason", None) != "length" or not text.strip():
+                    content += text
+                    break
+                if continuation == max_continuations:
+                    logger.warning(f"LLM输出在 {max_continuations} 次续写后仍被截断")
+                    content += text
+                    break
+
+                kept, at_boundary = self._trim_to_block(content, text)
+                content += kept
+                call_messages = self._continuation_messages(messages, content)
+                get_metrics().incr("llm_continuations")
+                logger.info(f"LLM输出达到长度上限，发起第 {continuation + 1} 次续写")
+
+        return self._finalize_response(content)
+
+    async def format_fragment(self, text: str, rules: str, model: Optional[str] = None) -> str:
+        """
+        Format a partial document and return its block-level HTML (no document shell).
+        Callers pass the model routed for the whole document; otherwise the fragment is routed on its own.
+        """
+        if openai is None:
+            raise RuntimeError("OpenAI client not available")
+
+        messages = self._build_messages(text, rules, fragment=True)
+        return await self._complete(
+            messages,
+            model or self._select_model(False, text, rules),
+            self.config.get("temperature", 0.3)
+        )
+
+    async def analyze_async(self, text: str, rules: str) -> Dict[str, Any]:
+        """
+        Non-streaming analysis on the async client, safe to await from request handlers.
+
+        Returns:
+            Dict with success status, html content, and log file path (same shape as analyze_sync)
+        """
+        if openai is None:
+            return {"success": False, "error": "OpenAI client not available"}
+
+        try:
+            messages = self._build_messages(text, rules)
+            content = await self._complete(
+                messages,
+                self._select_model(False, text, rules),
+                self.config.get("temperature", 0.3)
+            )
+            log_file = self._save_response(text, content)
+
+            return {
+                "success": True,
+                "html": content,
+                "log_file": log_file
+            }
+
+        except Exception as e:
+            logger.exception("Async LLM analysis failed")
+            return {
+                "success": False,
+                "error": str(e)
+            }
 
     def analyze_sync(self, text: str, rules: str) -> Dict[str, Any]:
         """
@@ -316,26 +731,23 @@ class LLMService:
             Dict with success status, html content, and log file path
         """
         try:
-            system_content = self._get_system_content(rules)
-            model = self.config.get("non_stream_model")
+            model = self._select_model(False, text, rules)
             temperature = self.config.get("temperature", 0.3)
-
-            messages = [
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": f"请对以下文本进行排版：\n\n{text}"}
-            ]
+            messages = self._build_messages(text, rules)
 
             response = self.client.chat.completions.create(
                 model=model,
-                temperature=temperature,
                 messages=messages,
+                **self._generation_params(temperature)
             )
 
             content = response.choices[0].message.content
             if content is None:
                 raise ValueError("LLM返回内容为空")
+            if response.choices[0].finish_reason == "length":
+                logger.warning("LLM输出达到 max_tokens 上限被截断（同步调用不续写）")
 
-            content = self._clean_html_response(content)
+            content = self._finalize_response(content)
             log_file = self._save_response(text, content)
 
             return {
@@ -0,0 +1,36 @@
+"""
+Metrics - 进程内计数器（取消、合并、断开连接等），通过 /metrics 暴露。
+"""
+import threading
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    """Thread-safe in-process counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = defaultdict(int)
+
+    def incr(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Copy of all counters"""
+        with self._lock:
+            return dict(self._counters)
+
+
+# Global metrics instance
+metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Get the global metrics instance"""
+    return metrics
@@ -0,0 +1,112 @@
+"""
+Result Store - 服务端保存排版完成的文档，按内容哈希寻址、带TTL过期，
+客户端通过 download_url 直接下载，无需把HTML再上传一次。
+"""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.settings import get_download_config
+from core.html_service import prepare_for_word_download
+
+# 下载时每次写出的字节数
+CHUNK_SIZE = 64 * 1024
+
+
+class ResultStore:
+    """Bounded, TTL-expiring store of Word-prepared documents keyed by content hash"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or get_download_config().model_dump()
+        self.ttl_seconds = int(self.config.get("ttl_seconds", 3600))
+        self.max_bytes = int(self.config.get("max_bytes", 128 * 1024 * 1024))
+
+        self._lock = threading.Lock()
+        # result_id -> (Word bytes, expires_at)；按插入/访问顺序排列，最旧的先淘汰
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._bytes = 0
+
+    @staticmethod
+    def result_id(html: str) -> str:
+        """Content hash used as the download id"""
+        return hashlib.sha256(html.encode("utf-8")).hexdigest()[:32]
+
+    def put(self, html: str) -> str:
+        """
+        Store a processed HTML document for download.
+
+        Returns:
+            The result id; storing the same document again only refreshes its TTL
+        """
+        result_id = self.result_id(html)
+        expires_at = time.time() + self.ttl_seconds
+
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is not None:
+                self._entries[result_id] = (entry[0], expires_at)
+                self._entries.move_to_end(result_id)
+                return result_id
+
+        self._store(result_id, prepare_for_word_download(html).encode("utf-8"), expires_at)
+        return result_id
+
+    def put_bytes(self, data: bytes) -> str:
+        """Store a ready-made download (e.g. a zip of documents) and return its id"""
+        result_id = hashlib.sha256(data).hexdigest()[:32]
+        self._store(result_id, data, time.time() + self.ttl_seconds)
+        return result_id
+
+    def _store(self, result_id: str, data: bytes, expires_at: float) -> None:
+        if len(data) > self.max_bytes:
+            raise ValueError("文档过大，无法保存下载结果")
+
+        with self._lock:
+            if result_id not in self._entries:
+                self._bytes += len(data)
+            else:
+                self._bytes += len(data) - len(self._entries[result_id][0])
+            self._entries[result_id] = (data, expires_at)
+            self._entries.move_to_end(result_id)
+            self._evict()
+
+    def get(self, result_id: str) -> Optional[bytes]:
+        """Word-prepared bytes for a result, or None when unknown or expired"""
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(result_id)
+            return entry[0] if entry is not None else None
+
+    def iter_chunks(self, result_id: str) -> Optional[Iterator[bytes]]:
+        """Chunked view over a stored result for streaming responses"""
+        data = self.get(result_id)
+        if data is None:
+            return None
+        view = memoryview(data)
+        return (bytes(view[i:i + CHUNK_SIZE]) for i in range(0, len(view), CHUNK_SIZE))
+
+    def _evict(self) -> None:
+        """Drop expired entries, then the oldest ones while over the byte budget (caller holds the lock)"""
+        # 每次写入/续期都移到末尾且TTL相同，因此顺序即过期顺序
+        now = time.time()
+        while self._entries:
+            result_id, (data, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now and self._bytes <= self.max_bytes:
+                break
+            del self._entries[result_id]
+            self._bytes -= len(data)
+
+
+# Global store instance
+result_store = ResultStore()
+
+
+def get_result_store() -> ResultStore:
+    """Get the global result store instance"""
+    return result_store
@@ -0,0 +1,152 @@
+"""
+Rule Compiler - 将常见的中文排版规则编译为样式表（字体、字号、对齐、缩进、行距）。
+规则中出现无法识别的内容时返回 None，由调用方回退到LLM。
+"""
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+# 中文字号 -> 磅值
+FONT_SIZES: Dict[str, float] = {
+    "初号": 42, "小初": 36,
+    "一号": 26, "小一": 24,
+    "二号": 22, "小二": 18,
+    "三号": 16, "小三": 15,
+    "四号": 14, "小四": 12,
+    "五号": 10.5, "小五": 9,
+    "六号": 7.5, "小六": 6.5,
+    "七号": 5.5, "八号": 5,
+}
+
+FONTS: List[str] = [
+    "方正小标宋简体", "方正小标宋", "仿宋_GB2312", "楷体_GB2312", "微软雅黑",
+    "宋体", "黑体", "楷体", "仿宋", "隶书", "幼圆",
+    "Times New Roman", "Arial", "Calibri",
+]
+
+# 规则主语 -> 样式表角色
+SUBJECTS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("一级标题", ("h1",)),
+    ("二级标题", ("h2",)),
+    ("三级标题", ("h3",)),
+    ("四级标题", ("h4",)),
+    ("大标题", ("h1",)),
+    ("小标题", ("h2", "h3", "h4")),
+    ("标题", ("h1",)),
+    ("正文", ("paragraph",)),
+    ("段落", ("paragraph",)),
+    ("表头", ("table_header",)),
+    ("表格", ("table_header", "table_cell")),
+    ("表", ("table_header", "table_cell")),
+    ("列表", ("list",)),
+]
+
+_ALIGNMENTS = {"居中": "center", "左对齐": "left", "居左": "left", "右对齐": "right", "居右": "right", "两端对齐": "justify"}
+
+_PREFIX_RE = re.compile(r'^\s*默认\s*[:：]?')
+_CLAUSE_SPLIT_RE = re.compile(r'[，,；;。\n]+')
+_FILLER_RE = re.compile(r'[\s、用为是采字体号和及/]+')
+_FONT_RE = re.compile("|".join(re.escape(font) for font in FONTS))
+_SIZE_RE = re.compile("|".join(re.escape(name) for name in sorted(FONT_SIZES, key=len, reverse=True)))
+_POINT_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(?:磅|pt|PT)')
+_ALIGN_RE = re.compile("|".join(_ALIGNMENTS))
+_INDENT_RE = re.compile(r'首行缩进(?:\s*(?:2|两|二)\s*(?:个)?\s*字符)?|(?:空两格|缩进两字符)')
+_LINE_HEIGHT_RE = re.compile(r'(\d+(?:\.\d+)?)\s*倍\s*行距|行距\s*(\d+(?:\.\d+)?)\s*倍|(单倍|双倍)\s*行距')
+_BOLD_RE = re.compile(r'加粗|粗体')
+_THREE_LINE_RE = re.compile(r'三线表')
+
+
+def _match_attribute(clause: str, pos: int) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """在 pos 位置匹配一个样式属性，返回 (结束位置, 属性)"""
+    match = _FONT_RE.match(clause, pos)
+    if match:
+        return match.end(), {"font": match.group(0)}
+    match = _SIZE_RE.match(clause, pos)
+    if match:
+        return match.end(), {"size": FONT_SIZES[match.group(0)]}
+    match = _POINT_RE.match(clause, pos)
+    if match:
+        return match.end(), {"size": float(match.group(1))}
+    match = _ALIGN_RE.match(clause, pos)
+    if match:
+        return match.end(), {"alignment": _ALIGNMENTS[match.group(0)]}
+    match = _INDENT_RE.match(clause, pos)
+    if match:
+        return match.end(), {"indent": True}
+    match = _LINE_HEIGHT_RE.match(clause, pos)
+    if match:
+        if match.group(3):
+            value = 1.0 if match.group(3) == "单倍" else 2.0
+        else:
+            value = float(match.group(1) or match.group(2))
+        return match.end(), {"line_height": value}
+    match = _BOLD_RE.match(clause, pos)
+    if match:
+        return match.end(), {"bold": True}
+    match = _THREE_LINE_RE.match(clause, pos)
+    if match:
+        return match.end(), {}
+    return None
+
+
+def _parse_clause(clause: str) -> Optional[Tuple[Optional[Tuple[str, ...]], Dict[str, Any]]]:
+    """解析一条子句，返回 (主语角色, 属性)；有无法识别的内容时返回 None"""
+    roles = None
+    pos = 0
+    for subject, subject_roles in SUBJECTS:
+        if clause.startswith(subject):
+            roles = subject_roles
+            pos = len(subject)
+            break
+
+    attributes: Dict[str, Any] = {}
+    while pos < len(clause):
+        filler = _FILLER_RE.match(clause, pos)
+        if filler:
+            pos = filler.end()
+            continue
+        matched = _match_attribute(clause, pos)
+        if matched is None:
+            return None
+        pos, attribute = matched
+        attributes.update(attribute)
+
+    return roles, attributes
+
+
+@lru_cache(maxsize=256)
+def _compile(rules: str) -> Optional[Tuple[Tuple[str, Tuple[Tuple[str, Any], ...]], ...]]:
+    styles: Dict[str, Dict[str, Any]] = {}
+    current_roles: Optional[Tuple[str, ...]] = None
+
+    for clause in _CLAUSE_SPLIT_RE.split(_PREFIX_RE.sub('', rules)):
+        clause = clause.strip()
+        if not clause:
+            continue
+        parsed = _parse_clause(clause)
+        if parsed is None:
+            return None
+        roles, attributes = parsed
+        if roles is not None:
+            current_roles = roles
+        if current_roles is None:
+            # 没有主语的规则（如单独的“1.5倍行距”）作用于正文
+            current_roles = ("paragraph", "list")
+        for role in current_roles:
+            styles.setdefault(role, {}).update(attributes)
+
+    return tuple((role, tuple(style.items())) for role, style in styles.items())
+
+
+def compile_rules(rules: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Compile a Chinese typesetting rule string into a style table.
+
+    Returns:
+        Style table keyed by role (h1-h4, paragraph, list, table_header, table_cell),
+        or None when the rules contain something the compiler cannot handle
+    """
+    compiled = _compile(rules.strip())
+    if compiled is None:
+        return None
+    return {role: dict(items) for role, items in compiled}
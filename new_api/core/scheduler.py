@@ -0,0 +1,190 @@
+"""
+Job Scheduler - LLM排版任务的准入控制：限制同时运行的任务数，等待队列有上限（满时立即拒绝），
+按估算的输入token做短作业优先，并在客户端之间轮转以保证公平。
+"""
+import math
+import time
+import asyncio
+import logging
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.settings import get_scheduler_config
+from core.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+
+
+class QueueFullError(Exception):
+    """Raised by JobScheduler.submit when the waiting queue is full"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("服务繁忙，请稍后重试")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A job's place in the scheduler, from submission until release"""
+
+    def __init__(self, scheduler: "JobScheduler", client: str, tokens: int, seq: int):
+        self.scheduler = scheduler
+        self.client = client
+        self.tokens = tokens
+        self.seq = seq
+        self.state = QUEUED
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        # 已被某个任务认领（合并请求时可能由别的请求完成，此票据需要取消）
+        self.claimed = False
+        self._changed = asyncio.Event()
+
+    async def wait(self) -> AsyncGenerator[Tuple[int, float], None]:
+        """
+        Wait for admission.
+
+        Yields:
+            (position, estimated wait in seconds) whenever the queue position changes
+        """
+        last = None
+        while self.state == QUEUED:
+            position = self.scheduler.position(self)
+            if position != last:
+                last = position
+                yield position, self.scheduler.estimated_wait(position)
+            self._changed.clear()
+            await self._changed.wait()
+
+    async def acquire(self) -> None:
+        """Wait for admission without progress updates"""
+        async for _ in self.wait():
+            pass
+
+    def release(self) -> None:
+        """Leave the queue or free the running slot (idempotent)"""
+        self.scheduler.release(self)
+
+
+class JobScheduler:
+    """Concurrency limit + bounded SJF queue with per-client fairness for LLM jobs"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or get_scheduler_config().model_dump()
+        self.max_running = max(1, int(self.config.get("max_running", 4)))
+        self.max_queue = max(0, int(self.config.get("max_queue", 32)))
+        self.aging_seconds = float(self.config.get("aging_seconds", 30.0))
+
+        self._waiting: List[Ticket] = []
+        self._running: Dict[str, int] = {}
+        self._running_total = 0
+        self._seq = 0
+        # 任务耗时的指数移动平均，用于估算等待时间
+        self._avg_seconds = 20.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiting)
+
+    @property
+    def running(self) -> int:
+        return self._running_total
+
+    def submit(self, client: str, tokens: int) -> Ticket:
+        """
+        Enqueue a job.
+
+        Raises:
+            QueueFullError: when no slot is free and the waiting queue is full
+        """
+        if self._running_total >= self.max_running and len(self._waiting) >= self.max_queue:
+            get_metrics().incr("scheduler_rejected")
+            raise QueueFullError(self.estimated_wait(len(self._waiting) + 1))
+
+        self._seq += 1
+        ticket = Ticket(self, client, tokens, self._seq)
+        self._waiting.append(ticket)
+        self._dispatch()
+        if ticket.state == QUEUED:
+            get_metrics().incr("scheduler_queued")
+        return ticket
+
+    def _ordered(self) -> List[Ticket]:
+        """
+        Waiting tickets in admission order.
+
+        Each client's jobs are ranked shortest-first (with aging); jobs are then interleaved
+        across clients by (client's running jobs + rank), so one client cannot fill the queue.
+        """
+        now = time.monotonic()
+
+        def effective_tokens(ticket: Ticket) -> float:
+            waited = now - ticket.submitted_at
+            return ticket.tokens / (1.0 + waited / self.aging_seconds) if self.aging_seconds > 0 else ticket.tokens
+
+        by_client: Dict[str, List[Tuple[float, Ticket]]] = {}
+        for ticket in self._waiting:
+            by_client.setdefault(ticket.client, []).append((effective_tokens(ticket), ticket))
+
+        keyed = []
+        for client, entries in by_client.items():
+            entries.sort(key=lambda entry: (entry[0], entry[1].seq))
+            base = self._running.get(client, 0)
+            for rank, (tokens, ticket) in enumerate(entries):
+                keyed.append(((base + rank, tokens, ticket.seq), ticket))
+        keyed.sort(key=lambda entry: entry[0])
+        return [ticket for _, ticket in keyed]
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based position among waiting jobs, 0 once admitted"""
+        if ticket.state != QUEUED:
+            return 0
+        return self._ordered().index(ticket) + 1
+
+    def estimated_wait(self, position: int) -> float:
+        """Seconds until a job at this queue position should start"""
+        if position <= 0:
+            return 0.0
+        return round(math.ceil(position / self.max_running) * self._avg_seconds, 1)
+
+    def _dispatch(self) -> None:
+        """Admit waiting jobs while slots are free, then wake the rest so they report new positions"""
+        while self._waiting and self._running_total < self.max_running:
+            ticket = self._ordered()[0]
+            self._waiting.remove(ticket)
+            ticket.state = RUNNING
+            ticket.started_at = time.monotonic()
+            self._running[ticket.client] = self._running.get(ticket.client, 0) + 1
+            self._running_total += 1
+            ticket._changed.set()
+        for ticket in self._waiting:
+            ticket._changed.set()
+
+    def release(self, ticket: Ticket) -> None:
+        if ticket.state == QUEUED:
+            self._waiting.remove(ticket)
+        elif ticket.state == RUNNING:
+            self._running[ticket.client] -= 1
+            if not self._running[ticket.client]:
+                del self._running[ticket.client]
+            self._running_total -= 1
+            duration = time.monotonic() - ticket.started_at
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * duration
+        else:
+            return
+        ticket.state = DONE
+        self._dispatch()
+
+
+# Global scheduler instance
+job_scheduler = JobScheduler()
+
+
+def get_job_scheduler() -> JobScheduler:
+    """Get the global job scheduler instance"""
+    return job_scheduler
@@ -0,0 +1,153 @@
+"""
+Segmented Formatting - 长文档分段并行排版。
+按标题和段落边界将长文本切分为受token预算限制的分段，在相同规则下并发排版，
+再按原顺序拼接为一个完整文档。
+"""
+import time
+import asyncio
+import logging
+from typing import AsyncGenerator, Any, Dict, List, Optional
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.events import Event
+from core.llm_service import LLMService, get_llm_service
+from core.html_service import HTMLPostProcessor
+from utils.text_utils import estimate_tokens, segment_text
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentedFormatter:
+    """Formats long documents as concurrently processed, order-preserving segments"""
+
+    def __init__(self, llm_service: Optional[LLMService] = None):
+        self.llm = llm_service or get_llm_service()
+
+    @property
+    def max_tokens(self) -> int:
+        """Estimated input token budget per segment"""
+        return int(self.llm.config.get("segment_max_tokens") or 0)
+
+    def should_segment(self, text: str) -> bool:
+        """Whether the text is long enough to be split into segments"""
+        return self.max_tokens > 0 and estimate_tokens(text) > self.max_tokens
+
+    async def _format_segment(self, index: int, segment: str, rules: str, model: str) -> tuple:
+        """Format one segment and return (index, body html)"""
+        html = await self.llm.format_fragment(segment, rules, model)
+        return index, HTMLPostProcessor.extract_body(html)
+
+    async def _run(self, segments: List[str], rules: str, model: str):
+        """
+        Format all segments concurrently, yielding (index, body html) as each one finishes.
+        Every segment uses the model routed for the whole document.
+        """
+        tasks = [
+            asyncio.ensure_future(self._format_segment(index, segment, rules, model))
+            for index, segment in enumerate(segments)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    def _stitch(bodies: List[str]) -> str:
+        """Reassemble segment bodies in order into one complete document"""
+        return HTMLPostProcessor.ensure_complete_html('\n'.join(bodies))
+
+    async def format(self, text: str, rules: str) -> Dict[str, Any]:
+        """
+        Format text as parallel segments.
+
+        Returns:
+            Dict with the stitched html document and the segment count
+        """
+        segments = segment_text(text, self.max_tokens)
+        model = self.llm._select_model(False, text, rules)
+        bodies: List[str] = [""] * len(segments)
+        async for index, body in self._run(segments, rules, model):
+            bodies[index] = body
+        return {"html": self._stitch(bodies), "segments": len(segments)}
+
+    async def analyze(self, text: str, rules: str) -> AsyncGenerator[Event, None]:
+        """
+        Segmented counterpart of LLMService.analyze.
+
+        Yields:
+            Typed progress events, ending with a complete event carrying the stitched HTML
+        """
+        start_time = time.time()
+        segments = segment_text(text, self.max_tokens)
+        model, route = self.llm.choose_model(text, rules, stream=False)
+        yield self.llm._create_event(
+            "start",
+            message=f"开始分段排版，共 {len(segments)} 段...",
+            segments=len(segments),
+            model=model,
+            route=route
+        )
+
+        bodies: List[Optional[str]] = [None] * len(segments)
+        done = 0
+        # 按顺序输出已完成的前缀分段，供客户端逐段预览
+        next_delta = 0
+        try:
+            async for index, body in self._run(segments, rules, model):
+                bodies[index] = body
+                done += 1
+                yield self._segment_event(done, len(segments), start_time)
+                while next_delta < len(bodies) and bodies[next_delta] is not None:
+                    yield self.llm._create_event(
+                        "html_delta",
+                        html=HTMLPostProcessor.process_block(bodies[next_delta]),
+                        index=next_delta
+                    )
+                    next_delta += 1
+        except Exception as e:
+            logger.exception("Segmented formatting failed")
+            yield self.llm._create_event("error", message=str(e))
+            return
+
+        elapsed = round(time.time() - start_time, 2)
+        yield self.llm._create_event("llm_done", message="LLM分析完成", elapsed=elapsed)
+        yield self.llm._create_event(
+            "complete",
+            message="分析完成",
+            html=self._stitch(bodies),
+            segments=len(segments),
+            elapsed=elapsed
+        )
+
+    def _segment_event(self, done: int, total: int, start_time: float) -> Event:
+        """Progress event after a segment finishes (reported as llm_receiving for existing clients)"""
+        return self.llm._create_event(
+            "llm_receiving",
+            message=f"LLM分析中... 已完成 {done}/{total} 段",
+            chunks=done,
+            segments=total,
+            elapsed=round(time.time() - start_time, 2)
+        )
+
+    async def analyze_async(self, text: str, rules: str) -> Dict[str, Any]:
+        """Segmented counterpart of LLMService.analyze_async"""
+        try:
+            result = await self.format(text, rules)
+            return {"success": True, **result}
+        except Exception as e:
+            logger.exception("Segmented formatting failed")
+            return {"success": False, "error": str(e)}
+
+
+# Global formatter instance
+segmented_formatter = SegmentedFormatter()
+
+
+def get_segmented_formatter() -> SegmentedFormatter:
+    """Get the global segmented formatter instance"""
+    return segmented_formatter
@@ -0,0 +1,151 @@
+"""
+Single Flight - 合并相同的进行中请求：同一个 key 同时只运行一次生成，
+其余调用方订阅同一份事件流（或等待同一个结果），避免重复消耗token。
+"""
+import asyncio
+import logging
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class _Failure:
+    """Exception raised by the shared producer, re-raised in every subscriber"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class _Flight:
+    """One shared generation: its replay log and the queues of attached subscribers"""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.queues: List[asyncio.Queue] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def publish(self, item: Any) -> None:
+        if item is not _DONE and not isinstance(item, _Failure):
+            self.items.append(item)
+        for queue in self.queues:
+            queue.put_nowait(item)
+
+
+class _Call:
+    """One shared awaitable call and the number of callers still waiting on it"""
+
+    def __init__(self, future: "asyncio.Future[Any]"):
+        self.future = future
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls keyed by a content hash"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._calls: Dict[str, _Call] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights or key in self._calls
+
+    async def stream(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[Any]]
+    ) -> AsyncGenerator[Any, None]:
+        """
+        Iterate the shared event stream for key, starting factory() if nothing is in flight.
+
+        Late subscribers first receive every event published so far, so all of them see the
+        same progress and completion events. The generation is cancelled once the last
+        subscriber detaches.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._produce(key, flight, factory()))
+        else:
+            get_metrics().incr("requests_coalesced")
+            logger.info(f"合并进行中的相同请求: {key[:12]} (订阅者 {len(flight.queues) + 1})")
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in flight.items:
+            queue.put_nowait(item)
+        flight.queues.append(queue)
+
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            flight.queues.remove(queue)
+            if not flight.queues and not flight.task.done():
+                # 最后一个订阅者离开：取消生成，释放上游容量
+                get_metrics().incr("generations_cancelled")
+                flight.task.cancel()
+
+    async def _produce(self, key: str, flight: _Flight, source: AsyncIterator[Any]) -> None:
+        try:
+            async for item in source:
+                flight.publish(item)
+            flight.publish(_DONE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            flight.publish(_Failure(e))
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await the shared result for key, starting factory() if nothing is in flight.
+        The call is cancelled once the last caller waiting on it is cancelled.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.future.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            get_metrics().incr("requests_coalesced")
+            logger.info(f"合并进行中的相同请求: {key[:12]} (等待者 {call.waiters + 1})")
+
+        call.waiters += 1
+        try:
+            # shield: 一个调用方被取消不影响其他等待者
+            return await asyncio.shield(call.future)
+        finally:
+            call.waiters -= 1
+            if not call.waiters and not call.future.done():
+                # 最后一个等待者离开：取消调用，释放上游容量；之后的相同请求重新开始
+                get_metrics().incr("generations_cancelled")
+                call.future.cancel()
+                self._forget(key, call)
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+# Global single-flight instance
+single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """Get the global single-flight instance"""
+    return single_flight
@@ -0,0 +1,198 @@
+"""
+Structure Renderer - 将LLM返回的结构化JSON（DocumentElement列表 + 样式表）
+在服务端展开为与Word兼容的内联样式HTML。
+"""
+import json
+import html
+import logging
+from typing import Any, Dict, List, Optional
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from pydantic import ValidationError
+
+from models.schemas import DocumentElement, ElementStyle, HTMLParseResult
+
+logger = logging.getLogger(__name__)
+
+
+class StructureRenderer:
+    """结构化结果渲染器"""
+
+    # 样式表缺省值，与 DEFAULT_SYSTEM_PROMPT 中的样式示例保持一致
+    DEFAULT_STYLES: Dict[str, Dict[str, Any]] = {
+        "h1": {"font": "黑体", "size": 22, "bold": True, "alignment": "center"},
+        "h2": {"font": "黑体", "size": 14, "bold": True},
+        "h3": {"font": "黑体", "size": 14, "bold": True},
+        "h4": {"font": "黑体", "size": 12, "bold": True},
+        "paragraph": {"font": "宋体", "size": 12, "indent": True, "line_height": 1.5},
+        "list": {"font": "宋体", "size": 12, "line_height": 1.5},
+        "table_header": {"font": "黑体", "size": 12, "bold": True},
+        "table_cell": {"font": "宋体", "size": 12},
+        "authors": {"font": "宋体", "size": 12, "alignment": "center"},
+    }
+
+    TABLE_STYLE = (
+        "border-collapse: collapse; width: 100%; "
+        "border-top: 2px solid black; border-bottom: 2px solid black;"
+    )
+
+    @staticmethod
+    def parse(content: str) -> HTMLParseResult:
+        """解析LLM返回的JSON（允许前后有多余文本）"""
+        start = content.find("{")
+        end = content.rfind("}")
+        if start == -1 or end <= start:
+            raise ValueError("LLM返回的结构化结果中没有JSON对象")
+        try:
+            data = json.loads(content[start:end + 1])
+        except json.JSONDecodeError as e:
+            raise ValueError(f"LLM返回的结构化结果无法解析: {e}")
+        return HTMLParseResult(
+            title=data.get("title"),
+            elements=data.get("elements") or [],
+            styles=data.get("styles") or {},
+        )
+
+    @staticmethod
+    def _css(style: Dict[str, Any]) -> str:
+        """将样式表条目转换为内联CSS字符串"""
+        parts = []
+        if style.get("font"):
+            parts.append(f"font-family: {style['font']};")
+        if style.get("size"):
+            parts.append(f"font-size: {float(style['size']):g}pt;")
+        if style.get("bold"):
+            parts.append("font-weight: bold;")
+        if style.get("alignment"):
+            parts.append(f"text-align: {style['alignment']};")
+        if style.get("hanging_indent"):
+            parts.append("padding-left: 2em; text-indent: -2em;")
+        elif style.get("indent"):
+            parts.append("text-indent: 2em;")
+        if style.get("line_height"):
+            parts.append(f"line-height: {float(style['line_height']):g};")
+        return " ".join(parts)
+
+    @classmethod
+    def _resolve_style(
+        cls,
+        styles: Dict[str, Dict[str, Any]],
+        role: str,
+        element: Optional[DocumentElement] = None
+    ) -> str:
+        """合并缺省样式、样式表条目和元素自身的覆盖值"""
+        merged = dict(cls.DEFAULT_STYLES.get(role, cls.DEFAULT_STYLES["paragraph"]))
+        if element is not None and element.style and element.style in styles:
+            role = element.style
+        merged.update({k: v for k, v in styles.get(role, {}).items() if v is not None})
+        if element is not None:
+            overrides = {
+                "font": element.font,
+                "size": element.size,
+                "alignment": element.alignment,
+            }
+            merged.update({k: v for k, v in overrides.items() if v is not None})
+            if element.bold:
+                merged["bold"] = True
+            if element.indent:
+                merged["indent"] = True
+            if element.hanging_indent:
+                merged["hanging_indent"] = True
+        return cls._css(merged)
+
+    @staticmethod
+    def _text(value: Optional[str]) -> str:
+        return html.escape(value or "", quote=False)
+
+    @classmethod
+    def render_element(cls, element: DocumentElement, styles: Dict[str, Dict[str, Any]]) -> str:
+        """渲染单个元素为HTML块"""
+        text = cls._text(element.text)
+
+        if element.type == "heading":
+            level = element.level or 1
+            style = cls._resolve_style(styles, f"h{level}", element)
+            return f'<h{level} style="{style}">{text}</h{level}>'
+
+        if element.type in ("list", "ordered_list"):
+            tag = "ol" if element.type == "ordered_list" else "ul"
+            style = cls._resolve_style(styles, "list", element)
+            items = "".join(f'<li style="{style}">{cls._text(item)}</li>' for item in element.items or [])
+            return f"<{tag}>{items}</{tag}>"
+
+        if element.type == "table":
+            header_style = cls._resolve_style(styles, "table_header")
+            cell_style = cls._resolve_style(styles, "table_cell")
+            rows = []
+            if element.headers:
+                cells = "".join(
+                    f'<th style="{header_style} border-bottom: 1px solid black;">{cls._text(h)}</th>'
+                    for h in element.headers
+                )
+                rows.append(f"<tr>{cells}</tr>")
+            for row in element.rows or []:
+                cells = "".join(f'<td style="{cell_style}">{cls._text(c)}</td>' for c in row)
+                rows.append(f"<tr>{cells}</tr>")
+            return f'<table style="{cls.TABLE_STYLE}">{"".join(rows)}</table>'
+
+        if element.type == "keywords":
+            style = cls._resolve_style(styles, "paragraph", element)
+            keywords = "；".join(cls._text(k) for k in element.keywords or [])
+            label = text or "关键词："
+            return f'<p style="{style}"><b>{label}</b>{keywords}</p>'
+
+        if element.type == "authors":
+            style = cls._resolve_style(styles, "authors", element)
+            return f'<p style="{style}">{"，".join(cls._text(a) for a in element.authors or [])}</p>'
+
+        style = cls._resolve_style(styles, "paragraph", element)
+        if element.speaker:
+            return f'<p style="{style}"><b>{cls._text(element.speaker)}：</b>{text}</p>'
+        return f'<p style="{style}">{text}</p>'
+
+    @staticmethod
+    def _fallback_elements(raw: Any) -> List[DocumentElement]:
+        """无法校验的元素按普通段落渲染，表格行、列表项等内容逐行展开，不丢弃原文"""
+        if not isinstance(raw, dict):
+            return [DocumentElement(type="paragraph", text=str(raw))]
+
+        def flatten(value: Any) -> str:
+            if isinstance(value, list):
+                return " | ".join(flatten(item) for item in value)
+            return "" if value is None else str(value)
+
+        lines = [flatten(raw.get("text"))]
+        for key in ("headers", "keywords", "authors"):
+            lines.append(flatten(raw.get(key)))
+        for key in ("rows", "items"):
+            value = raw.get(key)
+            lines.extend(flatten(item) for item in (value if isinstance(value, list) else [value]))
+        return [DocumentElement(type="paragraph", text=line) for line in lines if line.strip()]
+
+    @classmethod
+    def render(cls, result: HTMLParseResult) -> str:
+        """将解析结果渲染为HTML片段（不含<html>/<body>外壳，由后处理补全）"""
+        styles = {}
+        for role, raw in result.styles.items():
+            try:
+                styles[role] = ElementStyle(**raw).model_dump()
+            except (ValidationError, TypeError) as e:
+                logger.warning(f"忽略无效样式 {role}: {e}")
+
+        blocks: List[str] = []
+        for raw in result.elements:
+            try:
+                elements = [DocumentElement(**raw)]
+            except (ValidationError, TypeError) as e:
+                logger.warning(f"无效元素按段落处理: {e}")
+                elements = cls._fallback_elements(raw)
+            blocks.extend(cls.render_element(element, styles) for element in elements)
+        return "\n".join(blocks)
+
+
+def render_structure(content: str) -> str:
+    """解析并渲染LLM结构化输出的便捷函数"""
+    return StructureRenderer.render(StructureRenderer.parse(content))
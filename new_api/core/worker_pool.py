@@ -0,0 +1,79 @@
+"""
+Worker Pool - 将CPU密集型阶段（DOCX解析、文本解码、HTML后处理）移出事件循环线程。
+支持线程池或进程池，每个阶段有独立的超时时间。
+"""
+import asyncio
+import logging
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.settings import get_worker_config
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """Runs blocking stage functions on a shared executor and awaits them with per-stage timeouts"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or get_worker_config().model_dump()
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        """Lazy creation of the configured executor"""
+        if self._executor is None:
+            max_workers = max(1, int(self.config.get("max_workers", 4)))
+            if self.config.get("kind", "thread") == "process":
+                # 进程池要求任务函数及参数可 pickle（模块级函数 + bytes/str）
+                self._executor = ProcessPoolExecutor(max_workers=max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="worker")
+        return self._executor
+
+    @property
+    def uses_processes(self) -> bool:
+        """Whether tasks run in worker processes (arguments must then be picklable, e.g. bytes rather than files)"""
+        return self.config.get("kind", "thread") == "process"
+
+    def timeout_for(self, stage: str) -> Optional[float]:
+        """Timeout in seconds for a stage, None when unlimited"""
+        timeout = (self.config.get("timeouts") or {}).get(stage)
+        return float(timeout) if timeout else None
+
+    async def run(self, stage: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run func(*args, **kwargs) on the pool.
+
+        Raises:
+            TimeoutError: when the stage exceeds its configured timeout
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        timeout = self.timeout_for(stage)
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            # 线程/进程中的任务无法强制中断，只放弃等待其结果
+            logger.warning(f"Stage '{stage}' timed out after {timeout}s")
+            raise TimeoutError(f"{stage} 阶段处理超时（{timeout:g}秒）")
+
+    def shutdown(self) -> None:
+        """Shut down the executor without waiting for running tasks"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Global worker pool instance
+worker_pool = WorkerPool()
+
+
+def get_worker_pool() -> WorkerPool:
+    """Get the global worker pool instance"""
+    return worker_pool
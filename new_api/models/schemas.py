@@ -2,7 +2,7 @@
 Pydantic data models for API requests and responses.
 """
 from typing import Any, Dict, List, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 
 
 class FormatRequest(BaseModel):
@@ -12,6 +12,7 @@ class FormatRequest(BaseModel):
         default="默认：标题黑体二号居中，正文宋体小四首行缩进",
         description="Formatting rules"
     )
+    incremental: bool = Field(default=False, description="Only send paragraphs not formatted before to the LLM")
 
 
 class FormatResponse(BaseModel):
@@ -45,6 +46,17 @@ class HTMLParseResult(BaseModel):
     """Result model for HTML parsing"""
     title: Optional[str] = None
     elements: List[Dict[str, Any]] = Field(default_factory=list)
+    styles: Dict[str, Dict[str, Any]] = Field(default_factory=dict, description="Style table keyed by element role")
+
+
+class ElementStyle(BaseModel):
+    """Model for one style table entry (h1-h4, paragraph, list, table_header, table_cell...)"""
+    font: Optional[str] = None
+    size: Optional[float] = Field(default=None, description="Font size in pt")
+    bold: Optional[bool] = None
+    alignment: Optional[str] = Field(default=None, pattern="^(left|center|right|justify)$")
+    indent: Optional[bool] = None
+    line_height: Optional[float] = None
 
 
 class DocumentElement(BaseModel):
@@ -55,7 +67,7 @@ class DocumentElement(BaseModel):
     font: Optional[str] = None
     size: Optional[float] = None
     bold: bool = False
-    alignment: Optional[str] = Field(default=None, pattern="^(left|center|right)$")
+    alignment: Optional[str] = Field(default=None, pattern="^(left|center|right|justify)$")
     indent: bool = False
     hanging_indent: bool = False
     items: Optional[List[str]] = None
@@ -66,6 +78,31 @@ class DocumentElement(BaseModel):
     speaker: Optional[str] = None
     authors: Optional[List[str]] = None
 
+    @field_validator("text", "speaker", mode="before")
+    @classmethod
+    def _coerce_text(cls, value: Any) -> Any:
+        """LLM JSON often carries numbers where strings are expected"""
+        if isinstance(value, (int, float)):
+            return str(value)
+        return value
+
+    @field_validator("items", "headers", "keywords", "authors", mode="before")
+    @classmethod
+    def _coerce_strings(cls, value: Any) -> Any:
+        if isinstance(value, list):
+            return ["" if item is None else str(item) for item in value]
+        return value
+
+    @field_validator("rows", mode="before")
+    @classmethod
+    def _coerce_rows(cls, value: Any) -> Any:
+        if isinstance(value, list):
+            return [
+                ["" if cell is None else str(cell) for cell in row] if isinstance(row, list) else row
+                for row in value
+            ]
+        return value
+
 
 class FileUploadRequest(BaseModel):
     """Request model for file upload formatting"""
@@ -0,0 +1,41 @@
+"""
+Tests for text file encoding detection (utils.file_utils.detect_encoding).
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import codecs
+
+from utils.file_utils import decode_text, detect_encoding
+
+TEXT = "关于召开年度工作会议的通知\n各部门：经研究，定于下周一召开年度工作会议。"
+
+
+def test_bom_wins():
+    assert detect_encoding(codecs.BOM_UTF8 + TEXT.encode("utf-8")) == ("utf-8-sig", 1.0)
+    assert detect_encoding(TEXT.encode("utf-16")) == ("utf-16", 1.0)
+
+
+def test_utf8_and_ascii():
+    assert detect_encoding(b"plain ascii\n") == ("utf-8", 1.0)
+    assert detect_encoding(TEXT.encode("utf-8")) == ("utf-8", 0.99)
+
+
+def test_gbk_text():
+    encoding, confidence = detect_encoding(TEXT.encode("gbk"))
+    assert encoding == "gb18030"
+    assert confidence >= 0.9
+    assert decode_text(TEXT.encode("gbk"))[0] == TEXT
+
+
+def test_utf8_cut_mid_character_in_sample():
+    content = TEXT.encode("utf-8") * 10
+    # 采样恰好截断在多字节字符中间，不能因此判成GBK
+    assert detect_encoding(content, sample_size=len(TEXT.encode("utf-8")) + 1)[0] == "utf-8"
+
+
+def test_binary_falls_back_to_latin1_with_low_confidence():
+    encoding, confidence = detect_encoding(bytes([0x80, 0x81, 0xff, 0x00, 0x90]) * 20)
+    assert encoding == "latin-1"
+    assert confidence <= 0.5
@@ -0,0 +1,87 @@
+"""
+Tests for endpoint failover and model selection (core.llm_router.LLMRouter).
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from core.llm_router import Endpoint, LLMRouter
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def fake_client(error: Exception = None, delay: float = 0.0, calls: list = None):
+    """Minimal AsyncOpenAI stand-in whose create() returns the model it was called with"""
+
+    async def create(**kwargs):
+        if calls is not None:
+            calls.append(kwargs["model"])
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return SimpleNamespace(model=kwargs["model"])
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def make_router(*endpoints: Endpoint, **config) -> LLMRouter:
+    return LLMRouter(list(endpoints), {"hedge_enabled": False, "non_stream_model": "default-model", **config})
+
+
+def test_race_fails_over_to_the_next_endpoint():
+    bad = Endpoint("bad", lambda: fake_client(UpstreamError(503)), weight=1.0)
+    good = Endpoint("good", lambda: fake_client(), weight=0.0)
+    router = make_router(bad, good)
+
+    response = asyncio.run(router.complete("default-model", messages=[]))
+    assert response.model == "default-model"
+    assert bad.failures == 1
+    assert good.failures == 0
+
+
+def test_race_opens_breaker_after_repeated_failures():
+    bad = Endpoint("bad", lambda: fake_client(UpstreamError(503)), weight=1.0)
+    good = Endpoint("good", lambda: fake_client(), weight=0.0)
+    router = make_router(bad, good, breaker_failures=2, breaker_cooldown=60)
+
+    for _ in range(2):
+        asyncio.run(router.complete("default-model", messages=[]))
+    assert not bad.available
+    assert router.ranked() == [good]
+
+
+def test_race_does_not_fail_over_on_client_errors():
+    calls: list = []
+    bad = Endpoint("bad", lambda: fake_client(UpstreamError(400), calls=calls), weight=1.0)
+    good = Endpoint("good", lambda: fake_client(calls=calls), weight=0.0)
+    router = make_router(bad, good)
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(router.complete("default-model", messages=[]))
+    assert len(calls) == 1
+
+
+def test_race_raises_the_last_error_when_every_endpoint_fails():
+    endpoints = [Endpoint(name, lambda: fake_client(UpstreamError(502))) for name in ("a", "b")]
+    router = make_router(*endpoints)
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(router.complete("default-model", messages=[]))
+    assert [endpoint.failures for endpoint in endpoints] == [1, 1]
+
+
+def test_routed_model_wins_over_endpoint_model():
+    endpoint = Endpoint("renamed", lambda: fake_client(), non_stream_model="provider-default")
+    router = make_router(endpoint)
+
+    assert asyncio.run(router.complete("default-model", messages=[])).model == "provider-default"
+    assert asyncio.run(router.complete("routed-model", messages=[])).model == "routed-model"
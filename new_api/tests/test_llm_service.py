@@ -0,0 +1,35 @@
+"""
+Tests for stitching truncated output (core.llm_service.LLMService._strip_continuation).
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.llm_service import LLMService
+
+CONTENT = '<!DOCTYPE html>\n<html><body>\n<h1>通知</h1>\n<p>第一段。</p>\n'
+
+
+def test_strips_repeated_document_shell():
+    service = LLMService({"output_mode": "html"})
+    text = '```html\n<!DOCTYPE html>\n<html lang="zh"><head><meta charset="utf-8"></head><body>\n<p>第二段。</p>'
+    assert service._strip_continuation(CONTENT, text, at_boundary=False) == '<p>第二段。</p>'
+
+
+def test_strips_repeated_last_block_at_boundary():
+    service = LLMService({"output_mode": "html"})
+    text = '<p>第一段。</p>\n<p>第二段。</p>'
+    assert service._strip_continuation(CONTENT, text, at_boundary=True) == '\n<p>第二段。</p>'
+
+
+def test_keeps_first_block_when_not_repeated_or_mid_block():
+    service = LLMService({"output_mode": "html"})
+    text = '<p>第一段。</p>\n<p>第二段。</p>'
+    assert service._strip_continuation(CONTENT, text, at_boundary=False) == text
+    assert service._strip_continuation(CONTENT, '<p>第二段。</p>', at_boundary=True) == '<p>第二段。</p>'
+
+
+def test_structure_mode_is_untouched():
+    service = LLMService({"output_mode": "structure"})
+    text = '<html><body>{"elements": []}'
+    assert service._strip_continuation(CONTENT, text, at_boundary=True) == text
@@ -0,0 +1,79 @@
+"""
+Tests for LLM job admission (core.scheduler.JobScheduler).
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+
+from core.scheduler import DONE, QUEUED, RUNNING, JobScheduler, QueueFullError
+
+
+def make_scheduler(max_running: int = 1, max_queue: int = 8) -> JobScheduler:
+    # aging 0 关闭老化，排序只取决于token数和提交顺序
+    return JobScheduler({"max_running": max_running, "max_queue": max_queue, "aging_seconds": 0})
+
+
+def test_shortest_job_first_within_a_client():
+    scheduler = make_scheduler()
+    running = scheduler.submit("a", 100)
+    long_job = scheduler.submit("a", 5000)
+    short_job = scheduler.submit("a", 200)
+    assert running.state == RUNNING
+    assert (scheduler.position(short_job), scheduler.position(long_job)) == (1, 2)
+
+    running.release()
+    assert short_job.state == RUNNING
+    assert long_job.state == QUEUED
+
+
+def test_clients_are_interleaved():
+    scheduler = make_scheduler()
+    running = scheduler.submit("a", 100)
+    a_jobs = [scheduler.submit("a", 100) for _ in range(3)]
+    b_job = scheduler.submit("b", 9000)
+    # a已有运行中的任务，b的任务虽然更长也排在a的等待任务之前
+    assert scheduler.position(b_job) == 1
+    assert [scheduler.position(ticket) for ticket in a_jobs] == [2, 3, 4]
+
+    running.release()
+    # 两个客户端都没有运行中的任务时按短作业优先
+    assert a_jobs[0].state == RUNNING
+    assert scheduler.position(b_job) == 1
+
+
+def test_release_is_idempotent_and_frees_slots():
+    scheduler = make_scheduler(max_running=2)
+    first, second, third = (scheduler.submit("a", 10) for _ in range(3))
+    assert (scheduler.running, scheduler.queued) == (2, 1)
+
+    first.release()
+    first.release()
+    assert first.state == DONE
+    assert third.state == RUNNING
+    assert (scheduler.running, scheduler.queued) == (2, 0)
+
+    second.release()
+    third.release()
+    assert (scheduler.running, scheduler.queued) == (0, 0)
+
+
+def test_releasing_a_queued_ticket_leaves_the_queue():
+    scheduler = make_scheduler()
+    running = scheduler.submit("a", 10)
+    queued = scheduler.submit("a", 10)
+    queued.release()
+    assert queued.state == DONE
+    assert scheduler.queued == 0
+    running.release()
+    assert scheduler.running == 0
+
+
+def test_full_queue_rejects_with_retry_after():
+    scheduler = make_scheduler(max_running=1, max_queue=1)
+    scheduler.submit("a", 10)
+    scheduler.submit("a", 10)
+    with pytest.raises(QueueFullError) as error:
+        scheduler.submit("b", 10)
+    assert error.value.retry_after > 0
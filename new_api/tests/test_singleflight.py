@@ -0,0 +1,100 @@
+"""
+Tests for request coalescing (core.singleflight.SingleFlight).
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import asyncio
+
+from core.singleflight import SingleFlight
+
+
+def test_stream_shares_one_generation():
+    calls = []
+
+    async def events():
+        calls.append(1)
+        for index in range(3):
+            await asyncio.sleep(0)
+            yield index
+
+    async def collect(flight: SingleFlight):
+        return [item async for item in flight.stream("k", events)]
+
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(collect(flight), collect(flight))
+
+    assert asyncio.run(main()) == [[0, 1, 2], [0, 1, 2]]
+    assert len(calls) == 1
+
+
+def test_stream_cancelled_when_last_subscriber_leaves():
+    state = {"cancelled": False}
+
+    async def events():
+        try:
+            yield "start"
+            await asyncio.sleep(10)
+            yield "late"
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    async def subscribe(flight: SingleFlight, started: asyncio.Event):
+        async for _ in flight.stream("k", events):
+            started.set()
+
+    async def main():
+        flight = SingleFlight()
+        first_started, second_started = asyncio.Event(), asyncio.Event()
+        first = asyncio.ensure_future(subscribe(flight, first_started))
+        second = asyncio.ensure_future(subscribe(flight, second_started))
+        await first_started.wait()
+        await second_started.wait()
+
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.sleep(0)
+        still_running = flight.in_flight("k") and not state["cancelled"]
+
+        second.cancel()
+        await asyncio.gather(second, return_exceptions=True)
+        await asyncio.sleep(0)
+        return still_running, flight.in_flight("k")
+
+    still_running, in_flight = asyncio.run(main())
+    assert still_running
+    assert state["cancelled"]
+    assert not in_flight
+
+
+def test_do_cancelled_when_last_waiter_leaves():
+    state = {"cancelled": False}
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    async def main():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.do("k", work))
+        second = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0.01)
+
+        first.cancel()
+        await asyncio.sleep(0.01)
+        still_running = not state["cancelled"]
+
+        second.cancel()
+        await asyncio.sleep(0.01)
+        return still_running, flight.in_flight("k")
+
+    still_running, in_flight = asyncio.run(main())
+    assert still_running
+    assert state["cancelled"]
+    assert not in_flight
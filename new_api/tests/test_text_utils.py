@@ -0,0 +1,48 @@
+"""
+Tests for input normalization (utils.text_utils.normalize_text).
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.text_utils import normalize_line, normalize_text, split_text_blocks
+
+MINUTES = "\n".join([
+    "第一次董事会会议纪要",
+    "议题一：年度预算",
+    "□ 同意 □ 不同意 □ 弃权",
+    "参会人员签字：__________",
+    "1/2",
+    "议题二：人事任免",
+    "□ 同意 □ 不同意 □ 弃权",
+    "参会人员签字：__________",
+    "2/2",
+    "议题三：章程修订",
+    "□ 同意 □ 不同意 □ 弃权",
+    "参会人员签字：__________",
+    "3/3",
+])
+
+
+def test_repeated_body_lines_survive():
+    normalized, stats = normalize_text(MINUTES)
+    assert normalized.splitlines() == MINUTES.splitlines()
+    assert stats["boilerplate_lines"] == 0
+
+
+def test_cleanup_keeps_block_structure():
+    text = "﻿　　第一章　　总则\n\n\n本办法​适用于   全体员工。\t\n姓名 |  | 年龄\n张三 | 　 | 20\n"
+    normalized, stats = normalize_text(text)
+    assert normalized == "第一章 总则\n本办法适用于 全体员工。\n姓名 |  | 年龄\n张三 |  | 20"
+    assert split_text_blocks(normalized) == [
+        normalize_line(block) if "\n" not in block else "\n".join(map(normalize_line, block.split("\n")))
+        for block in split_text_blocks(text)
+    ]
+    assert stats["tokens_saved"] > 0
+
+
+def test_dedupe_when_enabled():
+    text = "公司内部资料 严禁外传\n正文一\n第 1 页\n公司内部资料 严禁外传\n正文二\n第 2 页\n公司内部资料 严禁外传\n正文三\n第 3 页"
+    normalized, stats = normalize_text(text, dedupe_min_repeats=3)
+    assert normalized.splitlines() == ["公司内部资料 严禁外传", "正文一", "正文二", "正文三"]
+    assert stats["boilerplate_lines"] == 5
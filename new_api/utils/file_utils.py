@@ -1,105 +1,372 @@
 """
 Utility functions for file operations.
 """
+import io
 import os
-import tempfile
+import re
+import codecs
 import logging
-from docx import Document
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Set, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
 
-def extract_text_from_docx(file_path: str) -> str:
-    """Extract text from a Word document, including paragraphs and tables"""
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+ZIP_MAGIC = b'PK\x03\x04'
+# Word 97-2003 (.doc) 等OLE复合文档
+OLE_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+# 常见的非文本格式，按文本解码只会得到乱码
+_BINARY_MAGICS = (
+    (b'%PDF', 'PDF'),
+    (b'\x89PNG', 'PNG'),
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'GIF8', 'GIF'),
+    (b'Rar!', 'RAR'),
+    (b'7z\xbc\xaf', '7z'),
+    (b'\x1f\x8b', 'gzip'),
+)
+# 批量排版时从zip压缩包中取出的文件类型
+BATCH_MEMBER_EXTENSIONS = frozenset({'docx', 'doc', 'txt', 'md'})
+# 编码检测只看文件开头的这一段
+ENCODING_SAMPLE_BYTES = 64 * 1024
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+# GBK双字节字符（首字节 0x81-0xFE），分组捕获其中常用的GB2312符号（A1-A9区）和汉字（B0-F7区）
+_GBK_PAIR_RE = re.compile(rb'([\xa1-\xa9\xb0-\xf7][\xa1-\xfe])|[\x81-\xfe][\x40-\xfe]')
+_ASCII_BYTES = bytes(range(0x80))
+_HEADING_NAME_RE = re.compile(r'^(?:heading|标题)\s*(\d)$', re.IGNORECASE)
+
+
+def _read_style_hints(docx: zipfile.ZipFile) -> Tuple[Dict[str, int], Set[str]]:
+    """
+    Read word/styles.xml once and return (styleId -> heading level, styleIds of list styles).
+    Title counts as heading level 1.
+    """
+    levels: Dict[str, int] = {}
+    list_styles: Set[str] = set()
     try:
-        doc = Document(file_path)
-        text_parts = []
-
-        # Extract paragraph text
-        for para in doc.paragraphs:
-            if para.text.strip():
-                text_parts.append(para.text)
-
-        # Extract table text
-        for table in doc.tables:
-            for row in table.rows:
-                row_text = []
-                for cell in row.cells:
-                    cell_text = cell.text.strip()
+        styles_file = docx.open('word/styles.xml')
+    except KeyError:
+        return levels, list_styles
+
+    with styles_file:
+        for _, elem in ET.iterparse(styles_file, events=('end',)):
+            if elem.tag != f'{W_NS}style':
+                continue
+            style_id = elem.get(f'{W_NS}styleId')
+            name_elem = elem.find(f'{W_NS}name')
+            name = name_elem.get(f'{W_NS}val', '') if name_elem is not None else ''
+            outline = elem.find(f'{W_NS}pPr/{W_NS}outlineLvl')
+            match = _HEADING_NAME_RE.match(name.strip())
+            if match:
+                levels[style_id] = int(match.group(1))
+            elif name.strip().lower() in ('title', '标题'):
+                levels[style_id] = 1
+            elif outline is not None and outline.get(f'{W_NS}val', '').isdigit():
+                level = int(outline.get(f'{W_NS}val'))
+                if level < 9:
+                    levels[style_id] = level + 1
+            if elem.find(f'{W_NS}pPr/{W_NS}numPr') is not None or name.lower().startswith('list'):
+                list_styles.add(style_id)
+            elem.clear()
+    return levels, list_styles
+
+
+def iter_docx_blocks(source: Union[str, bytes, BinaryIO]) -> Iterator[Dict[str, Any]]:
+    """
+    Walk the word/document.xml body once, in document order, with a streaming parser.
+
+    Yields one dict per non-empty body paragraph or table row:
+    {"type": "paragraph" | "table_row", "text": ..., "heading_level": int | None, "list": bool}
+    Table rows carry their non-empty cells joined with ' | ' (merged cells appear once).
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    with zipfile.ZipFile(source) as docx:
+        heading_styles, list_styles = _read_style_hints(docx)
+
+        with docx.open('word/document.xml') as document:
+            body = None
+            table_depth = 0
+            # Paragraphs nested in text boxes are skipped, like python-docx's paragraph.text
+            paragraph_depth = 0
+            paragraph_parts: List[str] = []
+            cell_parts: List[str] = []
+            row_cells: List[str] = []
+            style_id = None
+            outline_level = None
+            is_list = False
+
+            for event, elem in ET.iterparse(document, events=('start', 'end')):
+                tag = elem.tag
+
+                if event == 'start':
+                    if tag == f'{W_NS}body':
+                        body = elem
+                    elif tag == f'{W_NS}tbl':
+                        table_depth += 1
+                    elif tag == f'{W_NS}p':
+                        paragraph_depth += 1
+                        if paragraph_depth == 1:
+                            paragraph_parts = []
+                            style_id = None
+                            outline_level = None
+                            is_list = False
+                    elif tag == f'{W_NS}tr' and table_depth == 1:
+                        row_cells = []
+                    elif tag == f'{W_NS}tc' and table_depth == 1:
+                        cell_parts = []
+                    continue
+
+                if paragraph_depth == 1:
+                    if tag == f'{W_NS}t':
+                        paragraph_parts.append(elem.text or '')
+                    elif tag == f'{W_NS}tab':
+                        paragraph_parts.append('\t')
+                    elif tag in (f'{W_NS}br', f'{W_NS}cr'):
+                        paragraph_parts.append('\n')
+                    elif tag == f'{W_NS}pStyle':
+                        style_id = elem.get(f'{W_NS}val')
+                    elif tag == f'{W_NS}outlineLvl':
+                        value = elem.get(f'{W_NS}val', '')
+                        # Level 9 means body text
+                        outline_level = int(value) + 1 if value.isdigit() and int(value) < 9 else None
+                    elif tag == f'{W_NS}numPr':
+                        is_list = True
+
+                if tag == f'{W_NS}p':
+                    paragraph_depth -= 1
+                    if paragraph_depth:
+                        continue
+                    text = ''.join(paragraph_parts)
+                    if table_depth:
+                        if text.strip():
+                            cell_parts.append(text.strip())
+                    elif text.strip():
+                        yield {
+                            "type": "paragraph",
+                            "text": text,
+                            "heading_level": outline_level or heading_styles.get(style_id),
+                            "list": is_list or style_id in list_styles,
+                        }
+                    if not table_depth and body is not None:
+                        # Top-level block consumed; drop it so memory stays flat
+                        body.clear()
+                elif tag == f'{W_NS}tc' and table_depth == 1:
+                    cell_text = ' '.join(cell_parts)
                     if cell_text:
-                        row_text.append(cell_text)
-                if row_text:
-                    text_parts.append(' | '.join(row_text))
-
-        if not text_parts:
-            raise ValueError("文档中未提取到任何文本内容")
-
-        return '\n'.join(text_parts)
-    except ValueError:
-        # Re-raise ValueError with original message
-        raise
-    except Exception as e:
+                        row_cells.append(cell_text)
+                elif tag == f'{W_NS}tr' and table_depth == 1:
+                    if row_cells:
+                        yield {
+                            "type": "table_row",
+                            "text": ' | '.join(row_cells),
+                            "heading_level": None,
+                            "list": False,
+                        }
+                    elem.clear()
+                elif tag == f'{W_NS}tbl':
+                    table_depth -= 1
+                    if not table_depth and body is not None:
+                        body.clear()
+
+
+def extract_blocks_from_docx(source: Union[str, bytes, BinaryIO]) -> List[Dict[str, Any]]:
+    """Extract document-ordered blocks with heading/list hints from a Word document path, bytes or buffer"""
+    try:
+        blocks = list(iter_docx_blocks(source))
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
         raise ValueError(f"Failed to extract text from DOCX: {e}")
 
+    if not blocks:
+        raise ValueError("文档中未提取到任何文本内容")
+
+    return blocks
+
+
+def blocks_to_text(blocks: List[Dict[str, Any]]) -> str:
+    """Join extracted blocks into the line-per-block text passed to the formatting pipeline"""
+    return '\n'.join(block["text"] for block in blocks)
+
+
+def extract_text_from_docx(file_path: str) -> str:
+    """Extract text from a Word document, including paragraphs and tables in document order"""
+    return blocks_to_text(extract_blocks_from_docx(file_path))
+
 
 def extract_text_from_docx_bytes(docx_bytes: bytes) -> str:
-    """Extract text from Word document bytes (for cloud deployment), including paragraphs and tables"""
-    tmp_path = None
+    """Extract text from Word document bytes (for cloud deployment), without a temporary file"""
+    return blocks_to_text(extract_blocks_from_docx(docx_bytes))
+
+
+def _is_valid(sample: bytes, encoding: str, complete: bool) -> bool:
+    """Whether the sample decodes cleanly; a character cut off at the end of a partial sample is fine"""
     try:
-        # Create a temporary file since python-docx needs a file path
-        with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as tmp:
-            tmp.write(docx_bytes)
-            tmp_path = tmp.name
-
-        doc = Document(tmp_path)
-        text_parts = []
-
-        # Extract paragraph text
-        for para in doc.paragraphs:
-            if para.text.strip():
-                text_parts.append(para.text)
-
-        # Extract table text
-        for table in doc.tables:
-            for row in table.rows:
-                row_text = []
-                for cell in row.cells:
-                    cell_text = cell.text.strip()
-                    if cell_text:
-                        row_text.append(cell_text)
-                if row_text:
-                    text_parts.append(' | '.join(row_text))
-
-        if not text_parts:
-            raise ValueError("文档中未提取到任何文本内容")
-
-        return '\n'.join(text_parts)
-    except ValueError:
-        # Re-raise ValueError with original message
-        raise
-    except Exception as e:
-        raise ValueError(f"Failed to extract text from DOCX: {e}")
-    finally:
-        # Clean up temp file
-        if tmp_path:
-            try:
-                os.remove(tmp_path)
-            except OSError:
-                pass
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=complete)
+        return True
+    except UnicodeDecodeError:
+        return False
 
 
-def decode_file_content(content: bytes, encodings=None) -> str:
-    """Decode file content with multiple encoding attempts"""
-    if encodings is None:
-        encodings = ['utf-8', 'gbk', 'gb2312', 'gb18030', 'latin-1']
+def _gb_score(sample: bytes) -> float:
+    """
+    Share of the sample's non-ASCII bytes that form common GB2312 characters
+    (symbols and punctuation in rows A1-A9, hanzi in rows B0-F7)
+    """
+    high = len(sample.translate(None, _ASCII_BYTES))
+    if not high:
+        return 0.0
+    common = sum(1 for pair in _GBK_PAIR_RE.findall(sample) if pair)
+    return min(1.0, 2 * common / high)
 
-    for encoding in encodings:
-        try:
-            return content.decode(encoding)
-        except (UnicodeDecodeError, UnicodeError):
+
+def detect_encoding(content: bytes, sample_size: int = ENCODING_SAMPLE_BYTES) -> Tuple[str, float]:
+    """
+    Pick the codec for a text file from a prefix sample: BOM, then UTF-8 validity,
+    then how much of the non-ASCII text looks like GB2312 characters.
+
+    Returns:
+        Tuple of (encoding, confidence between 0 and 1)
+    """
+    sample = content[:sample_size]
+    complete = len(content) <= sample_size
+
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding, 1.0
+
+    if sample.isascii():
+        return 'utf-8', 1.0
+    # 多字节UTF-8序列结构严格，GBK文本几乎不可能恰好全部合法
+    if _is_valid(sample, 'utf-8', complete):
+        return 'utf-8', 0.99
+
+    # gb18030 兼容 GBK/GB2312
+    score = _gb_score(sample)
+    if score >= 0.5:
+        valid = _is_valid(sample, 'gb18030', complete)
+        return 'gb18030', round(score if valid else score * 0.8, 2)
+
+    # 既不像UTF-8也不像中文编码：latin-1 总能解码，仅作兜底
+    return 'latin-1', round(max(0.1, 0.5 - score), 2)
+
+
+def decode_text(content: bytes) -> Tuple[str, str, float]:
+    """
+    Decode a text file in a single pass with the detected codec.
+
+    Returns:
+        Tuple of (text, encoding, confidence)
+    """
+    encoding, confidence = detect_encoding(content)
+    text = content.decode(encoding, errors='replace')
+    if confidence < 0.5:
+        logger.warning(f"Low confidence encoding detection: {encoding} ({confidence})")
+    return text, encoding, confidence
+
+
+def decode_file_content(content: bytes) -> str:
+    """Decode file content with the detected encoding"""
+    return decode_text(content)[0]
+
+
+def detect_upload_kind(filename: str, head: bytes) -> str:
+    """
+    Identify an upload from its first bytes: "docx" for an OOXML (ZIP) package, "text" otherwise.
+
+    Raises:
+        ValueError: for empty files, legacy .doc, Word-named files that are not ZIP packages,
+            and binary formats that cannot be decoded as text
+    """
+    if not head:
+        raise ValueError(f"文件内容为空: {filename}")
+
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if head.startswith(ZIP_MAGIC):
+        return 'docx'
+    if head.startswith(OLE_MAGIC):
+        raise ValueError(f"暂不支持 Word 97-2003 (.doc) 格式，请另存为 .docx 后上传: {filename}")
+    if ext in ('docx', 'doc'):
+        raise ValueError(f"文件不是有效的Word文档: {filename}")
+    for magic, name in _BINARY_MAGICS:
+        if head.startswith(magic):
+            raise ValueError(f"不支持 {name} 文件，请上传 .docx 或文本文件: {filename}")
+    # 文本中不会出现NUL；UTF-16 文本带BOM
+    if b'\x00' in head and not head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        raise ValueError(f"文件不是文本或Word文档: {filename}")
+    return 'text'
+
+
+def _archive_member_name(info: zipfile.ZipInfo) -> str:
+    """Member name; names not flagged UTF-8 are usually GBK from Chinese Windows, not CP437"""
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode('gbk')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+
+def expand_uploads(
+    uploads: List[Tuple[str, BinaryIO]],
+    max_files: int,
+    max_bytes: int
+) -> List[Tuple[str, Callable[[], Union[bytes, BinaryIO]]]]:
+    """
+    Flatten uploaded files and .zip archives into (name, load) documents.
+
+    Uploads are seekable files (the spooled form parts); nothing is read up front.
+    load() returns the upload itself for plain files and the decompressed member
+    bytes for archive members, so each document is only loaded when it is extracted.
+
+    Archive members are limited to BATCH_MEMBER_EXTENSIONS; directories, hidden files
+    and Office lock files (~$...) are skipped. Sizes are checked against the archive
+    directory before anything is decompressed.
+
+    Raises:
+        ValueError: on an unreadable archive, or when the batch exceeds max_files / max_bytes
+    """
+    documents: List[Tuple[str, Callable[[], Union[bytes, BinaryIO]]]] = []
+    total = 0
+
+    def add(name: str, size: int, load: Callable[[], Union[bytes, BinaryIO]]) -> None:
+        nonlocal total
+        if len(documents) >= max_files:
+            raise ValueError(f"文件数量超过上限（{max_files} 个）")
+        total += size
+        if total > max_bytes:
+            raise ValueError(f"文件总大小超过上限（{max_bytes // (1024 * 1024)}MB）")
+        documents.append((name, load))
+
+    for filename, stream in uploads:
+        size = stream.seek(0, io.SEEK_END)
+        stream.seek(0)
+        if not filename.lower().endswith('.zip'):
+            add(filename, size, lambda stream=stream: stream)
             continue
 
-    return content.decode('utf-8', errors='ignore')
+        try:
+            # 压缩包随上传文件一起关闭，成员在提取时才解压
+            archive = zipfile.ZipFile(stream)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"无法读取压缩包 {filename}: {e}")
+        for info in archive.infolist():
+            name = _archive_member_name(info)
+            base = os.path.basename(name)
+            ext = base.rsplit('.', 1)[-1].lower() if '.' in base else ''
+            if info.is_dir() or name.startswith('__MACOSX/') or base.startswith(('.', '~$')):
+                continue
+            if ext not in BATCH_MEMBER_EXTENSIONS:
+                continue
+            add(name, info.file_size, lambda archive=archive, info=info: archive.read(info))
+
+    return documents
 
 
 def cleanup_temp_file(file_path: str) -> None:
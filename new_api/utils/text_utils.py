@@ -0,0 +1,171 @@
+"""
+Utility functions for text processing.
+"""
+import re
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+# extract_text_from_docx 用该分隔符拼接表格单元格
+TABLE_CELL_SEPARATOR = ' | '
+
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+# 规则条目的分隔：换行和中英文分号、句号
+_RULE_CLAUSE_RE = re.compile(r'[\n;；。]+')
+# 零宽字符、软连字符、方向控制符、BOM和其他控制字符（换行已在分行时处理）
+_INVISIBLE_RE = re.compile('[\x00-\x08\x0e-\x1f\x7f\u00ad\u200b-\u200f\u202a-\u202e\u2060-\u2064\ufeff]')
+# 空白串，包括制表符、不间断空格和全角空格
+_SPACE_RE = re.compile(r'\s+')
+# 句末标点：以此结尾的是正文句子，不会被当作页眉页脚去重
+_SENTENCE_END_RE = re.compile(r'[。，；！？,.;!?]$')
+# 只有页码的行：第3页 / 第3页 共10页 / - 3 - / 3/10 / Page 3 of 10
+_PAGE_NUMBER_RE = re.compile(
+    r'^(第\s*\d+\s*页([,，\s]*共\s*\d+\s*页)?|[-—]\s*\d+\s*[-—]|\d+\s*/\s*\d+|page\s*\d+(\s*of\s*\d+)?)$',
+    re.IGNORECASE
+)
+_HEADING_RE = re.compile(
+    r'^(第[一二三四五六七八九十百零\d]+[章节部分篇条]|[一二三四五六七八九十]+、|\d+(\.\d+)*[\s、.．]|（[一二三四五六七八九十]+）)'
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate: one token per CJK character, four characters per token otherwise"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def table_density(text: str) -> float:
+    """Share of non-empty lines that are table rows (cells joined with ' | ')"""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return 0.0
+    return sum(1 for line in lines if TABLE_CELL_SEPARATOR in line) / len(lines)
+
+
+def rule_clauses(rules: str) -> int:
+    """Number of separate clauses in the formatting rules, a proxy for rule complexity"""
+    return sum(1 for clause in _RULE_CLAUSE_RE.split(rules) if clause.strip())
+
+
+def split_text_blocks(text: str) -> List[str]:
+    """
+    Split extracted document text into formatting blocks.
+
+    Every non-empty line is one block, except that consecutive table rows
+    (lines joined with ' | ') are kept together as a single table block.
+    """
+    blocks: List[str] = []
+    table_rows: List[str] = []
+
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if TABLE_CELL_SEPARATOR in line:
+            table_rows.append(line)
+            continue
+        if table_rows:
+            blocks.append('\n'.join(table_rows))
+            table_rows = []
+        blocks.append(line)
+
+    if table_rows:
+        blocks.append('\n'.join(table_rows))
+
+    return blocks
+
+
+def looks_like_heading(block: str) -> bool:
+    """Heuristic: numbered section markers, or short lines without sentence punctuation"""
+    line = block.strip()
+    if not line or '\n' in line:
+        return False
+    if _HEADING_RE.match(line):
+        return len(line) <= 40
+    return len(line) <= 20 and not re.search(r'[。，；！？,.;!?]$', line)
+
+
+def segment_text(text: str, max_tokens: int) -> List[str]:
+    """
+    Split text into chunks of at most max_tokens (estimated) at block boundaries.
+
+    A chunk that is already over half the budget is closed before a heading so
+    sections stay together; a single block larger than the budget becomes its own chunk.
+    """
+    segments: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    for block in split_text_blocks(text):
+        tokens = estimate_tokens(block)
+        over_budget = current_tokens + tokens > max_tokens
+        heading_break = looks_like_heading(block) and current_tokens > max_tokens // 2
+        if current and (over_budget or heading_break):
+            segments.append('\n'.join(current))
+            current = []
+            current_tokens = 0
+        current.append(block)
+        current_tokens += tokens
+
+    if current:
+        segments.append('\n'.join(current))
+
+    return segments
+
+
+def normalize_line(line: str) -> str:
+    """
+    Strip invisible characters and collapse whitespace runs (full-width spaces included) in one line.
+    Table rows keep every cell, so columns stay aligned; a row with only empty cells becomes empty.
+    """
+    if TABLE_CELL_SEPARATOR in line:
+        cells = [normalize_line(cell) for cell in line.split(TABLE_CELL_SEPARATOR)]
+        return TABLE_CELL_SEPARATOR.join(cells) if any(cells) else ''
+    return _SPACE_RE.sub(' ', _INVISIBLE_RE.sub('', line)).strip()
+
+
+def normalize_text(
+    text: str,
+    dedupe_min_repeats: int = 0,
+    dedupe_min_chars: int = 6
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Token-saving cleanup before the LLM call. Every line is normalized with normalize_line
+    and blank lines are dropped, so split_text_blocks yields the same blocks as before.
+
+    Boilerplate removal is lossy and off by default (dedupe_min_repeats below 2): when enabled,
+    lines of at least dedupe_min_chars repeated verbatim dedupe_min_repeats times or more and
+    not ending like a sentence (page headers and footers of text pasted from paged documents)
+    keep only their first copy, and bare page numbers are dropped once there are that many.
+
+    Returns:
+        Tuple of (normalized text, stats with tokens_saved and boilerplate_lines)
+    """
+    lines = [line for line in map(normalize_line, text.splitlines()) if line]
+
+    removed = 0
+    if dedupe_min_repeats >= 2:
+        counts = Counter(lines)
+        page_numbers = sum(1 for line in lines if _PAGE_NUMBER_RE.match(line))
+        seen = set()
+        kept: List[str] = []
+        for line in lines:
+            if page_numbers >= dedupe_min_repeats and _PAGE_NUMBER_RE.match(line):
+                removed += 1
+                continue
+            boilerplate = (
+                counts[line] >= dedupe_min_repeats
+                and len(line) >= dedupe_min_chars
+                and TABLE_CELL_SEPARATOR not in line
+                and not _SENTENCE_END_RE.search(line)
+            )
+            if boilerplate and line in seen:
+                removed += 1
+                continue
+            seen.add(line)
+            kept.append(line)
+        lines = kept
+
+    normalized = '\n'.join(lines)
+    return normalized, {
+        "tokens_saved": estimate_tokens(text) - estimate_tokens(normalized),
+        "boilerplate_lines": removed,
+    }